@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import hashlib
 import os
 import torch as th
 from torch.nn import functional as F
@@ -31,6 +32,12 @@ import logging
 import inspect
 import yaml
 
+try:
+    import onnx  # noqa: F401  # Required by torch.onnx.export
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
 
 # Modified from api.py and apply.py in Demucs
 # Though the author of original code is me
@@ -166,6 +173,95 @@ class TensorChunk:
         return out
 
 
+class SegmentUploader:
+    """Copy segments to a CUDA device on a side stream, so the copy of the next segment overlaps with the
+    computation of the current one. Segments are staged in pinned memory to make the copy asynchronous."""
+
+    def __init__(self, device):
+        self.device = device
+        self.stream = th.cuda.Stream(device)
+        self.pending = {}
+
+    def prefetch(self, chunk, length):
+        if (chunk.offset, length) in self.pending:
+            return
+        host = chunk.padded(length)
+        if not host.is_pinned():
+            host = host.pin_memory()
+        with th.cuda.stream(self.stream):
+            self.pending[(chunk.offset, length)] = host.to(self.device, non_blocking=True)
+
+    def get(self, chunk, length):
+        self.prefetch(chunk, length)
+        tensor = self.pending.pop((chunk.offset, length))
+        current = th.cuda.current_stream(self.device)
+        current.wait_stream(self.stream)
+        tensor.record_stream(current)
+        return tensor
+
+
+class OnnxModel:
+    """Run the model with ONNX Runtime CPU provider. It can be used by `apply_model` in place of the PyTorch model.
+
+    The model is exported once for each input shape, as every segment is padded to the same length. Exports are
+    cached in `cache_dir` by hash of the model file."""
+
+    def __init__(self, model, model_file: Path, cache_dir: Path, threads: int = 0):
+        if onnxruntime is None:
+            raise ImportError("onnxruntime is not installed")
+        self.model = model
+        self.cache_dir = cache_dir
+        self.threads = threads
+        self.sessions = {}
+        self._sample_rate = model._sample_rate
+        hasher = hashlib.sha256()
+        with open(model_file, "rb") as f:
+            while buffer := f.read(1048576):
+                hasher.update(buffer)
+        self.digest = hasher.hexdigest()[:16]
+
+    def export(self, shape) -> Path:
+        path = self.cache_dir / ("%s-%s.onnx" % (self.digest, "x".join(str(i) for i in shape)))
+        if path.exists():
+            return path
+        logging.info("Exporting model to %s" % path)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        model = copy.deepcopy(self.model).to("cpu").eval()
+        with th.no_grad():
+            th.onnx.export(
+                model,
+                (th.zeros(shape),),
+                str(tmp_path),
+                input_names=["mix"],
+                output_names=["out"],
+                opset_version=17,
+                dynamo=False,
+            )
+        os.replace(tmp_path, path)
+        return path
+
+    def session(self, shape):
+        shape = tuple(shape)
+        if shape not in self.sessions:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            self.sessions[shape] = onnxruntime.InferenceSession(
+                str(self.export(shape)), options, providers=["CPUExecutionProvider"]
+            )
+        return self.sessions[shape]
+
+    def to(self, *_, **__):
+        return self
+
+    def eval(self):
+        return self
+
+    def __call__(self, mix: th.Tensor) -> th.Tensor:
+        out = self.session(mix.shape).run(None, {"mix": mix.detach().float().cpu().numpy()})[0]
+        return th.from_numpy(out)
+
+
 def tensor_chunk(tensor_or_chunk):
     if isinstance(tensor_or_chunk, TensorChunk):
         return tensor_or_chunk
@@ -208,6 +304,10 @@ def apply_model(
     lock=None,
     callback: Optional[Callable[[dict], None]] = None,
     callback_arg: Optional[dict] = None,
+    uploader: Optional[SegmentUploader] = None,
+    precision: Optional[th.dtype] = None,
+    static_shapes: bool = False,
+    pad_to: Optional[int] = None,
 ) -> th.Tensor:
     """
     Apply model to a given mixture.
@@ -228,6 +328,11 @@ def apply_model(
         num_workers (int): if non zero, device is 'cpu', how many threads to
             use in parallel.
         segment (float or None): override the model segment parameter.
+        precision (torch.dtype or None): if provided, run the model under autocast
+            with this dtype. Output is always float32.
+        static_shapes (bool): if True, the last segment is padded to the same length as
+            others, so that every segment has the same shape.
+        pad_to (int or None): pad the input of the model to at least this length.
     """
     if device is None:
         device = mix.device
@@ -251,6 +356,8 @@ def apply_model(
         "pool": pool,
         "segment": segment,
         "lock": lock,
+        "precision": precision,
+        "static_shapes": static_shapes,
     }
     out: Union[float, th.Tensor]
     res: Union[float, th.Tensor]
@@ -303,22 +410,36 @@ def apply_model(
         # If the overlap < 50%, this will translate to linear transition when
         # transition_power is 1.
         weight = (weight / weight.max()) ** transition_power
+        if device.type == "cuda" and mix.device.type == "cpu" and isinstance(pool, DummyPoolExecutor):
+            # Segments are computed one by one, so upload the next segment while computing the current one
+            uploader = SegmentUploader(device)
+        else:
+            uploader = None
+        pad_to = segment_length if static_shapes else None
         futures = []
+        chunks = []
         for offset in offsets:
             chunk = TensorChunk(mix, offset, segment_length)
+            chunks.append(chunk)
             future = pool.submit(
                 apply_model,
                 model,
                 chunk,
                 **kwargs,
                 callback_arg=callback_arg,
+                uploader=uploader,
+                pad_to=pad_to,
                 callback=(lambda d, i=offset: callback(_replace_dict(d, ("segment_offset", i))) if callback else None),
             )
             futures.append((future, offset))
             offset += segment_length
         if progress:
             futures = tqdm.tqdm(futures, unit_scale=scale, ncols=120, unit="seconds")
-        for future, offset in futures:
+        if uploader is not None and chunks:
+            uploader.prefetch(chunks[0], max(chunks[0].length, pad_to or 0))
+        for idx, (future, offset) in enumerate(futures):
+            if uploader is not None and idx + 1 < len(chunks):
+                uploader.prefetch(chunks[idx + 1], max(chunks[idx + 1].length, pad_to or 0))
             try:
                 chunk_out = future.result()  # type: th.Tensor
             except Exception:
@@ -334,12 +455,16 @@ def apply_model(
     else:
         mix = tensor_chunk(mix)
         assert isinstance(mix, TensorChunk)
-        padded_mix = mix.padded(length).to(device)
+        target_length = max(length, pad_to or 0)
+        if uploader is not None:
+            padded_mix = uploader.get(mix, target_length)
+        else:
+            padded_mix = mix.padded(target_length).to(device)
         with lock:
             if callback is not None:
                 callback(_replace_dict(callback_arg, ("state", "start")))  # type: ignore
-        with th.no_grad():
-            out = model(padded_mix)
+        with th.no_grad(), th.autocast(device.type, dtype=precision, enabled=precision is not None):
+            out = model(padded_mix).float()
         with lock:
             if callback is not None:
                 callback(_replace_dict(callback_arg, ("state", "end")))  # type: ignore
@@ -361,6 +486,8 @@ class Enhancer:
         progress: bool = False,
         callback: Optional[Callable[[dict], None]] = None,
         callback_arg: Optional[dict] = None,
+        precision: Optional[th.dtype] = None,
+        static_shapes: bool = False,
     ):
         """
         `class Enhancer`
@@ -394,6 +521,10 @@ class Enhancer:
         callback_arg: A dict containing private parameters to be passed to callback function. For \
             more information, please see the Callback section.
         progress: If true, show a progress bar.
+        precision: If provided, run the model under autocast with this dtype (e.g. `torch.float16`). \
+            `None` means float32.
+        static_shapes: If true, the last segment is padded to the same length as others, which is \
+            required by compiled and ONNX models.
 
         Callback
         --------
@@ -424,6 +555,8 @@ class Enhancer:
             progress=progress,
             callback=callback,
             callback_arg=callback_arg,
+            precision=precision,
+            static_shapes=static_shapes,
         )
 
     def update_parameter(
@@ -437,6 +570,8 @@ class Enhancer:
         progress: Union[bool, _NotProvided] = NotProvided,
         callback: Optional[Union[Callable[[dict], None], _NotProvided]] = NotProvided,
         callback_arg: Optional[Union[dict, _NotProvided]] = NotProvided,
+        precision: Optional[Union[th.dtype, _NotProvided]] = NotProvided,
+        static_shapes: Union[bool, _NotProvided] = NotProvided,
     ):
         """
         Update the parameters of separation.
@@ -467,6 +602,10 @@ class Enhancer:
         callback_arg: A dict containing private parameters to be passed to callback function. For \
             more information, please see the Callback section.
         progress: If true, show a progress bar.
+        precision: If provided, run the model under autocast with this dtype (e.g. `torch.float16`). \
+            `None` means float32.
+        static_shapes: If true, the last segment is padded to the same length as others, which is \
+            required by compiled and ONNX models.
 
         Callback
         --------
@@ -498,6 +637,10 @@ class Enhancer:
             self._jobs = jobs
         if not isinstance(progress, _NotProvided):
             self._progress = progress
+        if not isinstance(precision, _NotProvided):
+            self._precision = precision
+        if not isinstance(static_shapes, _NotProvided):
+            self._static_shapes = static_shapes
         if not isinstance(callback, _NotProvided):
             self._callback = callback
         if not isinstance(callback_arg, _NotProvided):
@@ -505,9 +648,10 @@ class Enhancer:
 
     def _load_model(self):
         if (self._repo / f"{self._name}.bin").exists():
-            conf = th.load(self._repo / f"{self._name}.bin", map_location="cpu")
+            self._model_file = self._repo / f"{self._name}.bin"
         elif (self._repo / f"{self._name}.ckpt").exists():
-            conf = th.load(self._repo / f"{self._name}.ckpt", map_location="cpu")
+            self._model_file = self._repo / f"{self._name}.ckpt"
+        conf = th.load(self._model_file, map_location="cpu")
         # If the model config is provided along with the model, read additional information
         if (self._repo / f"{self._name}.yml").exists():
             logging.info(f"Found model config file! Reading config from {self._repo / f'{self._name}.yml'}")
@@ -577,6 +721,8 @@ class Enhancer:
             callback=self._callback,
             callback_arg=_replace_dict(self._callback_arg, ("audio_length", wav.shape[1])),
             progress=self._progress,
+            precision=self._precision,
+            static_shapes=self._static_shapes,
         )
         if out is None:
             raise KeyboardInterrupt
@@ -598,6 +744,10 @@ class Enhancer:
     def model(self):
         return self._model
 
+    @property
+    def model_file(self):
+        return self._model_file
+
 
 def list_models(repo: Path) -> List[str]:
     """
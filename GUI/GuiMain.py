@@ -25,7 +25,7 @@ import shared
 
 if not shared.use_PyQt6:
     from PySide6 import QtGui
-    from PySide6.QtCore import Qt, QTimer, Signal
+    from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer, Signal
     from PySide6.QtWidgets import (
         QAbstractItemView,
         QApplication,
@@ -56,6 +56,7 @@ if not shared.use_PyQt6:
         QStatusBar,
         QStyleFactory,
         QTableWidget,
+        QTableView,
         QTableWidgetItem,
         QTabWidget,
         QVBoxLayout,
@@ -63,7 +64,7 @@ if not shared.use_PyQt6:
     )
 else:
     from PyQt6 import QtGui  # type: ignore
-    from PyQt6.QtCore import Qt, QTimer, pyqtSignal as Signal  # type: ignore
+    from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer, pyqtSignal as Signal  # type: ignore
     from PyQt6.QtWidgets import (  # type: ignore
         QAbstractItemView,
         QApplication,
@@ -94,26 +95,34 @@ else:
         QStatusBar,
         QStyleFactory,
         QTableWidget,
+        QTableView,
         QTableWidgetItem,
         QTabWidget,
         QVBoxLayout,
         QWidget,
     )
 
+import collections
+import concurrent.futures
 import datetime
+import duplicates
+import hashlib
+import heapq
 import json
 import logging
 import logging.handlers
 import math
+import metrics
+import multiprocessing
 import os
 import packaging.version
 import pathlib
 import platform
 import pprint
 import psutil
-import random
 import re
 import shlex
+import shutil
 import subprocess
 import sys
 import threading
@@ -122,7 +131,11 @@ import traceback
 import urllib.parse
 import webbrowser
 
+import performance
+import probe
+import remote
 import separator
+import worker
 from PySide6_modified import (
     Action,
     DelegateCombiner,
@@ -281,6 +294,7 @@ class MainWindow(QMainWindow):
         )
         self.menu_restart = Action("Restart", self, self.restart)
         self.menu_about_log = Action("Open log", self, self.open_log)
+        self.menu_performance = Action("Performance report", self, self.showPerformanceReport)
         self.menu_about.addActions(
             [
                 self.menu_about_about,
@@ -291,6 +305,7 @@ class MainWindow(QMainWindow):
                 self.menu_check_update,
                 self.menu_restart,
                 self.menu_about_log,
+                self.menu_performance,
             ]
         )
         if sys.platform == "win32" and (
@@ -333,6 +348,9 @@ class MainWindow(QMainWindow):
         self.setMenuBar(self.menubar)
 
         self.restarting = False
+        self.loaded_model = None  # (model_type, model, repo) of the model in self.separator
+        self.selected_model = None  # Model used for files added to the queue from now on
+        self.model_lock = threading.Lock()
         self._status_prefix = ""
         self._status_text = ""
 
@@ -350,6 +368,8 @@ class MainWindow(QMainWindow):
             self.ask_AOT(open_from_menu=False)
 
     def showParamSettingsFunc(self):
+        if hasattr(self, "param_settings"):
+            return
         self.param_settings = SepParamSettings()
         self.save_options = SaveOptions()
         self.mixer = Mixer()
@@ -361,6 +381,14 @@ class MainWindow(QMainWindow):
         self.tab_widget.addTab(self.file_queue, self.file_queue.widget_title % self.file_queue.queue_length)
         self.widget_layout.addWidget(self.separation_control)
 
+    def rebuildMixer(self):
+        """Recreate the mixer for the sources of the currently loaded model"""
+        index = self.tab_widget.indexOf(self.mixer)
+        self.tab_widget.removeTab(index)
+        self.mixer.deleteLater()
+        self.mixer = Mixer()
+        self.tab_widget.insertTab(index, self.mixer, self.mixer.widget_title)
+
     def updateQueueLength(self):
         self.tab_widget.setTabText(
             self.tab_widget.indexOf(self.file_queue), self.file_queue.widget_title % self.file_queue.queue_length
@@ -368,7 +396,11 @@ class MainWindow(QMainWindow):
 
     def loadModel(self, model_type, model, repo):
         try:
+            if hasattr(self, "separator"):
+                # Release device memory of the previous model before loading another one
+                self.separator.offloadModel()
             self.separator = self.model_class[model_type][0]
+            self.loaded_model = None
             self.separator.loadModel(model, repo)
         except separator.ModelSourceNameUnsupportedError as e:
             return e
@@ -384,8 +416,28 @@ class MainWindow(QMainWindow):
                 % (model, ('"' + str(repo) + '"') if repo is not None else "remote repo", traceback.format_exc())
             )
             return False
+        self.loaded_model = (model_type, model, repo)
         return True
 
+    def switchModel(self, model_type, model, repo):
+        """Load another model after the parameter tabs have been created.
+
+        Waits for pending saves to finish, as saving still uses the mixer and the sample rate of the previous model.
+        The mixer is rebuilt if the sources changed. Returns the same values as `loadModel`."""
+        with self.model_lock:
+            if self.loaded_model == (model_type, model, repo):
+                return True
+            with self.save_options.saving_changed:
+                self.save_options.saving_changed.wait_for(lambda: not self.save_options.saving)
+            old_sources = list(self.separator.sources) if self.loaded_model is not None else None
+            success = self.loadModel(model_type, model, repo)
+            if success is not True:
+                return success
+            if list(self.separator.sources) != old_sources:
+                self.exec_in_main(self.rebuildMixer)
+            self.exec_in_main(self.param_settings.updateModelLimits)
+            return True
+
     def closeEvent(self, event):
         if (
             self.restarting
@@ -408,6 +460,14 @@ class MainWindow(QMainWindow):
         else:
             event.ignore()
 
+    def showPerformanceReport(self):
+        if not hasattr(self, "performance_report"):
+            self.performance_report = PerformanceReport()
+        else:
+            self.performance_report.refresh()
+        self.performance_report.show()
+        self.performance_report.activateWindow()
+
     def printSettings(self):
         pprint.pprint(shared.settings, sort_dicts=False, stream=sys.stderr)
 
@@ -559,6 +619,8 @@ class MainWindow(QMainWindow):
                 == self.m.StandardButton.Yes
             )
         ):
+            shared.FlushHistory()
+            shared.FlushSettings()
             subprocess.Popen(sys.orig_argv)
             self.restarting = True
             self.close()
@@ -754,13 +816,27 @@ class ModelSelector(QWidget):
         model_type = self.model_type_combobox.currentText()
         model_name = self.models[main_window.exec_in_main(lambda: self.select_combobox.currentIndex())]
         model_repo = self.repos[main_window.exec_in_main(lambda: self.select_combobox.currentIndex())]
+
+        if hasattr(main_window, "param_settings"):
+            # Parameter tabs already exist, the model is selected for files added to the queue from now on
+            main_window.selected_model = (model_type, model_name, model_repo)
+            if not main_window.exec_in_main(main_window.separation_control.isIdle):
+                logging.info("Model %s selected, will be loaded when its files are separated" % model_name)
+                main_window.setStatusText.emit("Model %s will be used for newly added files" % model_name)
+                main_window.exec_in_main(lambda: self.setEnabled(True))
+                main_window.exec_in_main(lambda: self.advanced_settings.setEnabled(True))
+                return
+
         logging.info(
             "Loading model %s from repo %s" % (model_name, model_repo if model_repo is not None else '"remote"')
         )
         main_window.setStatusText.emit("Loading model %s" % model_name)
 
         start_time = time.perf_counter()
-        success = main_window.loadModel(model_type, model_name, model_repo)
+        if hasattr(main_window, "param_settings"):
+            success = main_window.switchModel(model_type, model_name, model_repo)
+        else:
+            success = main_window.loadModel(model_type, model_name, model_repo)
         end_time = time.perf_counter()
 
         match success:
@@ -781,7 +857,11 @@ class ModelSelector(QWidget):
         main_window.exec_in_main(lambda: main_window.model_selector.model_info.setText(model_info))
         main_window.exec_in_main(lambda: self.model_info.setMinimumHeight(self.model_info.heightForWidth(400)))
         main_window.setStatusText.emit("Model loaded within %.4fs" % (end_time - start_time))
-        main_window.showParamSettings.emit()
+        if not hasattr(main_window, "param_settings"):
+            main_window.selected_model = main_window.loaded_model
+            main_window.showParamSettings.emit()
+        main_window.exec_in_main(lambda: self.setEnabled(True))
+        main_window.exec_in_main(lambda: self.advanced_settings.setEnabled(True))
         logging.info("Model loaded within %.4fs" % (end_time - start_time))
         logging.info(model_info)
 
@@ -860,6 +940,68 @@ class AdvancedModelSettings(QDialog):
         self.hide()
 
 
+class PerformanceReport(QDialog):
+    groupings = {
+        "Model and device": ["model_type", "model", "device"],
+        "Model, device and segment": ["model_type", "model", "device", "segment"],
+        "Model, device and precision": ["model_type", "model", "device", "precision", "backend"],
+        "Device": ["device"],
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Performance report")
+        self.setWindowIcon(QtGui.QIcon("./icon/icon.ico"))
+        self.setMinimumSize(800, 300)
+
+        self.info = QLabel()
+        self.info.setText(
+            "Statistics of finished files. Realtime factor is total audio length divided by total separation time."
+        )
+        self.info.setWordWrap(True)
+
+        self.group_selector = QComboBox()
+        self.group_selector.addItems(list(self.groupings.keys()))
+        self.group_selector.currentTextChanged.connect(self.refresh)
+
+        self.refresh_button = QPushButton()
+        self.refresh_button.setText("Refresh")
+        self.refresh_button.clicked.connect(self.refresh)
+
+        self.table = QTableWidget()
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().hide()
+
+        self.control_layout = QHBoxLayout()
+        self.control_layout.addWidget(self.group_selector)
+        self.control_layout.addWidget(self.refresh_button)
+
+        self.dialog_layout = QVBoxLayout()
+        self.dialog_layout.addWidget(self.info)
+        self.dialog_layout.addLayout(self.control_layout)
+        self.dialog_layout.addWidget(self.table)
+        self.setLayout(self.dialog_layout)
+
+        self.refresh()
+
+    def refresh(self):
+        try:
+            rows = performance.report(self.groupings[self.group_selector.currentText()])
+        except Exception:
+            logging.error("Failed to read performance report:\n%s" % traceback.format_exc())
+            rows = []
+        self.table.clear()
+        self.table.setRowCount(len(rows))
+        self.table.setColumnCount(len(rows[0]) if rows else 0)
+        if not rows:
+            return
+        self.table.setHorizontalHeaderLabels([i.replace("_", " ").capitalize() for i in rows[0].keys()])
+        for i, row in enumerate(rows):
+            for j, (key, value) in enumerate(row.items()):
+                self.table.setItem(i, j, QTableWidgetItem(performance.formatValue(key, value)))
+        self.table.resizeColumnsToContents()
+
+
 class SepParamSettings(QWidget):
     widget_title = "Separation parameters"
 
@@ -879,6 +1021,45 @@ class SepParamSettings(QWidget):
         self.device_selector.setCurrentIndex(separator.default_device)
         self.device_selector.setMinimumWidth(200)
 
+        self.precision_label = QLabel()
+        self.precision_label.setText("Precision:")
+        self.precision_label.setToolTip(
+            "Numeric precision of the computation. fp16 and bf16 use autocast, which is faster and uses less memory "
+            "on devices supporting them, but results are less accurate. int8 quantizes linear and LSTM layers of the "
+            "model, which is only available on CPU"
+        )
+
+        self.precision_selector = QComboBox()
+        for precision in separator.precisions:
+            self.precision_selector.addItem(precision, userData=precision)
+        self.precision_selector.setCurrentText(shared.GetHistory("precision", default="fp32"))
+        self.precision_selector.currentTextChanged.connect(lambda x: shared.SetHistory("precision", value=x))
+
+        self.precision_check_button = QPushButton()
+        self.precision_check_button.setText("Check accuracy")
+        self.precision_check_button.setToolTip(
+            "Separate 10 seconds of the selected file in the queue with the loaded model using the selected device "
+            "and precision, and compare the result and speed with fp32"
+        )
+        self.precision_check_button.clicked.connect(self.checkPrecision)
+
+        self.backend_label = QLabel()
+        self.backend_label.setText("Backend:")
+        self.backend_label.setToolTip(
+            "Backend to run the model. ONNX Runtime is only available for Apollo models on CPU, and requires onnx and "
+            "onnxruntime to be installed. The model will be exported to ONNX the first time it is used"
+        )
+
+        self.backend_selector = QComboBox()
+        self.backend_selector.addItem("PyTorch", userData="torch")
+        self.backend_selector.addItem("ONNX Runtime", userData="onnx")
+        self.backend_selector.setCurrentIndex(
+            max(0, self.backend_selector.findData(shared.GetHistory("backend", default="torch")))
+        )
+        self.backend_selector.currentIndexChanged.connect(
+            lambda _: shared.SetHistory("backend", value=self.backend_selector.currentData())
+        )
+
         self.segment_label = QLabel()
         self.segment_label.setText("Segment:")
         self.segment_label.setToolTip("Length of each segment")
@@ -981,34 +1162,82 @@ class SepParamSettings(QWidget):
         self.separate_once_added.stateChanged.connect(lambda x: shared.SetHistory("separate_once_added", value=x))
         self.separate_once_added.setSizePolicy(QSizePolicy.Policy.MinimumExpanding, QSizePolicy.Policy.Fixed)
 
+        self.compile_model = QCheckBox()
+        self.compile_model.setText("Compile model")
+        self.compile_model.setToolTip(
+            "Compile the model with torch.compile for the segment length before separating. Compiling takes some "
+            "time on first use but makes long queues faster. Falls back to normal mode if compiling fails"
+        )
+        self.compile_model.setChecked(shared.GetHistory("compile_model", default=False))
+        self.compile_model.stateChanged.connect(lambda x: shared.SetHistory("compile_model", value=bool(x)))
+        self.compile_model.setSizePolicy(QSizePolicy.Policy.MinimumExpanding, QSizePolicy.Policy.Fixed)
+
+        self.separate_in_worker = QCheckBox()
+        self.separate_in_worker.setText("Separate in worker process")
+        self.separate_in_worker.setToolTip(
+            "Run Demucs models in a separate process for each device, so a crash or running out of memory only fails "
+            "the current file and the window stays responsive. The model is loaded again in the worker process"
+        )
+        self.separate_in_worker.setChecked(shared.GetHistory("separate_in_worker", default=False))
+        self.separate_in_worker.stateChanged.connect(self.separateInWorkerChanged)
+        self.separate_in_worker.setSizePolicy(QSizePolicy.Policy.MinimumExpanding, QSizePolicy.Policy.Fixed)
+
         self.check_layout = QHBoxLayout()
 
         self.widget_layout = QGridLayout()
         self.widget_layout.addWidget(self.device_label, 0, 0)
         self.widget_layout.addWidget(self.device_selector, 0, 1, 1, 2)
-        self.widget_layout.addWidget(self.segment_label, 1, 0)
-        self.widget_layout.addWidget(self.segment_spinbox, 1, 1)
-        self.widget_layout.addWidget(self.segment_slider, 1, 2)
-        self.widget_layout.addWidget(self.overlap_label, 2, 0)
-        self.widget_layout.addWidget(self.overlap_spinbox, 2, 1)
-        self.widget_layout.addWidget(self.overlap_slider, 2, 2)
-        self.widget_layout.addWidget(self.shifts_label, 3, 0)
-        self.widget_layout.addWidget(self.shifts_spinbox, 3, 1)
-        self.widget_layout.addWidget(self.shifts_slider, 3, 2)
-        self.widget_layout.addWidget(self.in_gain_label, 4, 0)
-        self.widget_layout.addWidget(self.in_gain_spinbox, 4, 1)
-        self.widget_layout.addWidget(self.in_gain_slider, 4, 2)
-        self.widget_layout.addWidget(self.out_gain_label, 5, 0)
-        self.widget_layout.addWidget(self.out_gain_spinbox, 5, 1)
-        self.widget_layout.addWidget(self.out_gain_slider, 5, 2)
+        self.widget_layout.addWidget(self.precision_label, 1, 0)
+        self.widget_layout.addWidget(self.precision_selector, 1, 1)
+        self.widget_layout.addWidget(self.precision_check_button, 1, 2)
+        self.widget_layout.addWidget(self.backend_label, 2, 0)
+        self.widget_layout.addWidget(self.backend_selector, 2, 1, 1, 2)
+        self.widget_layout.addWidget(self.segment_label, 3, 0)
+        self.widget_layout.addWidget(self.segment_spinbox, 3, 1)
+        self.widget_layout.addWidget(self.segment_slider, 3, 2)
+        self.widget_layout.addWidget(self.overlap_label, 4, 0)
+        self.widget_layout.addWidget(self.overlap_spinbox, 4, 1)
+        self.widget_layout.addWidget(self.overlap_slider, 4, 2)
+        self.widget_layout.addWidget(self.shifts_label, 5, 0)
+        self.widget_layout.addWidget(self.shifts_spinbox, 5, 1)
+        self.widget_layout.addWidget(self.shifts_slider, 5, 2)
+        self.widget_layout.addWidget(self.in_gain_label, 6, 0)
+        self.widget_layout.addWidget(self.in_gain_spinbox, 6, 1)
+        self.widget_layout.addWidget(self.in_gain_slider, 6, 2)
+        self.widget_layout.addWidget(self.out_gain_label, 7, 0)
+        self.widget_layout.addWidget(self.out_gain_spinbox, 7, 1)
+        self.widget_layout.addWidget(self.out_gain_slider, 7, 2)
         self.check_layout.addWidget(self.separate_once_added)
+        self.check_layout.addWidget(self.compile_model)
+        self.check_layout.addWidget(self.separate_in_worker)
         self.check_layout.addWidget(self.default_button)
-        self.widget_layout.addLayout(self.check_layout, 6, 0, 1, 3)
+        self.widget_layout.addLayout(self.check_layout, 8, 0, 1, 3)
 
         self.setLayout(self.widget_layout)
 
+        self.device_selector.currentIndexChanged.connect(self.updateDeviceOptions)
+        self.updateDeviceOptions()
+
+    def separateInWorkerChanged(self, state):
+        shared.SetHistory("separate_in_worker", value=bool(state))
+        if not state:
+            main_window.separation_control.workers.stop()
+
+    def updateDeviceOptions(self):
+        """int8 and ONNX Runtime are only available on CPU"""
+        on_cpu = self.device_selector.currentData() == "cpu"
+        self.precision_selector.model().item(self.precision_selector.findData("int8")).setEnabled(on_cpu)
+        if not on_cpu and self.precision_selector.currentData() == "int8":
+            self.precision_selector.setCurrentText("fp32")
+        onnx_available = on_cpu and separator.ApolloCall.onnxruntime is not None
+        self.backend_selector.model().item(self.backend_selector.findData("onnx")).setEnabled(onnx_available)
+        if not onnx_available and self.backend_selector.currentData() == "onnx":
+            self.backend_selector.setCurrentIndex(self.backend_selector.findData("torch"))
+
     def restoreDefaults(self):
         self.device_selector.setCurrentIndex(separator.default_device)
+        self.precision_selector.setCurrentText("fp32")
+        self.backend_selector.setCurrentIndex(self.backend_selector.findData("torch"))
         self.segment_spinbox.setValue(float(main_window.separator.default_segment))
         self.segment_slider.setValue(int(main_window.separator.default_segment * 10))
         self.overlap_spinbox.setValue(0.25)
@@ -1020,6 +1249,85 @@ class SepParamSettings(QWidget):
         self.out_gain_spinbox.setValue(0.0)
         self.out_gain_slider.setValue(0)
 
+    def updateModelLimits(self):
+        """Update segment range after another model is loaded. The segment is only clamped to the new range, as models
+        are also switched while separating files added with their own parameters"""
+        self.segment_slider.blockSignals(True)  # The slider range is smaller than the spinbox range
+        self.segment_spinbox.setRange(0.1, math.floor(float(main_window.separator.max_segment) * 10) / 10)
+        self.segment_slider.setRange(1, int(main_window.separator.default_segment * 10))
+        self.segment_slider.setValue(int(self.segment_spinbox.value() * 10))
+        self.segment_slider.blockSignals(False)
+
+    def getParams(self):
+        """Snapshot of the model and parameters used for a file added to the queue"""
+        model_type, model, repo = main_window.selected_model
+        return {
+            "model_type": model_type,
+            "model": model,
+            "repo": repo,
+            "segment": self.segment_spinbox.value(),
+            "overlap": self.overlap_spinbox.value(),
+            "shifts": self.shifts_spinbox.value(),
+            "device": self.device_selector.currentData(),
+            "precision": self.precision_selector.currentData(),
+            "compiled": self.compile_model.isChecked(),
+            "backend": self.backend_selector.currentData(),
+        }
+
+    @shared.thread_wrapper(daemon=True)
+    def checkPrecision(self):
+        device = main_window.exec_in_main(lambda: self.device_selector.currentData())
+        precision = main_window.exec_in_main(lambda: self.precision_selector.currentData())
+
+        def checkedFile():
+            # The first selected file, or the first file of the queue if none is selected
+            file_queue = main_window.file_queue
+            jobs = [file_queue.model.jobs[i] for i in sorted(file_queue.selectedRows())] or file_queue.model.jobs
+            return (jobs[0].path, file_queue.model.displayName(jobs[0])) if jobs else (None, None)
+
+        file, name = main_window.exec_in_main(checkedFile)
+        if file is None:
+            main_window.showError.emit("Accuracy check", "Add a file to the queue to check accuracy with it")
+            return
+
+        def lockSeparation():
+            # The check runs on the loaded model, so no file can be separated at the same time
+            if not main_window.separation_control.isIdle():
+                return False
+            self.precision_check_button.setEnabled(False)
+            main_window.separation_control.setEnabled(False)
+            return True
+
+        if not main_window.exec_in_main(lockSeparation):
+            main_window.showError.emit("Accuracy check", "Accuracy can't be checked while separating")
+            return
+        model = main_window.separator
+        main_window.setStatusText.emit("Checking accuracy of %s on %s" % (precision, device))
+        try:
+            sdr, time_fp32, time_reduced, precision = separator.checkPrecision(model, device, precision, file)
+        except Exception:
+            logging.error("Failed to check precision %s on %s:\n%s" % (precision, device, traceback.format_exc()))
+            main_window.showError.emit(
+                "Accuracy check failed",
+                "Failed to read %s, or precision %s may be unsupported on this device. Check log file for more "
+                "information." % (name, precision),
+            )
+        else:
+            main_window.showInfo.emit(
+                "Accuracy check",
+                "Precision %s of model %s on %s, compared with fp32 on %s:\n\n"
+                % (precision, model.modelName(), device, name)
+                + "\n".join("%s: SDR %.2f dB" % (stem, value) for stem, value in sdr.items())
+                + "\n\nSpeedup: %.2fx (%s: %.3fs, fp32: %.3fs)"
+                % (time_fp32 / time_reduced, precision, time_reduced, time_fp32),
+            )
+        finally:
+            model.offloadModel()
+            separator.empty_cache()
+            main_window.setStatusText.emit("Accuracy check finished")
+            main_window.exec_in_main(lambda: self.precision_check_button.setEnabled(True))
+            main_window.exec_in_main(lambda: main_window.separation_control.setEnabled(True))
+
 
 class SaveOptions(QWidget):
     SaveLock = threading.Lock()
@@ -1187,6 +1495,15 @@ class SaveOptions(QWidget):
         self.retry_on_error.stateChanged.connect(lambda x: shared.SetHistory("retry_on_error", value=x))
         self.retry_on_error.setSizePolicy(QSizePolicy.Policy.MinimumExpanding, QSizePolicy.Policy.Fixed)
 
+        self.reuse_duplicates = QCheckBox()
+        self.reuse_duplicates.setText("Reuse outputs of duplicate files")
+        self.reuse_duplicates.setToolTip(
+            "If a file has the same audio as a file separated before with the same model, parameters and save "
+            "options, its outputs are copied instead of separating it again."
+        )
+        self.reuse_duplicates.setChecked(shared.GetHistory("reuse_duplicates", default=True))
+        self.reuse_duplicates.stateChanged.connect(lambda x: shared.SetHistory("reuse_duplicates", value=x))
+
         self.retry_button = QPushButton()
         self.retry_button.setText("Retry")
         self.retry_button.clicked.connect(self.ChangeParamEvent.set)
@@ -1240,10 +1557,16 @@ class SaveOptions(QWidget):
             self.widget_layout.addWidget(self.encoder_sndfile_box, 6, 0, 1, 3)
         self.switchFFmpegPreset()
         self.saving = 0
+        self.saving_changed = threading.Condition()  # Notified when a file finishes saving
+        self.templates = None  # (settings, shared.SaveTemplates) of the last used settings
+        # Reuse keys of files being separated, as {key: (job, event)}. The event is set after the job is saved or fails
+        self.separating_keys = {}
+        self.separating_lock = threading.Lock()
 
         self.widget_layout.addWidget(line2, 8, 0, 1, 3)
         self.widget_layout.addWidget(self.retry_on_error, 9, 0, 1, 2)
         self.widget_layout.addWidget(self.retry_button, 9, 2)
+        self.widget_layout.addWidget(self.reuse_duplicates, 10, 0, 1, 3)
 
         self.ChangeParamEvent.set()
 
@@ -1264,65 +1587,168 @@ class SaveOptions(QWidget):
                 self.widget_layout.addWidget(self.encoder_ffmpeg_box, 7, 0, 1, 3)
                 self.encoder_ffmpeg_box.show()
 
+    def saveTemplates(self):
+        """Save location, file extension and ffmpeg command templates, parsed again only if changed. Raises ValueError
+        if any of them is malformed"""
+        match self.encoder_group.checkedId():
+            case 0:
+                extension, command = self.file_format.currentText(), None
+            case 1:
+                extension, command = self.file_extension.text(), self.command.text()
+            case _:
+                extension, command = "wav", None
+        key = (self.loc_input.currentText(), self.location_group.checkedId() != 0, extension, command)
+        if (templates := self.templates) is None or templates[0] != key:
+            templates = self.templates = (key, shared.SaveTemplates(*key))
+        return templates[1]
+
+    def skippedStems(self):
+        """Stems whose existing outputs are skipped, empty unless the overwrite strategy is skip"""
+        if self.overwrite_strategy.currentText() != "skip":
+            return []
+        return [stem for stem, _ in main_window.mixer.stemWeights()]
+
+    def outputsExist(self, file: pathlib.Path | shared.URL_with_filename, model, templates, stems):
+        """Whether all outputs of a file would be skipped by the "skip" overwrite strategy, checked before reading the
+        file so that it needn't be read or separated. As this runs on the separation thread, `templates` and `stems`
+        (from `skippedStems`) are read from the widgets on the main thread when the job starts"""
+        if not stems:
+            return False
+        try:
+            tags = (
+                separator.audio.read_tags(file)
+                if templates.pathUsesTags()
+                else separator.audio.audio_tags_default.copy()
+            )
+            context = templates.context(file, tags, model)
+            return all(context.path(stem).exists() for stem in stems)
+        except Exception:
+            logging.error("Failed to check outputs of %s:\n%s" % (file, traceback.format_exc()))
+            return False
+
+    def outputSignature(self):
+        """Settings which change the content of saved files, outputs are only reused if these are the same"""
+        match self.encoder_group.checkedId():
+            case 0:
+                encoder = ["sndfile", self.file_format.currentText(), self.sample_fmt.currentData()]
+            case _:
+                encoder = ["ffmpeg", self.file_extension.text(), self.command.text()]
+        return [
+            encoder,
+            self.clip_mode.currentText(),
+            main_window.param_settings.out_gain_spinbox.value(),
+            main_window.mixer.stemWeights(),
+        ]
+
+    def reuseOptions(self, templates):
+        """Save options `reuse` depends on, None if outputs of duplicate files are not reused. Read on the main thread
+        when a job starts, as `reuse` runs on the separation thread"""
+        if not self.reuse_duplicates.isChecked():
+            return None
+        return self.outputSignature(), templates, self.overwrite_strategy.currentText()
+
+    def reuse(self, file: pathlib.Path | shared.URL_with_filename, item: "Job", digest, tags, options):
+        """Copy outputs of a file with the same audio separated before with the same model, parameters and save
+        settings, instead of separating this one. Returns whether the outputs are reused. If not, the key is kept in
+        the job, so its outputs are recorded after saving. If a file with the same key is still being separated or
+        saved, this waits for it, and the key is reserved for this job if it is going to be separated. `options` is
+        from `reuseOptions`"""
+        item.reuse_key = None
+        if options is None:
+            return False
+        signature, templates, overwrite_strategy = options
+        params = item.params
+        key = hashlib.sha256(
+            json.dumps(
+                [
+                    digest,
+                    [params.get(i) for i in ("model_type", "model", "segment", "overlap", "shifts", "precision")],
+                    str(params.get("repo")),
+                    signature,
+                ]
+            ).encode("utf8")
+        ).hexdigest()
+        item.reuse_key = key
+        while True:
+            with self.separating_lock:
+                if (separating := self.separating_keys.get(key)) is None:
+                    if (previous := duplicates.lookup(key)) is None:
+                        self.separating_keys[key] = (item, threading.Event())
+                        return False
+                    break
+            logging.info("Waiting for outputs of %s, which has the same audio" % separating[0].path)
+            main_window.setStatusText.emit("Waiting for outputs of a file with the same audio")
+            separating[1].wait()
+        with self.SaveLock:
+            outputs = {}
+            try:
+                context = templates.context(file, tags, params["model"])
+                for stem, source in previous.items():
+                    file_path = context.path(stem)
+                    if file_path.exists():
+                        if file_path.samefile(source):
+                            outputs[stem] = {"file": file_path, "reused": source}
+                            continue
+                        match overwrite_strategy:
+                            case "skip":
+                                outputs[stem] = {"file": file_path, "status": shared.FileStatus.Skipped}
+                                continue
+                            case "rename":
+                                file_path = shared.get_unique_filename(file_path)
+                            case "ask":
+                                # Separate and save it as usual, which asks to retry
+                                return False
+                    file_path.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copyfile(source, file_path)
+                    logging.info("Copied %s to %s, which has the same audio" % (source, file_path))
+                    outputs[stem] = {"file": file_path, "reused": source}
+            except Exception:
+                logging.error("Failed to reuse outputs, separating instead:\n%s" % traceback.format_exc())
+                return False
+        item.outputs.update(outputs)
+        return True
+
+    def releaseReuseKey(self, item: "Job"):
+        """Let files waiting in `reuse` for the outputs of `item` continue"""
+        with self.separating_lock:
+            if (separating := self.separating_keys.get(item.reuse_key)) is not None and separating[0] is item:
+                del self.separating_keys[item.reuse_key]
+                separating[1].set()
+
     @shared.thread_wrapper(daemon=True)
     def save(
-        self, file: pathlib.Path | shared.URL_with_filename, origin, tensor, tags, save_func, item, finishCallback
+        self,
+        file: pathlib.Path | shared.URL_with_filename,
+        origin,
+        tensor,
+        tags,
+        save_func,
+        item,
+        finishCallback,
+        metrics=None,
     ):
         global main_window
-        self.saving += 1
+        with self.saving_changed:
+            self.saving += 1
         finishCallback(shared.FileStatus.Writing, item)
         with self.SaveLock:
+            write_start = time.perf_counter()
+            waiting_time = 0.0
             shared.AddHistory("save_location", value=self.loc_input.currentText())
             while True:
                 main_window.mixer.setEnabled(False)
                 self.retry_button.setEnabled(False)
                 ret = None
+                output_bytes = 0
+                written = {}
+                context = None  # Variables of the file, computed once for all stems
                 for stem, stem_data in main_window.mixer.mix(origin, tensor):
                     try:
                         if separator.np.isnan(stem_data).any() or separator.np.isinf(stem_data).any():
                             logging.warning("NaN or inf found in stem %s" % stem)
-                        match self.encoder_group.checkedId():
-                            case 0:
-                                file_ext = self.file_format.currentText()
-                            case 1:
-                                tags_avoid_conflict = tags.copy()
-                                for i in ["input", "inputext", "inputpath"]:
-                                    if i in tags_avoid_conflict:
-                                        tags_avoid_conflict.pop(i)
-                                file_ext = self.file_extension.text().format(
-                                    input=file.stem,
-                                    inputext=file.suffix[1:],
-                                    inputpath=str(file.parent),
-                                    **tags_avoid_conflict,
-                                )
-                            case _:
-                                file_ext = "wav"
-                        parents = [file.name]
-                        parent = file
-                        while parent.parent != parent and len(parents) < 16:
-                            parent = parent.parent
-                            parents.append(parent.name)
-                        if len(parents) < 16:
-                            parents += [""] * (16 - len(parents))
-                        tags_avoid_conflict = tags.copy()
-                        for i in ["track", "trackext", "stem", "ext", "model", "host"]:
-                            if i in tags_avoid_conflict:
-                                tags_avoid_conflict[f"{i}_"] = tags_avoid_conflict.pop(i)
-                        file_path_str = self.loc_input.currentText().format(
-                            *parents,
-                            track=file.stem,
-                            trackext=file.name,
-                            stem=stem,
-                            ext=file_ext,
-                            model=main_window.model_selector.select_combobox.currentText(),
-                            host=file["host"] if isinstance(file, shared.URL_with_filename) else "localfile",
-                            **tags_avoid_conflict,
-                        )
-                        match self.location_group.checkedId():
-                            case 0:
-                                file_path = file.parent / file_path_str
-                            case 1:
-                                file_path = pathlib.Path(file_path_str)
+                        if context is None:
+                            context = self.saveTemplates().context(file, tags, item.params["model"])
+                        file_path = context.path(stem)
                         stem_data = separator.gain(stem_data, main_window.param_settings.out_gain_spinbox.value())
                         shared.SetHistory("out_gain", value=main_window.param_settings.out_gain_spinbox.value())
                         match self.clip_mode.currentText():
@@ -1345,12 +1771,7 @@ class SaveOptions(QWidget):
                         if file_path.exists():
                             if self.overwrite_strategy.currentText() == "skip":
                                 logging.info("File %s already exists, skipping due to overwrite strategy." % file_path)
-                                main_window.file_queue.set_cell_item_data(
-                                    item, "outputs", stem, "file", value=file_path
-                                )
-                                main_window.file_queue.set_cell_item_data(
-                                    item, "outputs", stem, "status", value=shared.FileStatus.Skipped
-                                )
+                                item.outputs[stem] = {"file": file_path, "status": shared.FileStatus.Skipped}
                                 continue
                             elif self.overwrite_strategy.currentText() == "ask":
                                 ret = "File %s already exists" % file_path
@@ -1363,25 +1784,13 @@ class SaveOptions(QWidget):
                             case 0:
                                 ret = save_func(file_path, data, self.sample_fmt.currentData(), encoder="sndfile")
                             case 1:
-                                tags_avoid_conflict = tags.copy()
-                                for i in ["input", "inputext", "inputpath", "output"]:
-                                    if i in tags_avoid_conflict:
-                                        tags_avoid_conflict.pop(i)
-                                command = [
-                                    i.format(
-                                        input=file.stem,
-                                        inputext=file.suffix[1:],
-                                        inputpath=str(file.parent),
-                                        output=str(file_path),
-                                        **tags_avoid_conflict,
-                                    )
-                                    for i in shared.try_parse_cmd(self.command.text())
-                                ]
+                                command = context.command(file_path)
                                 logging.info("Saving file %s with command %s" % (file_path, command))
                                 ret = save_func(command, data, encoder="ffmpeg")
-                                main_window.file_queue.set_cell_item_data(
-                                    item, "outputs", stem, "file", value=file_path
-                                )
+                                item.outputs.setdefault(stem, {})["file"] = file_path
+                        if ret is None and file_path.exists():
+                            output_bytes += file_path.stat().st_size
+                            written[stem] = file_path
                     except Exception:
                         logging.error("Failed to save file %s:\n%s" % (file_path, traceback.format_exc()))
                         ret = traceback.format_exc()
@@ -1390,6 +1799,7 @@ class SaveOptions(QWidget):
                 main_window.mixer.setEnabled(True)
                 if ret is None:
                     break
+                waiting_start = time.perf_counter()
                 if self.retry_on_error.isChecked():
                     if (
                         main_window.exec_in_main(
@@ -1404,6 +1814,7 @@ class SaveOptions(QWidget):
                         )
                         == main_window.m.StandardButton.No
                     ):
+                        waiting_time += time.perf_counter() - waiting_start
                         break
                 ret = None
                 self.ChangeParamEvent.clear()
@@ -1412,7 +1823,26 @@ class SaveOptions(QWidget):
                 self.retry_button.setEnabled(True)
                 self.ChangeParamEvent.wait()
                 self.unlockOther()
-            self.saving -= 1
+                waiting_time += time.perf_counter() - waiting_start
+            with self.saving_changed:
+                self.saving -= 1
+                self.saving_changed.notify_all()
+            if metrics is not None:
+                # Time waiting for the user to retry is not counted
+                metrics.write_time = time.perf_counter() - write_start - waiting_time
+                metrics.output_bytes = output_bytes
+                metrics.sampleMemory()
+        if metrics is not None:
+            performance.record(metrics, "Finished" if ret is None else "Failed")
+        if (
+            ret is None
+            and item.reuse_key is not None
+            and written
+            and not any(i.get("status") == shared.FileStatus.Skipped for i in item.outputs.values())
+        ):
+            # Outputs are only reused if all of them were written from this audio
+            duplicates.record(item.reuse_key, written)
+        self.releaseReuseKey(item)
         if ret is None:
             finishCallback(shared.FileStatus.Finished, item)
         else:
@@ -1537,45 +1967,343 @@ class SaveOptions(QWidget):
         main_window.separation_control.setEnabled(True)
 
 
+class Job:
+    """A file in the queue. Separation and saving threads only touch `outputs` and `reuse_key`, and `name` of a URL is
+    set by the thread fetching it. Other fields are changed in the main thread through `FileQueueModel`."""
+
+    __slots__ = (
+        "id",
+        "row",
+        "order",
+        "path",
+        "name",
+        "params",
+        "status",
+        "progress",
+        "text",
+        "tooltip",
+        "outputs",
+        "info",
+        "reuse_key",
+        "local",
+    )
+
+    def __init__(self, job_id, path, params):
+        self.id = job_id
+        self.row = -1
+        self.order = job_id  # Sorts jobs in the order of rows, rows can be renumbered but their order is kept
+        self.path = path
+        # Name of a URL is fetched in background, full URL is shown until then
+        self.name = path.name if isinstance(path, pathlib.Path) else None
+        self.params = params
+        self.status = shared.FileStatus.Queued
+        self.progress = 0.0
+        self.text = "Queued"
+        self.tooltip = None
+        self.outputs = {}
+        self.info = None  # Result of probe.Prober, None if not probed yet
+        self.reuse_key = None  # Key of outputs in duplicates, set when the file is read
+        # Downloaded file of a URL, None if still downloading, False if it is read directly
+        self.local = None if remote.prefetchable(path) else False
+
+
+class FileQueueModel(QAbstractTableModel):
+    """Table model of the file queue, the rows are `Job` objects stored in a list.
+
+    Jobs are also indexed by status, and queued jobs by model in heaps sorted by `sortKey`, so finding jobs to
+    separate doesn't need to scan the whole queue. Status of jobs must be changed through this model to keep the
+    indexes updated."""
+
+    schedules = {"order": "Added order", "shortest": "Shortest first", "longest": "Longest first"}
+
+    # Statuses of jobs counted as remaining in the queue
+    pending_status = [
+        shared.FileStatus.Queued,
+        shared.FileStatus.Paused,
+        shared.FileStatus.Reading,
+        shared.FileStatus.Separating,
+        shared.FileStatus.Writing,
+    ]
+
+    headers = ["File", "Status"]
+    header_tooltips = ["Toggle full path/file name", "Toggle animation"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.jobs = []
+        self.next_id = 0
+        self.first_order = 0
+        self.show_full_path = False
+        self.schedule = "order"
+        self.by_status = collections.defaultdict(dict)  # {status: {job id: job}}
+        # {model key: heap of (sort key, job id, job)}, entries of jobs no longer queued or whose sort key changed are
+        # dropped when found
+        self.queued = {}
+        # Number of queued jobs, number of them not probed and total duration of the others by (model, device), for
+        # estimating remaining time of the queue
+        self.queued_count = collections.Counter()
+        self.queued_unprobed = collections.Counter()
+        self.queued_seconds = collections.defaultdict(float)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.jobs)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal:
+            if role == Qt.ItemDataRole.DisplayRole:
+                return self.headers[section]
+            if role == Qt.ItemDataRole.ToolTipRole:
+                return self.header_tooltips[section]
+            return None
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        job = self.jobs[index.row()]
+        if index.column() == 0:
+            if role == Qt.ItemDataRole.DisplayRole:
+                return self.displayName(job)
+            if role == Qt.ItemDataRole.ToolTipRole:
+                return str(job.path) + ("\n" + self.infoText(job.info) if job.info is not None else "")
+        else:
+            if role == ProgressDelegate.ProgressRole:
+                return job.progress
+            if role == ProgressDelegate.TextRole:
+                return job.text
+            if role == Qt.ItemDataRole.ToolTipRole:
+                return job.tooltip or FileQueue.paramsToolTip(job.params)
+        return None
+
+    def displayName(self, job):
+        if self.show_full_path:
+            return str(job.path)
+        if isinstance(job.path, shared.URL_with_filename):
+            return "%s [URL]" % job.name if job.name is not None else str(job.path)
+        return job.name
+
+    @staticmethod
+    def infoText(info):
+        if "error" in info:
+            return "Unreadable: %s" % info["error"]
+        return "%s | %s | %d Hz | %d channels" % (
+            time.strftime("%H:%M:%S", time.gmtime(info["duration"])),
+            info["format"],
+            info["samplerate"],
+            info["channels"],
+        )
+
+    def setShowFullPath(self, show_full_path):
+        self.show_full_path = show_full_path
+        if self.jobs:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.jobs) - 1, 0))
+
+    def addJobs(self, paths, params):
+        """Append files to the queue and return the new jobs"""
+        jobs = [Job(self.next_id + i, path, params) for i, path in enumerate(paths)]
+        if not jobs:
+            return jobs
+        self.next_id += len(jobs)
+        first = len(self.jobs)
+        self.beginInsertRows(QModelIndex(), first, first + len(jobs) - 1)
+        for i, job in enumerate(jobs):
+            job.row = first + i
+            self.by_status[job.status][job.id] = job
+            self.pushQueued(job)
+            self.countQueued(job, 1)
+        self.jobs.extend(jobs)
+        self.endInsertRows()
+        return jobs
+
+    def removeJobs(self, rows):
+        """Remove rows, contiguous rows are removed at once"""
+        rows = sorted(set(rows), reverse=True)
+        if not rows:
+            return
+        end = rows[0]
+        for i, row in enumerate(rows):
+            if i + 1 < len(rows) and rows[i + 1] == row - 1:
+                continue
+            self.beginRemoveRows(QModelIndex(), row, end)
+            for job in self.jobs[row : end + 1]:
+                job.row = -1
+                del self.by_status[job.status][job.id]
+                if job.status == shared.FileStatus.Queued:
+                    self.countQueued(job, -1)
+            del self.jobs[row : end + 1]
+            self.endRemoveRows()
+            if i + 1 < len(rows):
+                end = rows[i + 1]
+        self.renumber(rows[-1])
+
+    def moveToTop(self, rows):
+        """Move rows to the top, keeping their order"""
+        moving = [self.jobs[i] for i in sorted(set(rows))]
+        if not moving:
+            return
+        moving_ids = {job.id for job in moving}
+        self.first_order -= len(moving)
+        for i, job in enumerate(moving):
+            job.order = self.first_order + i
+            if job.status == shared.FileStatus.Queued:
+                self.pushQueued(job)
+        self.layoutAboutToBeChanged.emit()
+        self.jobs = moving + [job for job in self.jobs if job.id not in moving_ids]
+        new_rows = {job.row: row for row, job in enumerate(self.jobs)}
+        old_indexes = self.persistentIndexList()
+        self.changePersistentIndexList(old_indexes, [self.index(new_rows[i.row()], i.column()) for i in old_indexes])
+        self.renumber(0)
+        self.layoutChanged.emit()
+
+    def renumber(self, start):
+        for row in range(start, len(self.jobs)):
+            self.jobs[row].row = row
+
+    def sortKey(self, job):
+        """Jobs moved to top come first in their order, then jobs sorted by the schedule. Jobs not probed yet are
+        separated last when sorting by duration. URLs still downloading come after all other jobs, so that separation
+        doesn't wait for them."""
+        waiting = job.local is None
+        if job.order < 0 or self.schedule == "order":
+            return (waiting, 0, job.order)
+        if job.info is None or "duration" not in job.info:
+            return (waiting, 2, job.order)
+        return (waiting, 1, job.info["duration"] if self.schedule == "shortest" else -job.info["duration"], job.order)
+
+    def pushQueued(self, job):
+        if job.status == shared.FileStatus.Queued:
+            heapq.heappush(self.queued.setdefault(modelKey(job.params), []), (self.sortKey(job), job.id, job))
+
+    def firstQueued(self, model_key=None):
+        """The first queued job using the model, or of all models if `model_key` is None"""
+        first = None
+        for key in [model_key] if model_key is not None else list(self.queued):
+            heap = self.queued.get(key)
+            while heap and (
+                (job := heap[0][2]).status != shared.FileStatus.Queued or job.row < 0 or self.sortKey(job) != heap[0][0]
+            ):
+                heapq.heappop(heap)
+            if heap and (first is None or heap[0][0] < first[0]):
+                first = heap[0]
+        return first[2] if first is not None else None
+
+    def setSchedule(self, schedule):
+        self.schedule = schedule
+        self.queued = {}
+        for job in self.by_status[shared.FileStatus.Queued].values():
+            self.pushQueued(job)
+
+    def countQueued(self, job, sign):
+        key = (job.params["model"], job.params["device"])
+        self.queued_count[key] += sign
+        if job.info is not None and "duration" in job.info:
+            self.queued_seconds[key] += sign * job.info["duration"]
+        else:
+            self.queued_unprobed[key] += sign
+
+    def setInfo(self, job, info):
+        """Set the probe result of a job, queued or paused jobs which can't be read are marked as failed"""
+        queued = job.status == shared.FileStatus.Queued
+        if queued:
+            self.countQueued(job, -1)
+        job.info = info
+        if queued:
+            self.countQueued(job, 1)
+        if "error" in info and job.status in [shared.FileStatus.Queued, shared.FileStatus.Paused]:
+            job.progress = 0.0
+            self.setStatus(job, shared.FileStatus.Failed, "Unreadable")
+        else:
+            self.pushQueued(job)
+        self.jobChanged(job, 0)
+
+    def setLocal(self, job, local):
+        """Set the downloaded file of a URL, or False if it isn't downloaded"""
+        job.local = local
+        self.pushQueued(job)
+        self.jobChanged(job, 0)
+
+    def countStatus(self, *status):
+        return sum(len(self.by_status[i]) for i in status)
+
+    def updateStatus(self, job, status):
+        if status == job.status:
+            return
+        del self.by_status[job.status][job.id]
+        if job.status == shared.FileStatus.Queued:
+            self.countQueued(job, -1)
+        job.status = status
+        self.by_status[status][job.id] = job
+        self.pushQueued(job)
+        if status == shared.FileStatus.Queued:
+            self.countQueued(job, 1)
+
+    def jobChanged(self, job, column=1):
+        if job.row < 0:
+            return
+        index = self.index(job.row, column)
+        self.dataChanged.emit(index, index)
+
+    def setStatus(self, job, status, text=None):
+        self.updateStatus(job, status)
+        if text is not None:
+            job.text = text
+        self.jobChanged(job)
+
+    def setProgress(self, job, progress):
+        self.updateStatus(job, shared.FileStatus.Separating)
+        job.progress = progress
+        job.text = ""
+        self.jobChanged(job)
+
+    def setText(self, job, text):
+        job.text = text
+        self.jobChanged(job)
+
+
 class FileQueue(QWidget):
     widget_title = "File queue (%d)"
+    probedSignal = Signal(list)
+    prefetchedSignal = Signal(object, object)
     new_url_event = threading.Event()
+    scan_threads = 8  # Folders scanned at the same time
+    scan_batch = 5000  # Files found in folders are added to the queue in batches of this size, or every 0.5s
+    url_name_threads = 16  # Names of URLs resolved at the same time, connections to each host are also limited
 
     def __init__(self):
         global main_window
 
         super().__init__()
 
-        self.table = QTableWidget()
-        self.table.setColumnCount(2)
+        self.model = FileQueueModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
         self.table.setMinimumWidth(280)
-        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.table.setSelectionMode(QTableWidget.SelectionMode.ExtendedSelection)
-        self.table.setVerticalScrollMode(QTableWidget.ScrollMode.ScrollPerPixel)
-        self.table.setHorizontalScrollMode(QTableWidget.ScrollMode.ScrollPerPixel)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QTableView.SelectionMode.ExtendedSelection)
+        self.table.setVerticalScrollMode(QTableView.ScrollMode.ScrollPerPixel)
+        self.table.setHorizontalScrollMode(QTableView.ScrollMode.ScrollPerPixel)
         self.table.verticalScrollBar().setSingleStep(8)
         self.table.horizontalScrollBar().setSingleStep(8)
-        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
         self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
         self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Fixed)
         self.table.horizontalHeader().setMinimumSectionSize(80)
         font = self.table.font()
         font.setPointSize(int(font.pointSize() * 0.9))
         self.table.setFont(font)
+        # Fixed row height, resizing rows to contents requires measuring every row
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(QtGui.QFontMetrics(font).height() + 8)
         self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
-
-        self.table.setHorizontalHeaderLabels(["File", "Status"])
         self.table.setColumnWidth(1, 100)
-        self.table.horizontalHeaderItem(0).setToolTip("Click here to toggle file name/full path")
 
         self.table.setAcceptDrops(True)
         self.table.dropEvent = self.table_dropEvent
         self.table.dragEnterEvent = self.table_dragEnterEvent
         self.table.dragMoveEvent = self.table_dragMoveEvent
 
-        self.show_full_path = False
-        self.table.horizontalHeaderItem(0).setToolTip("Toggle full path/file name")
-        self.table.horizontalHeaderItem(1).setToolTip("Toggle animation")
         self.table.horizontalHeader().sectionClicked.connect(self.tableHeaderClicked)
 
         self.delegate = ProgressDelegate()
@@ -1583,9 +2311,7 @@ class FileQueue(QWidget):
 
         self.add_folder_button = QPushButton()
         self.add_folder_button.setText("Add folder")
-        self.add_folder_button.clicked.connect(
-            lambda: self.addFiles([QFileDialog.getExistingDirectory(main_window, "Add a folder to queue")])
-        )
+        self.add_folder_button.clicked.connect(self.addFolder)
         self.add_folder_button.setFocusProxy(self.table)
 
         self.add_files_button = QPushButton()
@@ -1639,6 +2365,23 @@ class FileQueue(QWidget):
         self.widget_layout.addWidget(self.resume_button, 2, 2)
         self.widget_layout.addWidget(self.move_top_button, 2, 3)
 
+        self.schedule_label = QLabel()
+        self.schedule_label.setText("Order:")
+        self.schedule_selector = QComboBox()
+        for schedule, name in FileQueueModel.schedules.items():
+            self.schedule_selector.addItem(name, schedule)
+        self.schedule_selector.setToolTip(
+            "Order of separating queued files. Files using the loaded model are always separated first, and files "
+            "moved to top are separated before others.\nDuration is read in background after files are added."
+        )
+        self.schedule_selector.setCurrentIndex(
+            max(0, self.schedule_selector.findData(shared.GetHistory("queue_order", default="order")))
+        )
+        self.model.setSchedule(self.schedule_selector.currentData())
+        self.schedule_selector.currentIndexChanged.connect(self.setSchedule)
+        self.widget_layout.addWidget(self.schedule_label, 3, 0)
+        self.widget_layout.addWidget(self.schedule_selector, 3, 1, 1, 3)
+
         self.setLayout(self.widget_layout)
 
         self.repaint_timer = QTimer()
@@ -1649,7 +2392,18 @@ class FileQueue(QWidget):
         self.loadURLname_queue = []
         self.loadURLname_thread()
 
-        self.queue_length = 0
+        self.scanning = 0
+        self.scan_cancel = threading.Event()
+
+        self.prober = probe.Prober(self.probedSignal.emit)
+        self.probedSignal.connect(self.probed)
+        self.prefetcher = remote.Prefetcher(self.prefetchedSignal.emit)
+        self.prefetchedSignal.connect(self.prefetched)
+
+    @property
+    def queue_length(self):
+        """Number of files not finished, failed or cancelled yet"""
+        return self.model.countStatus(*self.model.pending_status)
 
     def table_dragEnterEvent(self, event):
         if event.mimeData().hasUrls():
@@ -1669,96 +2423,139 @@ class FileQueue(QWidget):
 
     def paint_table_progress(self):
         """Force refresh progress bar"""
-        begin = self.table.rowAt(0)
-        end = self.table.rowAt(self.table.height())
-        if begin == -1:
-            begin = 0
-        if end == -1:
-            end = self.table.rowCount() - 1
-        for i in range(begin, end + 1):
-            item = self.table.item(i, 1)
-            if item is not None:
-                item.setData(Qt.ItemDataRole.UserRole + 0x100, random.random())
-
-    def set_cell_data(self, row, column, *keys, value):
-        """Set data for a cell in the table"""
-        item = self.table.item(row, column)
-        if item is None:
-            raise ValueError(f"No item found at row {row}, column {column}")
-        if not isinstance(item, QTableWidgetItem):
-            raise TypeError(f"Item at row {row}, column {column} is not a QTableWidgetItem")
-        if not keys:
-            raise ValueError("At least one key must be provided")
-        self.set_cell_item_data(item, *keys, value=value)
-
-    def set_cell_item_data(self, item, *keys, value):
-        """Set data for a cell item in the table"""
-        if not isinstance(item, QTableWidgetItem):
-            raise TypeError("Item must be a QTableWidgetItem")
-        if not keys:
-            raise ValueError("At least one key must be provided")
-        current_value = item.data(Qt.ItemDataRole.UserRole)
-        if current_value is None:
-            current_value = {}
-        data_layer = current_value
-        if not isinstance(data_layer, dict):
-            raise TypeError("Current value is not a dictionary")
-        for idx, key in enumerate(keys[:-1]):
-            if key not in data_layer:
-                data_layer[key] = {}
-            if not isinstance(data_layer[key], dict):
-                raise TypeError(f"Key {str(keys[:idx + 1])} is not a dictionary")
-            data_layer = data_layer[key]
-        data_layer[keys[-1]] = value
-        item.setData(Qt.ItemDataRole.UserRole, current_value)
-
-    def addFiles(self, files):
+        self.table.viewport().update()
+
+    def selectedRows(self):
+        return {i.row() for i in self.table.selectionModel().selectedIndexes()}
+
+    def probed(self, results):
+        for job, info in results:
+            self.model.setInfo(job, info)
+        main_window.updateQueueLength()
+
+    def prefetched(self, job, path):
+        if path is None:
+            self.model.setLocal(job, False)
+            return
+        self.model.setLocal(job, path)
+        if job.info is None:
+            self.prober.submit([job], lambda _: path)
+
+    def setSchedule(self):
+        shared.SetHistory("queue_order", value=self.schedule_selector.currentData())
+        with file_queue_lock:
+            self.model.setSchedule(self.schedule_selector.currentData())
+
+    def addFolder(self):
+        if self.scanning:
+            self.scan_cancel.set()
+            return
+        self.addFiles([QFileDialog.getExistingDirectory(main_window, "Add a folder to queue")])
+
+    def addFiles(self, files, params=None):
+        """Add files to the queue. Folders are scanned in background, and only readable files in them are added."""
         global main_window
-        files = map(pathlib.Path, (i for i in files if len(i)))
-        for file in files:
-            if file.is_dir():
-                for dirpath, dirnames, filenames in os.walk(file):
-                    dirpath_path = pathlib.Path(dirpath)
-                    self.addFiles([str(dirpath_path / filename) for filename in filenames])
-            else:
-                with file_queue_lock:
-                    row = self.table.rowCount()
-                    self.table.insertRow(row)
-                    if row == 500:
-                        main_window.showWarning.emit(
-                            "Queue too long",
-                            "You have added more than 500 files to the queue. This may cause performance issues. "
-                            "You may switch to other tabs or minimize the window to reduce the impact.",
+        if params is None:
+            params = main_window.param_settings.getParams()
+        paths = [pathlib.Path(i) for i in files if len(i)]
+        self.addJobs([i for i in paths if not i.is_dir()], params)
+        if folders := [i for i in paths if i.is_dir()]:
+            self.scanning += 1
+            self.add_folder_button.setText("Stop scanning")
+            self.scanFolders(folders, params)
+
+    @staticmethod
+    def scanFolder(folder, extensions):
+        """Return sorted paths of files with given extensions in the folder, and its subfolders"""
+        files = []
+        folders = []
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            folders.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1][1:].lower() in extensions:
+                            files.append(entry.path)
+                    except OSError:
+                        pass
+        except OSError:
+            logging.warning("Failed to scan folder %s:\n%s" % (folder, traceback.format_exc()))
+        return sorted(files), folders
+
+    @shared.thread_wrapper(daemon=True)
+    def scanFolders(self, folders, params):
+        global main_window
+        found = 0
+        scanned = 0
+        batch = []
+        last_added = time.perf_counter()
+        try:
+            extensions = separator.audio.readable_extensions()
+            with concurrent.futures.ThreadPoolExecutor(self.scan_threads) as pool:
+                pending = {pool.submit(self.scanFolder, str(i), extensions) for i in folders}
+                while pending and not self.scan_cancel.is_set():
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        files, subfolders = future.result()
+                        scanned += 1
+                        batch.extend(map(pathlib.Path, files))
+                        pending |= {pool.submit(self.scanFolder, i, extensions) for i in subfolders}
+                    if batch and (
+                        len(batch) >= self.scan_batch or time.perf_counter() - last_added > 0.5 or not pending
+                    ):
+                        found += len(batch)
+                        main_window.exec_in_main(lambda: self.addJobs(batch, params))
+                        batch = []
+                        last_added = time.perf_counter()
+                        main_window.setStatusText.emit(
+                            "Scanning folders: %d files found in %d folders" % (found, scanned)
                         )
-                    if self.show_full_path:
-                        self.table.setItem(row, 0, QTableWidgetItem(str(file)))
-                    else:
-                        self.table.setItem(row, 0, QTableWidgetItem(file.name))
-                    self.table.setItem(row, 1, QTableWidgetItem())
-                    self.table.item(row, 0).setToolTip(str(file))
-                    self.set_cell_data(row, 0, "path", value=file)
-                    self.set_cell_data(row, 1, "status", value=shared.FileStatus.Queued)
-                    self.table.item(row, 1).setData(ProgressDelegate.ProgressRole, 0)
-                    self.table.item(row, 1).setData(ProgressDelegate.TextRole, "Queued")
-                    self.queue_length += 1
-                if main_window.param_settings.separate_once_added.isChecked():
-                    main_window.separation_control.start_button.click()
-                main_window.updateQueueLength()
+                for future in pending:
+                    future.cancel()
+            if self.scan_cancel.is_set():
+                main_window.setStatusText.emit("Folder scanning stopped, %d files added" % found)
+            else:
+                main_window.setStatusText.emit("Added %d files from %d folders" % (found, scanned))
+            logging.info("Scanned %d folders in %s, %d files found" % (scanned, folders, found))
+        finally:
+            main_window.exec_in_main(self.scanFinished)
+
+    def scanFinished(self):
+        self.scanning -= 1
+        if not self.scanning:
+            self.add_folder_button.setText("Add folder")
+            self.scan_cancel.clear()
+
+    def addJobs(self, paths, params):
+        global main_window
+        if not paths:
+            return
+        with file_queue_lock:
+            jobs = self.model.addJobs(paths, params)
+        self.prober.submit([job for job in jobs if isinstance(job.path, pathlib.Path)], lambda job: job.path)
+        for job in jobs:
+            if job.local is None:
+                if self.prefetcher.limit > 0:
+                    self.prefetcher.submit(job, job.path)
+                else:
+                    self.model.setLocal(job, False)
+        if main_window.param_settings.separate_once_added.isChecked():
+            main_window.separation_control.start_button.click()
+        main_window.updateQueueLength()
 
     @shared.thread_wrapper(daemon=True)
     def loadURLname_thread(self):
+        pool = concurrent.futures.ThreadPoolExecutor(self.url_name_threads, thread_name_prefix="url_name")
         while True:
             self.new_url_event.wait()
             self.new_url_event.clear()
             while self.loadURLname_queue:
-                item = self.loadURLname_queue.pop(0)  # type: QTableWidgetItem
-                url = item.data(Qt.ItemDataRole.UserRole)["path"]
-                if isinstance(url, shared.URL_with_filename):
-                    url.name
-                if self.show_full_path:
-                    item.setText(str(url))
-                else:
-                    item.setText("%s [URL]" % url.name)
+                pool.submit(self.loadURLname, self.loadURLname_queue.pop(0))
+
+    def loadURLname(self, job: Job):
+        job.name = job.path.name
+        main_window.exec_in_main(lambda: self.model.jobChanged(job, 0))
 
     def addUrl(self):
         global main_window
@@ -1781,6 +2578,8 @@ class FileQueue(QWidget):
         )
         if not ok:
             return
+        params = main_window.param_settings.getParams()
+        paths = []
         for line in map(str.strip, urls.splitlines()):
             if not line:
                 continue
@@ -1793,28 +2592,32 @@ class FileQueue(QWidget):
                 if not url["name"]:
                     logging.error("Can't find filename in URL %s\nPlease specify the filename" % url)
                     continue
-            with file_queue_lock:
-                row = self.table.rowCount()
-                self.table.insertRow(row)
-                if row == 500:
-                    main_window.showWarning.emit(
-                        "Queue too long",
-                        "You have added more than 500 files to the queue. This may cause performance issues. "
-                        "You may switch to other tabs or minimize the window to reduce the impact.",
-                    )
-                self.table.setItem(row, 0, QTableWidgetItem(str(url)))
-                self.loadURLname_queue.append(self.table.item(row, 0))
-                self.new_url_event.set()
-                self.table.setItem(row, 1, QTableWidgetItem())
-                self.table.item(row, 0).setToolTip(str(url))
-                self.set_cell_data(row, 0, "path", value=url)
-                self.set_cell_data(row, 1, "status", value=shared.FileStatus.Queued)
-                self.table.item(row, 1).setData(ProgressDelegate.ProgressRole, 0)
-                self.table.item(row, 1).setData(ProgressDelegate.TextRole, "Queued")
-                self.queue_length += 1
-            if main_window.param_settings.separate_once_added.isChecked():
-                main_window.separation_control.start_button.click()
-            main_window.updateQueueLength()
+            paths.append(url)
+        with file_queue_lock:
+            jobs = self.model.addJobs(paths, params)
+        self.loadURLname_queue.extend(jobs)
+        self.new_url_event.set()
+        if jobs and main_window.param_settings.separate_once_added.isChecked():
+            main_window.separation_control.start_button.click()
+        main_window.updateQueueLength()
+
+    @staticmethod
+    def paramsToolTip(params):
+        return (
+            "Model: %s\nRepo: %s\nSegment: %.1fs\nOverlap: %.2f\nShifts: %d\nDevice: %s\nPrecision: %s\nCompiled: %s"
+            "\nBackend: %s"
+            % (
+                params["model"],
+                params["repo"] if params["repo"] is not None else '"remote"',
+                params["segment"],
+                params["overlap"],
+                params["shifts"],
+                params["device"],
+                params.get("precision", "fp32"),
+                "Yes" if params.get("compiled", False) else "No",
+                "ONNX Runtime" if params.get("backend", "torch") == "onnx" else "PyTorch",
+            )
+        )
 
     def tableHeaderClicked(self, index):
         match index:
@@ -1834,88 +2637,104 @@ class FileQueue(QWidget):
             self.repaint_timer.stop()
 
     def togglePathName(self):
-        self.show_full_path = not self.show_full_path
-        if self.show_full_path:
-            for i in range(self.table.rowCount()):
-                item = self.table.item(i, 0)
-                item.setText(str(item.data(Qt.ItemDataRole.UserRole)["path"]))
-        else:
-            for i in range(self.table.rowCount()):
-                item = self.table.item(i, 0)
-                if isinstance(p := item.data(Qt.ItemDataRole.UserRole)["path"], pathlib.Path):
-                    item.setText(p.name)
-                elif isinstance(p, shared.URL_with_filename):
-                    item.setText("%s [URL]" % p.name)
+        self.model.setShowFullPath(not self.model.show_full_path)
 
     def selectAll(self):
         self.table.selectAll()
         self.table.setFocus()
 
     def removeFiles(self):
-        indexes = sorted(list(set(i.row() for i in self.table.selectedIndexes())), reverse=True)
-        for i in indexes:
-            if self.table.item(i, 1).data(Qt.ItemDataRole.UserRole)["status"] not in [
-                shared.FileStatus.Paused,
-                shared.FileStatus.Queued,
-                shared.FileStatus.Finished,
-                shared.FileStatus.Cancelled,
-                shared.FileStatus.Failed,
-            ]:
-                continue
-            if self.table.item(i, 1).data(Qt.ItemDataRole.UserRole)["status"] in [
-                shared.FileStatus.Queued,
-                shared.FileStatus.Paused,
-            ]:
-                self.queue_length -= 1
-                main_window.updateQueueLength()
-            self.table.removeRow(i)
+        removable = [
+            shared.FileStatus.Paused,
+            shared.FileStatus.Queued,
+            shared.FileStatus.Finished,
+            shared.FileStatus.Cancelled,
+            shared.FileStatus.Failed,
+            shared.FileStatus.Skipped,
+        ]
+        rows = [i for i in self.selectedRows() if self.model.jobs[i].status in removable]
+        for i in rows:
+            self.unpin(self.model.jobs[i])
+        with file_queue_lock:
+            self.model.removeJobs(rows)
+        main_window.updateQueueLength()
 
     def pause(self):
-        indexes = list(set(i.row() for i in self.table.selectedIndexes()))
-        for i in indexes:
-            if self.table.item(i, 1).data(Qt.ItemDataRole.UserRole)["status"] == shared.FileStatus.Queued:
-                self.set_cell_data(i, 1, "status", value=shared.FileStatus.Paused)
-                self.table.item(i, 1).setData(ProgressDelegate.TextRole, "Paused")
+        for i in self.selectedRows():
+            job = self.model.jobs[i]
+            if job.status == shared.FileStatus.Queued:
+                self.model.setStatus(job, shared.FileStatus.Paused, "Paused")
+                self.unpin(job)
 
     def resume(self):
-        indexes = list(set(i.row() for i in self.table.selectedIndexes()))
-        for i in indexes:
-            if self.table.item(i, 1).data(Qt.ItemDataRole.UserRole)["status"] in [
+        for i in self.selectedRows():
+            job = self.model.jobs[i]
+            if job.status in [
                 shared.FileStatus.Paused,
                 shared.FileStatus.Cancelled,
                 shared.FileStatus.Failed,
+                shared.FileStatus.Skipped,
             ]:
-                if self.table.item(i, 1).data(Qt.ItemDataRole.UserRole)["status"] in [
-                    shared.FileStatus.Cancelled,
-                    shared.FileStatus.Failed,
-                ]:
-                    self.queue_length += 1
-                    main_window.updateQueueLength()
-                self.set_cell_data(i, 1, "status", value=shared.FileStatus.Queued)
-                self.table.item(i, 1).setData(ProgressDelegate.TextRole, "Queued")
+                if remote.prefetchable(job.path) and self.prefetcher.limit > 0:
+                    job.local = None  # Downloaded again if it has been removed from the cache
+                    self.prefetcher.submit(job, job.path)
+                self.model.setStatus(job, shared.FileStatus.Queued, "Queued")
+        main_window.updateQueueLength()
+
+    def unpin(self, job):
+        """Let the downloaded file of a URL which is no longer queued be removed from the cache when space is needed,
+        so it doesn't hold space needed by queued URLs"""
+        if remote.prefetchable(job.path):
+            self.prefetcher.release(job, job.path)
 
     def moveTop(self):
-        indexes = sorted(list(set(i.row() for i in self.table.selectedIndexes())))
-        for i, index in enumerate(indexes):
-            if self.table.item(index, 1).data(Qt.ItemDataRole.UserRole)["status"] not in [
-                shared.FileStatus.Paused,
-                shared.FileStatus.Queued,
-            ]:
-                continue
-            self.table.insertRow(i)
-            for j in range(self.table.columnCount()):
-                self.table.setItem(i, j, self.table.item(index + 1, j).clone())
-            self.table.removeRow(index + 1)
+        rows = [
+            i
+            for i in self.selectedRows()
+            if self.model.jobs[i].status in [shared.FileStatus.Paused, shared.FileStatus.Queued]
+        ]
+        with file_queue_lock:
+            self.model.moveToTop(rows)
 
-    def getFirstQueued(self):
+    def getFirstQueued(self, preferred_model=None):
+        """Get the first queued job, preferring jobs using `preferred_model` to avoid swapping models"""
         with file_queue_lock:
-            self.setEnabled(False)
-            for i in range(self.table.rowCount()):
-                if self.table.item(i, 1).data(Qt.ItemDataRole.UserRole)["status"] == shared.FileStatus.Queued:
-                    self.setEnabled(True)
-                    return i
-            self.setEnabled(True)
-            return None
+            first = self.model.firstQueued()
+            if preferred_model is not None and (job := self.model.firstQueued(preferred_model)) is not None:
+                # Unless it is still downloading and other files are ready
+                if job.local is not None or first.local is None:
+                    return job
+            return first
+
+    def estimateRemaining(self, realtime_factors):
+        """Estimate seconds needed to separate the current file and queued files, from durations of queued files and
+        realtime factors by (model, device). The realtime factor of the current file is used for its model and device
+        once it is stable. Files not probed are assumed to be as long as the average of others. Returns estimated
+        seconds and the number of files which can't be estimated."""
+        remaining = 0.0
+        unknown = 0
+        factors = dict(realtime_factors)
+        if (current := metrics.current()) is not None:
+            if current["eta"] is not None:
+                remaining += current["eta"]
+            else:
+                unknown += 1
+            if current["realtime_factor"] and current["progress"] >= 0.05:
+                factors[(current["model"], current["device"])] = current["realtime_factor"]
+        for key, count in self.model.queued_count.items():
+            if count <= 0:
+                continue
+            probed = count - self.model.queued_unprobed[key]
+            if key not in factors or probed <= 0:
+                unknown += count
+                continue
+            remaining += max(0.0, self.model.queued_seconds[key]) * count / probed / factors[key]
+        return remaining, unknown
+
+
+def modelKey(params):
+    """The (model_type, model, repo) tuple of a queued file's parameters"""
+    return (params["model_type"], params["model"], params["repo"])
 
 
 class DelegateCallback(DelegateCombiner):
@@ -2255,6 +3074,20 @@ class Mixer(QWidget):
         else:
             self.slider_value_changed_by_user = True
 
+    def stemWeights(self):
+        """Names and weights (in percent) of enabled stems"""
+        return [
+            [
+                self.outputs_table.item(i, 0).text(),
+                [
+                    int(self.outputs_table.item(i, j).data(Qt.ItemDataRole.EditRole)[:-2])
+                    for j in range(1, self.outputs_table.columnCount())
+                ],
+            ]
+            for i in range(self.outputs_table.rowCount())
+            if self.outputs_table.getCheckState(i)
+        ]
+
     def mix(self, origin: "separator.torch.Tensor", separated: "dict[str, separator.torch.Tensor]"):
         for i in range(self.outputs_table.rowCount()):
             if self.outputs_table.getCheckState(i):
@@ -2274,17 +3107,30 @@ class Mixer(QWidget):
 
 class SeparationControl(QWidget):
     startSeparateSignal = Signal(bool)
-    currentFinishedSignal = Signal(int, QTableWidgetItem)
-    setModelProgressSignal = Signal(float)
-    setAudioProgressSignal = Signal(float, QTableWidgetItem)
-    setStatusSignal = Signal(int, QTableWidgetItem)
+    currentFinishedSignal = Signal(int, object)
+    setStatusSignal = Signal(int, object)
+    setTextSignal = Signal(str, object)
+    progress_interval = 50  # ms, progress is shown at most 20 times per second
 
     def __init__(self):
         super().__init__()
 
+        # Latest progress written by the separation thread and the last one shown. The separation thread only replaces
+        # the tuples, so no lock is needed, and only the latest progress is shown when the timer fires.
+        self.model_progress = self.shown_model_progress = None
+        self.audio_progress = self.shown_audio_progress = None
+        self.progress_timer = QTimer()
+        self.progress_timer.setInterval(self.progress_interval)
+        self.progress_timer.timeout.connect(self.showProgress)
+        self.realtime_factors = {}
+        self.eta_timer = QTimer()
+        self.eta_timer.setInterval(1000)
+        self.eta_timer.timeout.connect(self.showQueueEta)
+
         self.stop_now = False
         self.not_paused = threading.Event()
         self.not_paused.set()
+        self.workers = worker.WorkerPool()
 
         self.start_button = QPushButton()
         self.start_button.setText("Start separation")
@@ -2325,23 +3171,49 @@ class SeparationControl(QWidget):
         self.widget_layout.addWidget(self.current_model_progressbar, 1, 1)
         self.widget_layout.addWidget(self.current_audio_progressbar, 2, 1)
 
+        self.queue_eta_label = QLabel()
+        self.queue_eta_label.setText("Queue:")
+        self.queue_eta = QLabel()
+        self.queue_eta.setToolTip(
+            "Estimated from durations of queued files and the speed of previously separated files using the same "
+            "model and device"
+        )
+        self.widget_layout.addWidget(self.queue_eta_label, 3, 0)
+        self.widget_layout.addWidget(self.queue_eta, 3, 1)
+
         self.setLayout(self.widget_layout)
 
         self.startSeparateSignal.connect(self.startSeparation)
         self.currentFinishedSignal.connect(self.currentFinished)
-        self.setModelProgressSignal.connect(self.setModelProgressEmit)
-        self.setAudioProgressSignal.connect(self.setAudioProgressEmit)
         self.setStatusSignal.connect(self.setStatusForItem)
+        self.setTextSignal.connect(lambda text, job: main_window.file_queue.model.setText(job, text))
 
-    def setModelProgressEmit(self, value):
-        self.current_model_progressbar.setValue(int(value * 65536))
-
-    def setAudioProgressEmit(self, value, item: QTableWidgetItem):
-        self.current_audio_progressbar.setValue(int(value * 65536))
-        item.setData(ProgressDelegate.ProgressRole, value)
-        main_window.file_queue.set_cell_item_data(item, "status", value=shared.FileStatus.Separating)
-        main_window.file_queue.set_cell_item_data(item, "progress", value=value)
-        item.setData(ProgressDelegate.TextRole, "")
+    def showQueueEta(self):
+        remaining, unknown = main_window.file_queue.estimateRemaining(self.realtime_factors)
+        if remaining <= 0 and unknown:
+            self.queue_eta.setText("%d files can't be estimated" % unknown)
+            return
+        finish = datetime.datetime.now() + datetime.timedelta(seconds=remaining)
+        text = "%s remaining, finishing at %s" % (
+            shared.HTime(remaining),
+            finish.strftime("%H:%M" if finish.date() == datetime.date.today() else "%Y-%m-%d %H:%M"),
+        )
+        if unknown:
+            text += " (%d more files can't be estimated)" % unknown
+        self.queue_eta.setText(text)
+
+    def showProgress(self):
+        """Show the latest progress written by the separation thread, called by the timer and before the status of a
+        file changes"""
+        if (progress := self.model_progress) is not self.shown_model_progress:
+            self.shown_model_progress = progress
+            self.current_model_progressbar.setValue(int(progress[0] * 65536))
+        if (progress := self.audio_progress) is not self.shown_audio_progress:
+            self.shown_audio_progress = progress
+            value, job = progress
+            self.current_audio_progressbar.setValue(int(value * 65536))
+            if job.status in [shared.FileStatus.Reading, shared.FileStatus.Separating]:
+                main_window.file_queue.model.setProgress(job, value)
 
     def setModelProgress(self, value):
         global main_window
@@ -2352,9 +3224,9 @@ class SeparationControl(QWidget):
             main_window.status_prefix = "(Paused) "
             self.not_paused.wait()
         main_window.save_options.ChangeParamEvent.wait()
-        self.setModelProgressSignal.emit(value)
+        self.model_progress = (value,)
 
-    def setAudioProgress(self, value, item: QTableWidgetItem):
+    def setAudioProgress(self, value, job: Job):
         global main_window
         if self.stop_now:
             self.stop_now = False
@@ -2363,52 +3235,68 @@ class SeparationControl(QWidget):
             main_window.status_prefix = "(Paused) "
             self.not_paused.wait()
         main_window.save_options.ChangeParamEvent.wait()
-        self.setAudioProgressSignal.emit(value, item)
+        self.audio_progress = (value, job)
 
-    def setStatusForItem(self, status, item: QTableWidgetItem):
-        main_window.file_queue.set_cell_item_data(item, "status", value=status)
+    def setStatusForItem(self, status, job: Job):
+        self.showProgress()
         match status:
             case shared.FileStatus.Reading:
-                item.setData(ProgressDelegate.TextRole, "Reading")
+                main_window.file_queue.model.setStatus(job, status, "Reading")
             case shared.FileStatus.Writing:
-                item.setData(ProgressDelegate.TextRole, "Writing")
-
-    def currentFinished(self, status, item: QTableWidgetItem):
+                main_window.file_queue.model.setStatus(job, status, "Writing")
+            case _:
+                main_window.file_queue.model.setStatus(job, status)
+
+    def currentFinished(self, status, job: Job):
+        if status != shared.FileStatus.Writing:
+            # Files failed or cancelled before saving
+            main_window.save_options.releaseReuseKey(job)
+        self.showProgress()
+        model = main_window.file_queue.model
+        # The next file is started when this one starts writing, reused files are never written
+        restart = status != shared.FileStatus.Finished
         match status:
             case shared.FileStatus.Finished:
-                item.setData(ProgressDelegate.TextRole, "Finished")
-                main_window.file_queue.set_cell_item_data(item, "status", value=shared.FileStatus.Finished)
-                main_window.setStatusText.emit(
-                    "Separation finished: %s" % main_window.file_queue.table.item(item.row(), 0).text()
-                )
+                main_window.setStatusText.emit("Separation finished: %s" % model.displayName(job))
+                self.realtime_factors = performance.realtimeFactors()
                 skipped_stems = []
-                outputs_data = item.data(Qt.ItemDataRole.UserRole)["outputs"]
-                for k, v in outputs_data.items():
+                for k, v in job.outputs.items():
                     if "status" in v and v["status"] == shared.FileStatus.Skipped:
                         skipped_stems.append(k)
+                reused = sorted({str(v["reused"]) for v in job.outputs.values() if "reused" in v})
                 if skipped_stems:
-                    item.setData(ProgressDelegate.TextRole, "Outfile Skipped")
-                    item.setToolTip(
+                    job.tooltip = (
                         "Some stems were skipped due to the output file already existing.\n"
                         "Skipped stems: %s" % ", ".join(skipped_stems)
                     )
+                if reused:
+                    job.tooltip = (job.tooltip + "\n\n" if job.tooltip else "") + (
+                        "Same audio was separated before, outputs were copied from:\n%s" % "\n".join(reused)
+                    )
+                    model.setStatus(job, status, "Reused")
+                    restart = True
+                else:
+                    model.setStatus(job, status, "Outfile Skipped" if skipped_stems else "Finished")
             case shared.FileStatus.Failed:
-                item.setData(ProgressDelegate.TextRole, "Failed")
-                main_window.file_queue.set_cell_item_data(item, "status", value=shared.FileStatus.Failed)
-                item.setData(ProgressDelegate.ProgressRole, 0)
+                job.progress = 0.0
+                model.setStatus(job, status, "Failed")
             case shared.FileStatus.Cancelled:
-                item.setData(ProgressDelegate.TextRole, "Cancelled")
-                main_window.file_queue.set_cell_item_data(item, "status", value=shared.FileStatus.Cancelled)
-                item.setData(ProgressDelegate.ProgressRole, 0)
+                job.progress = 0.0
+                model.setStatus(job, status, "Cancelled")
+            case shared.FileStatus.Skipped:
+                main_window.setStatusText.emit("Skipped: %s" % model.displayName(job))
+                job.progress = 1.0
+                job.tooltip = "All output files already exist"
+                model.setStatus(job, status, "Skipped")
             case shared.FileStatus.Writing:
-                item.setData(ProgressDelegate.TextRole, "Writing")
-                main_window.file_queue.set_cell_item_data(item, "status", value=shared.FileStatus.Writing)
+                model.setStatus(job, status, "Writing")
+        if status != shared.FileStatus.Writing:
+            main_window.file_queue.unpin(job)
         if self.stop_now:
             self.stop_now = False
         if status not in [shared.FileStatus.Writing]:
-            main_window.file_queue.queue_length -= 1
             main_window.updateQueueLength()
-        if status != shared.FileStatus.Finished:
+        if restart:
             self.start_button.setEnabled(True)
             self.startSeparateSignal.emit(True)
 
@@ -2416,11 +3304,21 @@ class SeparationControl(QWidget):
         global main_window
         if not self.start_button.isEnabled():
             return
-        if (index := main_window.file_queue.getFirstQueued()) is None:
+        if (job := main_window.file_queue.getFirstQueued(main_window.loaded_model)) is None:
             main_window.save_options.encoder_ffmpeg_box.setEnabled(True)
             main_window.setStatusText.emit("No more file to separate")
+            self.progress_timer.stop()
+            self.eta_timer.stop()
+            self.queue_eta.setText("")
+            main_window.separator.offloadModel()
+            self.workers.offload()
             separator.empty_cache()
             return
+        try:
+            templates = main_window.save_options.saveTemplates()
+        except ValueError as e:
+            main_window.showError.emit("Invalid save options", "Failed to parse save location or command: %s" % e)
+            return
         if "{stem}" not in main_window.save_options.loc_input.currentText() and not no_warning:
             main_window.showWarning.emit("Warning", '"{stem}" not included in save location. May cause overwrite.')
         if main_window.save_options.encoder_group.checkedId() == 1:
@@ -2436,28 +3334,77 @@ class SeparationControl(QWidget):
                     'Command does not contain "-v" for ffmpeg encoder. May output too much information to log file.',
                 )
         self.start_button.setEnabled(False)
-        file = main_window.file_queue.table.item(index, 0).data(Qt.ItemDataRole.UserRole)["path"]
-        item = main_window.file_queue.table.item(index, 1)
-        main_window.file_queue.set_cell_item_data(item, "status", value=shared.FileStatus.Separating)
-        item.setData(ProgressDelegate.ProgressRole, 0)
-        item.setData(ProgressDelegate.TextRole, "")
+        main_window.file_queue.model.setProgress(job, 0.0)
+        self.progress_timer.start()
+        if not self.eta_timer.isActive():
+            self.realtime_factors = performance.realtimeFactors()
+            self.eta_timer.start()
+        self.showQueueEta()
         main_window.save_options.encoder_ffmpeg_box.setEnabled(False)
         shared.SetSetting("in_gain", main_window.param_settings.in_gain_spinbox.value())
-        main_window.separator.startSeparate(
-            file,
-            item,
+        self.runJob(
+            job,
             main_window.param_settings.in_gain_spinbox.value(),
-            main_window.param_settings.segment_spinbox.value(),
-            main_window.param_settings.overlap_spinbox.value(),
-            main_window.param_settings.shifts_spinbox.value(),
-            main_window.param_settings.device_selector.currentData(),
+            templates,
+            main_window.save_options.skippedStems(),
+            main_window.save_options.reuseOptions(templates),
+        )
+
+    @shared.thread_wrapper(daemon=True)
+    def runJob(self, job: Job, in_gain, templates, skipped_stems, reuse_options):
+        """Load the model of the queued file if it is not the loaded one, then start separating it. `templates`,
+        `skipped_stems` and `reuse_options` are save options read on the main thread, used to skip files whose outputs
+        all exist and to reuse outputs of duplicate files"""
+        global main_window
+        params = job.params
+        if job.local is None:
+            main_window.setStatusText.emit("Downloading %s" % job.path)
+            self.setTextSignal.emit("Downloading", job)
+            main_window.file_queue.prefetcher.wait(job.path)
+        if main_window.save_options.outputsExist(job.path, params["model"], templates, skipped_stems):
+            logging.info("All outputs of %s exist, skipping" % job.path)
+            self.currentFinishedSignal.emit(shared.FileStatus.Skipped, job)
+            return
+        if modelKey(params) != main_window.loaded_model:
+            logging.info("Switching model to %s for %s" % (params["model"], job.path))
+            main_window.setStatusText.emit("Loading model %s" % params["model"])
+            self.setTextSignal.emit("Loading model", job)
+            if main_window.switchModel(*modelKey(params)) is not True:
+                main_window.showError.emit(
+                    "Load model failed",
+                    "Failed to load model %s. Check log file for more information." % params["model"],
+                )
+                self.currentFinishedSignal.emit(shared.FileStatus.Failed, job)
+                return
+            model_info = main_window.separator.modelInfo()
+            main_window.exec_in_main(lambda: main_window.model_selector.model_info.setText(model_info))
+        in_worker = main_window.exec_in_main(lambda: main_window.param_settings.separate_in_worker.isChecked())
+        main_window.separator.startSeparate(
+            job.path,
+            job,
+            in_gain,
+            min(params["segment"], math.floor(float(main_window.separator.max_segment) * 10) / 10),
+            params["overlap"],
+            params["shifts"],
+            params["device"],
             main_window.save_options.save,
             self.setModelProgress,
             self.setAudioProgress,
             self.setStatusSignal.emit,
             self.currentFinishedSignal.emit,
+            precision=params.get("precision", "fp32"),
+            compiled=params.get("compiled", False),
+            backend=params.get("backend", "torch"),
+            reuse_callback=lambda file, item, digest, tags: main_window.save_options.reuse(
+                file, item, digest, tags, reuse_options
+            ),
+            worker=self.workers.get(params["device"]) if in_worker else None,
         )
 
+    def isIdle(self):
+        """Whether no file is being separated or saved, so the model can be swapped at once"""
+        return self.start_button.isEnabled() and not main_window.save_options.saving
+
     def stopCurrent(self):
         if self.start_button.isEnabled():
             return
@@ -2479,6 +3426,7 @@ class SeparationControl(QWidget):
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Worker processes of frozen builds start here
     try:
         shared.InitializeFolder()
         log_filename = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_demucs_gui_log.log")
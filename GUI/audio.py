@@ -15,6 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import collections
+import hashlib
 import io
 import json
 import logging
@@ -24,10 +26,13 @@ import shlex
 import shutil
 import soundfile
 import soxr
+import tempfile
+import threading
 import tinytag
 import traceback
 import typing as tp
 
+import remote
 import shared
 
 if shared.GetSetting("prepend_ffmpeg_path", False):
@@ -46,6 +51,12 @@ ffmpeg_soxr_enabled = False
 format_filter = "libsndfile (%s)" % " ".join(f"*.{format}".lower() for format in soundfile.available_formats().keys())
 ffmpeg_protocols = set()
 
+# Extensions of common media files which FFmpeg can read, used to filter files when adding folders
+ffmpeg_extensions = set(
+    "3gp aac ac3 aif aifc ape asf avi dts eac3 f4a flv m2ts m4a m4b m4v mka mkv mov mp2 mp3 mp4 mpc mpeg mpg oga ogg "
+    "ogv opus ra rm spx tak tta ts wav wave weba webm wma wmv wv".split()
+)
+
 audio_tags_default = {
     "title": "",
     "artist": "",
@@ -69,6 +80,10 @@ audio_tags_default = {
     "grouping": "",
 }
 
+tags_cache_size = 256  # Tags of local files kept in memory, keyed by path, modification time and size
+tags_cache = collections.OrderedDict()
+tags_cache_lock = threading.Lock()
+
 
 def checkFFMpeg():
     try:
@@ -115,11 +130,36 @@ def checkFFMpeg():
         return False
 
 
+def soundfile_extensions():
+    """Lowercase extensions (without the dot) of files which can be read by soundfile"""
+    return {i.lower() for i in soundfile.available_formats()} | {"aif", "wave"}
+
+
+def readable_extensions():
+    """Lowercase extensions (without the dot) of files which can be read"""
+    extensions = soundfile_extensions()
+    if ffmpeg_available:
+        extensions |= ffmpeg_extensions
+    return extensions
+
+
 def gain(audio, gain_db):
     return audio * 10 ** (gain_db / 20)
 
 
+def pcm_digest(audio):
+    """Hash of decoded audio, which is the same for the same audio in different containers or with different tags"""
+    if not audio.flags.c_contiguous:
+        audio = audio.copy(order="C")
+    hasher = hashlib.blake2b(("%s %s|" % (audio.dtype.str, audio.shape)).encode("utf8"), digest_size=16)
+    hasher.update(audio.data)
+    return hasher.hexdigest()
+
+
 def read_audio(file, target_sr=None, update_status: tp.Callable[[str], None] = lambda _: None):
+    if (local := remote.cachedPath(file)) is not None:
+        logging.info("Reading downloaded file %s of %s" % (local, file))
+        file = local
     if not isinstance(file, pathlib.Path):
         logging.info("Not local path, skipping soundfile reader")
     else:
@@ -135,20 +175,142 @@ def read_audio(file, target_sr=None, update_status: tp.Callable[[str], None] = l
         logging.error("Failed to read with ffmpeg:\n" + traceback.format_exc())
 
 
+def tags_key(file):
+    """Key of the tags cache for a local file, or None if the file can't be cached"""
+    if not isinstance(file, pathlib.Path):
+        return None
+    try:
+        stat = file.stat()
+    except OSError:
+        return None
+    return (str(file), stat.st_mtime_ns, stat.st_size)
+
+
+def cached_tags(key):
+    if key is None:
+        return None
+    with tags_cache_lock:
+        if key not in tags_cache:
+            return None
+        tags_cache.move_to_end(key)
+        return tags_cache[key].copy()
+
+
+def cache_tags(key, tags):
+    if key is None:
+        return
+    with tags_cache_lock:
+        tags_cache[key] = tags.copy()
+        tags_cache.move_to_end(key)
+        while len(tags_cache) > tags_cache_size:
+            tags_cache.popitem(last=False)
+
+
 def read_audio_soundfile(file, target_sr=None, update_status: tp.Callable[[str], None] = lambda _: None):
     if callable(update_status):
         update_status(f"Reading audio: {file.name if hasattr(file, 'name') else file}")
-    audio, sr = soundfile.read(file, dtype="float32", always_2d=True)
-    logging.info(f"Read audio {file}: samplerate={sr} shape={audio.shape}")
-    assert audio.shape[0] > 0, "Audio is empty"
+    key = tags_key(file)
+    tags = cached_tags(key)
+    with open(file, "rb") as f:
+        audio, sr = soundfile.read(f, dtype="float32", always_2d=True)
+        logging.info(f"Read audio {file}: samplerate={sr} shape={audio.shape}")
+        assert audio.shape[0] > 0, "Audio is empty"
+        if tags is None:
+            # Tags are read from the same handle, so the file is opened only once
+            f.seek(0)
+            tags = read_tags_soundfile(file, f)
+            cache_tags(key, tags)
     if target_sr is not None and sr != target_sr:
         logging.info(f"Samplerate {sr} doesn't match target {target_sr}, resampling with SoXR")
         if callable(update_status):
             update_status("Resampling audio")
         audio = soxr.resample(audio, sr, target_sr, "VHQ")
+    logging.info(f"Tags: {tags}")
+    return audio, tags
+
+
+def read_audio_ffmpeg(file, target_sr=None, update_status: tp.Callable[[str], None] = lambda _: None):
+    if not ffmpeg_available:
+        raise NotImplementedError("FFmpeg is not available")
+    if callable(update_status):
+        update_status(f"Reading audio: {file.name if hasattr(file, 'name') else file}")
+    key = tags_key(file)
+    tags = cached_tags(key)
+    command = ["ffmpeg", "-v", "level+warning", "-i", str(file), "-map", "a:0"]
+    if target_sr is not None:
+        command += ["-ar", str(target_sr)]
+        if ffmpeg_soxr_enabled:
+            command += ["-af", "aresample=resampler=soxr:precision=28"]
+    command += ["-c:a", "pcm_f32le", "-f", "wav", "-"]
+    metadata_file = None
+    if tags is None:
+        # Write tags to a second output in the same pass instead of starting ffprobe. Tags of the first stream are
+        # mapped first so they take precedence over global tags, the same as `parse_ffprobe_tags`
+        fd, metadata_file = tempfile.mkstemp(prefix="demucs_gui_", suffix=".txt")
+        os.close(fd)
+        command += ["-map_metadata", "0:s:0", "-map_metadata", "0", "-fflags", "+bitexact", "-f", "ffmetadata"]
+        command += ["-y", metadata_file]
+    try:
+        p = shared.Popen(command)
+        logging.debug("ffmpeg command: %s" % shlex.join(p.args))
+        ffmpeg_output, ffmpeg_log = p.communicate()
+        wav_buffer = io.BytesIO(ffmpeg_output)
+        del ffmpeg_output
+        if ffmpeg_log:
+            logging.warning("ffmpeg output:\n" + ffmpeg_log.decode(errors="replace"))
+        assert p.returncode == 0, "FFmpeg failed with code %d" % p.returncode
+        if metadata_file is not None:
+            with open(metadata_file, "rb") as f:
+                metadata_str = f.read().decode(errors="replace")
+            logging.info("ffmetadata output:\n" + metadata_str)
+            tags = parse_ffmetadata_tags(metadata_str)
+            cache_tags(key, tags)
+    finally:
+        if metadata_file is not None:
+            try:
+                os.remove(metadata_file)
+            except OSError:
+                pass
+    wav_buffer.seek(0)
+    audio, sr = soundfile.read(wav_buffer, dtype="float32", always_2d=True)
+    logging.info(f"Read audio {file}: samplerate={sr} shape={audio.shape}")
+    logging.info(f"Tags: {tags}")
+    assert audio.shape[0] > 0, "Audio is empty"
+    return audio, tags
+
+
+def read_tags(file):
+    """Read only tags of a file, which are the same as `read_audio` returns in most cases. Used when tags are needed
+    before reading the audio"""
+    if (local := remote.cachedPath(file)) is not None:
+        file = local
+    key = tags_key(file)
+    if (tags := cached_tags(key)) is not None:
+        return tags
+    if isinstance(file, pathlib.Path) and file.suffix[1:].lower() in soundfile_extensions():
+        tags = read_tags_soundfile(file)
+    elif not ffmpeg_available:
+        return audio_tags_default.copy()
+    else:
+        p = shared.Popen(
+            ["ffprobe", "-v", "level+warning", "-of", "json=c=1", "-show_format", "-show_streams", str(file)]
+        )
+        logging.debug("ffprobe command: %s" % shlex.join(p.args))
+        metadata_str = p.communicate()[0].decode(errors="replace")
+        if p.returncode != 0:
+            logging.error("FFprobe failed with code %d, skipping tags" % p.returncode)
+            return audio_tags_default.copy()
+        tags = parse_ffprobe_tags(metadata_str)
+    cache_tags(key, tags)
+    return tags
+
+
+def read_tags_soundfile(file, file_obj=None):
+    """Tags of a file read by soundfile, read with tinytag, or ffprobe if tinytag fails. If `file_obj` is given, tags
+    are read from it instead of opening the file again"""
     tags = audio_tags_default.copy()
     try:
-        tags_get = tinytag.TinyTag.get(file).as_dict()
+        tags_get = tinytag.TinyTag.get(str(file), duration=False, file_obj=file_obj).as_dict()
         tags_get.update(tags_get["extra"] or {})
         for i in ["audio_offset", "duration", "filesize", "bitrate", "channels", "samplerate", "extra", "bitdepth"]:
             tags_get.pop(i, None)
@@ -162,7 +324,7 @@ def read_audio_soundfile(file, target_sr=None, update_status: tp.Callable[[str],
     except Exception:
         if not ffmpeg_available:
             logging.error("Failed to read tags with tinytag, FFmpeg is not available, skipping tags")
-            return audio, tags
+            return tags
         logging.error("Failed to read tags with tinytag, retrying with ffmpeg")
         p = shared.Popen(
             ["ffprobe", "-v", "level+warning", "-of", "json=c=1", "-show_streams", "-show_format", str(file)]
@@ -171,40 +333,14 @@ def read_audio_soundfile(file, target_sr=None, update_status: tp.Callable[[str],
         metadata_str = p.communicate()[0].decode(errors="replace")
         if p.returncode != 0:
             logging.error("FFprobe failed with code %d, skipping tags" % p.returncode)
-            return audio, tags
+            return tags
         logging.info("ffprobe output:\n" + metadata_str)
-        try:
-            metadata = json.loads(metadata_str)
-        except json.JSONDecodeError:
-            logging.error("Failed to parse ffprobe output")
-        else:
-            tags.update(
-                {
-                    str(k).lower(): (str(v) if v is not None else "")
-                    for k, v in metadata.get("format", {}).get("tags", {}).items()
-                }
-            )
-            tags.update(
-                {
-                    str(k).lower(): str(v) if not isinstance(v, float) else "%.6f" % v
-                    for k, v in metadata.get("streams", [{}])[0].get("tags", {}).items()
-                    if isinstance(v, (str, int, float))
-                }
-            )
-    logging.info(f"Tags: {tags}")
-    return audio, tags
+        tags = parse_ffprobe_tags(metadata_str)
+    return tags
 
 
-def read_audio_ffmpeg(file, target_sr=None, update_status: tp.Callable[[str], None] = lambda _: None):
-    if not ffmpeg_available:
-        raise NotImplementedError("FFmpeg is not available")
-    if callable(update_status):
-        update_status(f"Reading file metadata: {file.name if hasattr(file, 'name') else file}")
-    p = shared.Popen(["ffprobe", "-v", "level+warning", "-of", "json=c=1", "-show_streams", "-show_format", str(file)])
-    logging.debug("ffprobe command: %s" % shlex.join(p.args))
-    metadata_str = p.communicate()[0].decode(errors="replace")
-    assert p.returncode == 0, "FFprobe failed with code %d" % p.returncode
-    logging.info("ffprobe output:\n" + metadata_str)
+def parse_ffprobe_tags(metadata_str):
+    """Tags of the format and the first stream in JSON output of ffprobe"""
     tags = audio_tags_default.copy()
     try:
         metadata = json.loads(metadata_str)
@@ -224,28 +360,92 @@ def read_audio_ffmpeg(file, target_sr=None, update_status: tp.Callable[[str], No
                 if isinstance(v, (str, int, float))
             }
         )
-    if callable(update_status):
-        update_status(f"Reading audio: {file.name if hasattr(file, 'name') else file}")
-    command = ["ffmpeg", "-v", "level+warning", "-i", str(file), "-map", "a:0"]
-    if target_sr is not None:
-        command += ["-ar", str(target_sr)]
-        if ffmpeg_soxr_enabled:
-            command += ["-af", "aresample=resampler=soxr:precision=28"]
-    command += ["-c:a", "pcm_f32le", "-f", "wav", "-"]
-    p = shared.Popen(command)
-    logging.debug("ffmpeg command: %s" % shlex.join(p.args))
-    ffmpeg_output, ffmpeg_log = p.communicate()
-    wav_buffer = io.BytesIO(ffmpeg_output)
-    del ffmpeg_output
-    if ffmpeg_log:
-        logging.warning("ffmpeg output:\n" + ffmpeg_log.decode(errors="replace"))
-    assert p.returncode == 0, "FFmpeg failed with code %d" % p.returncode
-    wav_buffer.seek(0)
-    audio, sr = soundfile.read(wav_buffer, dtype="float32", always_2d=True)
-    logging.info(f"Read audio {file}: samplerate={sr} shape={audio.shape}")
-    logging.info(f"Tags: {tags}")
-    assert audio.shape[0] > 0, "Audio is empty"
-    return audio, tags
+    return tags
+
+
+def parse_ffmetadata_tags(metadata_str):
+    """Global tags in an FFmpeg metadata file, see https://ffmpeg.org/ffmpeg-formats.html#Metadata-2"""
+    tags = audio_tags_default.copy()
+    lines = metadata_str.splitlines()
+    if not lines or not lines[0].startswith(";FFMETADATA"):
+        logging.error("Failed to parse ffmetadata output")
+        return tags
+    entry = ""
+    entries = []
+    for line in lines[1:]:
+        if not entry and (not line or line[0] in ";#"):
+            continue
+        if not entry and line.startswith("["):
+            break  # Sections of streams and chapters follow global tags
+        # A backslash at the end of a line escapes the newline
+        escaped = (len(line) - len(line.rstrip("\\"))) % 2 == 1
+        entry += line[:-1] + "\n" if escaped else line
+        if not escaped:
+            entries.append(entry)
+            entry = ""
+    for entry in entries:
+        key, value, escape, equal = "", "", False, False
+        for char in entry:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+                continue
+            elif char == "=" and not equal:
+                equal = True
+                continue
+            if equal:
+                value += char
+            else:
+                key += char
+        if equal:
+            tags[key.lower()] = value
+    return tags
+
+
+def probe_audio_soundfile(file):
+    """Duration (in seconds), sample rate, channels and format of an audio file read by soundfile"""
+    info = soundfile.info(str(file))
+    return {"duration": info.duration, "samplerate": info.samplerate, "channels": info.channels, "format": info.format}
+
+
+def probe_audio_ffprobe(files):
+    """Probe files with ffprobe like `probe_audio_soundfile`. One ffprobe process is started for each file at the same
+    time. Returns a list of info dicts, or the exceptions raised when probing each file."""
+    if not ffmpeg_available:
+        raise NotImplementedError("FFmpeg is not available")
+    processes = []
+    for file in files:
+        try:
+            processes.append(
+                shared.Popen(
+                    ["ffprobe", "-v", "error", "-of", "json=c=1", "-select_streams", "a:0", "-show_entries"]
+                    + ["stream=sample_rate,channels:format=duration,format_name", str(file)]
+                )
+            )
+        except Exception as e:
+            processes.append(e)
+    results = []
+    for p in processes:
+        if isinstance(p, Exception):
+            results.append(p)
+            continue
+        out, err = p.communicate()
+        try:
+            assert p.returncode == 0, "FFprobe failed with code %d: %s" % (p.returncode, err.decode(errors="replace"))
+            metadata = json.loads(out.decode(errors="replace"))
+            assert metadata.get("streams"), "No audio stream found"
+            results.append(
+                {
+                    "duration": float(metadata["format"]["duration"]),
+                    "samplerate": int(metadata["streams"][0]["sample_rate"]),
+                    "channels": int(metadata["streams"][0]["channels"]),
+                    "format": metadata["format"]["format_name"].split(",")[0].upper(),
+                }
+            )
+        except Exception as e:
+            results.append(e)
+    return results
 
 
 def save_audio_sndfile(file, audio, smp_fmt, sr, update_status: tp.Callable[[str], None] = lambda _: None):
@@ -0,0 +1,83 @@
+# Demucs-GUI
+# Copyright (C) 2022-2025  Demucs-GUI developers
+# See https://github.com/CarlGao4/Demucs-Gui for more information
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Outputs of separated files, keyed by a hash of the decoded audio and the settings used to separate and save it.
+
+Files with the same audio, like copies in different folders or the same track in different containers, reuse the
+outputs of the first one instead of being separated again."""
+
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+import shared
+
+_lock = threading.Lock()
+
+
+def databasePath():
+    return shared.configPath / "outputs.db"
+
+
+def connect(path=None):
+    conn = sqlite3.connect(str(path or databasePath()), timeout=10)
+    conn.execute("CREATE TABLE IF NOT EXISTS outputs (key TEXT PRIMARY KEY, finished_at REAL, outputs TEXT)")
+    return conn
+
+
+def lookup(key, path=None):
+    """Outputs recorded for `key` as a dict of {stem: path}, None if not recorded or any output file was changed or
+    removed since"""
+    try:
+        with _lock, contextlib.closing(connect(path)) as conn:
+            row = conn.execute("SELECT outputs FROM outputs WHERE key = ?", (key,)).fetchone()
+    except Exception:
+        logging.error("Failed to look up outputs:\n%s" % traceback.format_exc())
+        return None
+    if row is None:
+        return None
+    outputs = {}
+    for stem, (file, mtime, size) in json.loads(row[0]).items():
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return None
+        if stat.st_mtime_ns != mtime or stat.st_size != size:
+            return None
+        outputs[stem] = file
+    return outputs
+
+
+def record(key, outputs, path=None):
+    """Record outputs of a file, `outputs` is a dict of {stem: path}"""
+    try:
+        files = {}
+        for stem, file in outputs.items():
+            stat = os.stat(file)
+            files[stem] = (str(file), stat.st_mtime_ns, stat.st_size)
+        with _lock, contextlib.closing(connect(path)) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO outputs (key, finished_at, outputs) VALUES (?, ?, ?)",
+                (key, time.time(), json.dumps(files)),
+            )
+    except Exception:
+        logging.error("Failed to record outputs:\n%s" % traceback.format_exc())
@@ -0,0 +1,180 @@
+# Demucs-GUI
+# Copyright (C) 2022-2025  Demucs-GUI developers
+# See https://github.com/CarlGao4/Demucs-Gui for more information
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""HTTP(S) client shared by downloads, URL name probing and update checks.
+
+Connections are kept alive in a pool per host and reused by later requests. The number of connections to a host is
+limited, requests wait for a free connection when the limit is reached. Requests through a proxy configured in the
+environment are sent by urllib instead, without pooling."""
+
+import http.client
+import logging
+import ssl
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+max_connections = 6  # Per host
+timeout = 30
+max_redirects = 10
+max_drain = 65536  # Unread bodies up to this size are read when closing a response so the connection can be reused
+user_agent = "Demucs-GUI"
+
+
+class Response:
+    """Response of `Client.request`, which must be closed (or used in a `with` statement) to return the connection to
+    the pool. `status`, `reason`, `headers` and `url` (after redirects) are like those of `urllib.request.urlopen`"""
+
+    def __init__(self, client, key, conn, response, url):
+        self.client = client
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        return self.response.read(amt)
+
+    def close(self):
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        if not self.response.isclosed() and self.response.length is not None and self.response.length <= max_drain:
+            try:
+                self.response.read()
+            except Exception:
+                pass
+        if self.response.isclosed() and not self.response.will_close:
+            self.client.release(self.key, conn)
+        else:
+            # The rest of the body is too long to read before reusing the connection
+            self.response.close()
+            conn.close()
+            self.client.release(self.key, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+class Client:
+    def __init__(self, max_connections=max_connections, timeout=timeout):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.idle = {}  # {(scheme, host, port): [connection]}
+        self.limits = {}  # {(scheme, host, port): semaphore}
+        self.lock = threading.Lock()
+        self.context = None
+
+    def connection(self, key):
+        """Take an idle connection to the host, or open a new one. Returns the connection and whether it is reused"""
+        with self.lock:
+            if self.idle.get(key):
+                return self.idle[key].pop(), True
+        return self.newConnection(key), False
+
+    def newConnection(self, key):
+        scheme, host, port = key
+        if scheme == "https":
+            with self.lock:
+                if self.context is None:
+                    self.context = ssl.create_default_context()
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def release(self, key, conn):
+        """Return a connection to the pool after its response is closed, None if the connection is closed"""
+        with self.lock:
+            if conn is not None:
+                self.idle.setdefault(key, []).append(conn)
+            self.limits[key].release()
+
+    def close(self):
+        """Close idle connections, connections in use are closed when their responses are closed"""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+    def request(self, url, method="GET", headers=None):
+        """Send a request, following redirects. Raises `urllib.error.HTTPError` for error statuses like urllib"""
+        url = str(url)
+        headers = {"User-Agent": user_agent, **(headers or {})}
+        for _ in range(max_redirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            scheme = parts.scheme.lower()
+            if scheme not in ("http", "https"):
+                raise ValueError("Unsupported URL scheme: %s" % url)
+            proxies = urllib.request.getproxies()
+            if scheme in proxies and not urllib.request.proxy_bypass(parts.hostname or ""):
+                return urllib.request.urlopen(
+                    urllib.request.Request(url, headers=headers, method=method), timeout=self.timeout
+                )
+            key = (scheme, parts.hostname, parts.port or (443 if scheme == "https" else 80))
+            response = self.send(key, method, parts._replace(scheme="", netloc="").geturl() or "/", headers, url)
+            if response.status in (301, 302, 303, 307, 308) and (location := response.headers.get("Location")):
+                response.close()
+                url = urllib.parse.urljoin(url, location)
+                if response.status == 303:
+                    method = "GET" if method != "HEAD" else method
+                continue
+            if response.status >= 400:
+                response.close()
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+            return response
+        raise urllib.error.URLError("Too many redirects: %s" % url)
+
+    def send(self, key, method, path, headers, url):
+        with self.lock:
+            limit = self.limits.setdefault(key, threading.BoundedSemaphore(self.max_connections))
+        limit.acquire()
+        try:
+            conn, reused = self.connection(key)
+            while True:
+                try:
+                    conn.request(method, path, headers=headers)
+                    response = conn.getresponse()
+                    break
+                except Exception as e:
+                    conn.close()
+                    if not reused or not isinstance(e, (http.client.RemoteDisconnected, ConnectionError)):
+                        raise
+                    # The server closed the idle connection, retry with a new one
+                    logging.debug("Connection to %s:%d was closed (%s), reconnecting" % (key[1], key[2], e))
+                    conn, reused = self.newConnection(key), False
+        except BaseException:
+            limit.release()
+            raise
+        return Response(self, key, conn, response, url)
+
+
+_client = Client()
+
+
+def request(url, method="GET", headers=None):
+    """Send a request with the shared client, see `Client.request`"""
+    return _client.request(url, method, headers)
@@ -0,0 +1,218 @@
+# Demucs-GUI
+# Copyright (C) 2022-2025  Demucs-GUI developers
+# See https://github.com/CarlGao4/Demucs-Gui for more information
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import bisect
+import collections
+import json
+import logging
+import psutil
+import threading
+import time
+import traceback
+
+# Upper bounds (in seconds) of the buckets of segment latency histogram, the last bucket has no upper bound
+latency_buckets = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60]
+
+_current = None
+_current_lock = threading.Lock()
+
+
+def current():
+    """Snapshot of the metrics of the file being separated, or None if no file is being separated"""
+    with _current_lock:
+        metrics = _current
+    return metrics.snapshot() if metrics is not None else None
+
+
+class SeparationMetrics:
+    """Progress, throughput and resource usage of separating one file.
+
+    Times are measured on an "active clock", which doesn't advance while the separation is paused, so the rates and ETA
+    are not affected by pausing.
+
+    If `track_device` is False, the file is separated in another process, which reports `peak_rss` and
+    `peak_device_memory` of itself. `peak_rss` stays None if it doesn't report."""
+
+    def __init__(self, file, device, params=None, window=15.0, min_samples=20, max_samples=1024, track_device=True):
+        self.file = str(file)
+        self.audio_seconds = 0.0
+        self.device = device
+        self.track_device = track_device
+        self.params = params or {}
+        self.read_time = None
+        self.write_time = None
+        self.output_bytes = None
+        self.window = window
+        self.min_samples = min_samples
+        self.samples = collections.deque(maxlen=max_samples)
+        self.paused = 0.0
+        self.start_time = None
+        self.end_time = None
+        self.progress = 0.0
+        self.segments = {}
+        self.segments_finished = 0
+        self.latency_histogram = [0] * (len(latency_buckets) + 1)
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.peak_rss = 0 if track_device else None
+        self.peak_device_memory = None
+        self.status = None
+        self.lock = threading.Lock()
+
+    def now(self):
+        return time.perf_counter() - self.paused
+
+    def start(self):
+        global _current
+        if self.track_device:
+            resetDeviceMemoryPeak(self.device)
+        self.start_time = self.now()
+        self.samples.append((self.start_time, 0.0))
+        self.sampleMemory()
+        with _current_lock:
+            _current = self
+
+    def addPause(self, duration):
+        """Exclude time spent outside of separation (like being paused) from the active clock"""
+        self.paused += duration
+
+    def update(self, progress):
+        with self.lock:
+            self.progress = progress
+            self.samples.append((self.now(), progress))
+
+    def segmentStarted(self, key):
+        self.segments[key] = self.now()
+
+    def segmentFinished(self, key):
+        if (start := self.segments.pop(key, None)) is None:
+            return
+        latency = self.now() - start
+        with self.lock:
+            self.latency_histogram[bisect.bisect_left(latency_buckets, latency)] += 1
+            self.segments_finished += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def rate(self):
+        """Progress per second of active time, estimated from samples within the window"""
+        with self.lock:
+            now = self.now()
+            while len(self.samples) >= self.min_samples and now - self.samples[0][0] > self.window:
+                self.samples.popleft()
+            if len(self.samples) < 2:
+                return None
+            (t0, p0), (t1, p1) = self.samples[0], self.samples[-1]
+        if p1 == p0 or t1 == t0:
+            return None
+        return (p1 - p0) / (t1 - t0)
+
+    def eta(self):
+        """Estimated remaining seconds, None if unknown"""
+        rate = self.rate()
+        if rate is None:
+            return None
+        return (1 - self.progress) / rate
+
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time if self.end_time is not None else self.now()) - self.start_time
+
+    def realtimeFactor(self):
+        """Seconds of audio processed per second of active time"""
+        elapsed = self.elapsed()
+        if elapsed <= 0 or self.progress <= 0:
+            return None
+        return self.audio_seconds * self.progress / elapsed
+
+    def sampleMemory(self):
+        if self.track_device:
+            self.peak_rss = max(self.peak_rss, processMemory())
+
+    def finish(self, status):
+        """Stop the clock and write the metrics to the log as a JSON line"""
+        global _current
+        self.end_time = self.now()
+        self.status = status
+        self.sampleMemory()
+        if self.track_device:
+            self.peak_device_memory = deviceMemoryPeak(self.device)
+        with _current_lock:
+            if _current is self:
+                _current = None
+        logging.info("Separation metrics: %s" % json.dumps(self.snapshot()))
+
+    def snapshot(self):
+        eta = self.eta() if self.end_time is None else 0.0
+        with self.lock:
+            return {
+                "file": self.file,
+                "model": self.params.get("model"),
+                "device": self.device,
+                "status": self.status,
+                "audio_seconds": self.audio_seconds,
+                "progress": self.progress,
+                "elapsed": self.elapsed(),
+                "paused": self.paused,
+                "eta": eta,
+                "realtime_factor": self.realtimeFactor(),
+                "segments": self.segments_finished,
+                "segment_latency_mean": self.latency_total / self.segments_finished if self.segments_finished else None,
+                "segment_latency_max": self.latency_max,
+                "segment_latency_histogram": dict(
+                    zip(["<=%gs" % i for i in latency_buckets] + [">%gs" % latency_buckets[-1]], self.latency_histogram)
+                ),
+                "peak_rss": self.peak_rss,
+                "peak_device_memory": self.peak_device_memory,
+            }
+
+
+def processMemory():
+    """Resident memory of this process, 0 if unknown"""
+    try:
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return 0
+
+
+def resetDeviceMemoryPeak(device):
+    try:
+        import torch
+
+        if device.startswith("cuda"):
+            torch.cuda.reset_peak_memory_stats(device)
+        elif device.startswith("xpu"):
+            torch.xpu.reset_peak_memory_stats(device)
+    except Exception:
+        logging.debug("Failed to reset peak memory of %s:\n%s" % (device, traceback.format_exc()))
+
+
+def deviceMemoryPeak(device):
+    """Peak memory allocated by PyTorch on the device since `resetDeviceMemoryPeak`, None for CPU or if unknown"""
+    try:
+        import torch
+
+        if device.startswith("cuda"):
+            return torch.cuda.max_memory_allocated(device)
+        elif device.startswith("xpu"):
+            return torch.xpu.max_memory_allocated(device)
+        elif device.startswith("mps"):
+            return torch.mps.driver_allocated_memory()
+    except Exception:
+        logging.debug("Failed to get peak memory of %s:\n%s" % (device, traceback.format_exc()))
+    return None
@@ -0,0 +1,175 @@
+# Demucs-GUI
+# Copyright (C) 2022-2025  Demucs-GUI developers
+# See https://github.com/CarlGao4/Demucs-Gui for more information
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Performance history of separated files, stored in a SQLite database.
+
+Run this file to print a report aggregated by model and device:
+    python performance.py [--db PATH] [--by model,device,segment]
+"""
+
+import argparse
+import contextlib
+import logging
+import pathlib
+import sqlite3
+import sys
+import time
+import traceback
+
+import shared
+
+schema_version = 1
+
+columns = {
+    "finished_at": "REAL",
+    "file": "TEXT",
+    "status": "TEXT",
+    "model_type": "TEXT",
+    "model": "TEXT",
+    "repo": "TEXT",
+    "device": "TEXT",
+    "segment": "REAL",
+    "overlap": "REAL",
+    "shifts": "INTEGER",
+    "precision": "TEXT",
+    "compiled": "INTEGER",
+    "backend": "TEXT",
+    "audio_seconds": "REAL",
+    "read_time": "REAL",
+    "separate_time": "REAL",
+    "write_time": "REAL",
+    "realtime_factor": "REAL",
+    "segments": "INTEGER",
+    "segment_latency_mean": "REAL",
+    "segment_latency_max": "REAL",
+    "peak_rss": "INTEGER",
+    "peak_device_memory": "INTEGER",
+    "output_bytes": "INTEGER",
+}
+
+group_columns = ["model_type", "model", "repo", "device", "segment", "overlap", "shifts", "precision", "backend"]
+
+
+def databasePath():
+    return shared.configPath / "performance.db"
+
+
+def connect(path=None):
+    conn = sqlite3.connect(str(path or databasePath()), timeout=10)
+    conn.row_factory = sqlite3.Row
+    if conn.execute("PRAGMA user_version").fetchone()[0] < schema_version:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, %s)"
+                % ", ".join("%s %s" % (name, kind) for name, kind in columns.items())
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_model_device ON jobs (model, device)")
+            conn.execute("PRAGMA user_version = %d" % schema_version)
+    return conn
+
+
+def record(metrics, status, path=None):
+    """Append a record of a separated file from its `metrics.SeparationMetrics`"""
+    row = {**metrics.params, **metrics.snapshot()}
+    row.update(
+        finished_at=time.time(),
+        status=status,
+        read_time=metrics.read_time,
+        separate_time=row["elapsed"],
+        write_time=metrics.write_time,
+        output_bytes=metrics.output_bytes,
+        compiled=int(bool(row.get("compiled"))),
+    )
+    row = {name: row.get(name) for name in columns}
+    if row["repo"] is not None:
+        row["repo"] = str(row["repo"])
+    try:
+        with contextlib.closing(connect(path)) as conn, conn:
+            conn.execute(
+                "INSERT INTO jobs (%s) VALUES (%s)" % (", ".join(row), ", ".join("?" * len(row))), tuple(row.values())
+            )
+    except Exception:
+        logging.error("Failed to record performance of %s:\n%s" % (metrics.file, traceback.format_exc()))
+
+
+def report(group_by=("model_type", "model", "device"), path=None):
+    """Aggregate finished files by the given columns, the realtime factor is total audio length divided by total
+    separation time"""
+    group_by = [i for i in group_by if i in group_columns]
+    keys = ", ".join(group_by) if group_by else "'all'"
+    with contextlib.closing(connect(path)) as conn:
+        rows = conn.execute(
+            "SELECT %s, COUNT(*) AS files, SUM(audio_seconds) AS audio_seconds, "
+            "SUM(audio_seconds) / SUM(separate_time) AS realtime_factor, "
+            "AVG(read_time) AS read_time, AVG(separate_time) AS separate_time, AVG(write_time) AS write_time, "
+            "MAX(peak_rss) AS peak_rss, MAX(peak_device_memory) AS peak_device_memory, "
+            "SUM(output_bytes) AS output_bytes FROM jobs WHERE status = 'Finished' GROUP BY %s ORDER BY %s"
+            % (keys, keys, keys)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def realtimeFactors(path=None):
+    """Total audio length divided by total separation time of finished files, by (model, device)"""
+    try:
+        with contextlib.closing(connect(path)) as conn:
+            rows = conn.execute(
+                "SELECT model, device, SUM(audio_seconds) / SUM(separate_time) FROM jobs "
+                "WHERE status = 'Finished' AND separate_time > 0 GROUP BY model, device"
+            ).fetchall()
+    except Exception:
+        logging.error("Failed to read realtime factors:\n%s" % traceback.format_exc())
+        return {}
+    return {(model, device): factor for model, device, factor in rows if factor}
+
+
+def formatValue(key, value):
+    if value is None:
+        return "-"
+    if key in ["peak_rss", "peak_device_memory", "output_bytes"]:
+        return "%.1f MiB" % (value / 1048576)
+    if key in ["read_time", "separate_time", "write_time"]:
+        return "%.2fs" % value
+    if key == "audio_seconds":
+        return "%.1f min" % (value / 60)
+    if key == "realtime_factor":
+        return "%.2fx" % value
+    return str(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Performance report of Demucs-GUI")
+    parser.add_argument("--db", type=pathlib.Path, help="Path of performance.db")
+    parser.add_argument(
+        "--by", default="model_type,model,device", help="Comma separated columns: %s" % ", ".join(group_columns)
+    )
+    args = parser.parse_args(argv)
+    if args.db is None:
+        shared.InitializeFolder()
+    rows = report([i.strip() for i in args.by.split(",") if i.strip()], args.db)
+    if not rows:
+        print("No finished file recorded")
+        return 0
+    table = [list(rows[0].keys())] + [[formatValue(k, v) for k, v in row.items()] for row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(table[0]))]
+    for line in table:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
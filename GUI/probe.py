@@ -0,0 +1,108 @@
+# Demucs-GUI
+# Copyright (C) 2022-2025  Demucs-GUI developers
+# See https://github.com/CarlGao4/Demucs-Gui for more information
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Probe duration, sample rate, channels and format of queued files in background.
+
+Results are cached in a SQLite database, keyed by file path, modification time and size."""
+
+import concurrent.futures
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import traceback
+
+import shared
+
+batch_size = 64  # Files probed by a worker at once
+ffprobe_batch_size = 8  # ffprobe processes started at the same time
+
+
+def cachePath():
+    return shared.configPath / "probe.db"
+
+
+def connect(path=None):
+    conn = sqlite3.connect(str(path or cachePath()), timeout=10)
+    conn.execute("CREATE TABLE IF NOT EXISTS probe (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, info TEXT)")
+    return conn
+
+
+class Prober:
+    """Probe files in a thread pool. `callback` is called in the pool with a list of (item, info) of a batch, where
+    info is a dict of "duration", "samplerate", "channels" and "format", or a dict of "error" if the file can't be
+    read."""
+
+    def __init__(self, callback, workers=2, path=None):
+        self.callback = callback
+        self.path = path
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="probe")
+        self.cache_lock = threading.Lock()
+
+    def submit(self, items, key=lambda item: item):
+        """Probe files of items, `key` returns the path of an item"""
+        for i in range(0, len(items), batch_size):
+            self.pool.submit(self.probeBatch, [(item, key(item)) for item in items[i : i + batch_size]])
+
+    def probeBatch(self, batch):
+        try:
+            results = self.probe([path for _, path in batch])
+            self.callback([(item, info) for (item, _), info in zip(batch, results)])
+        except Exception:
+            logging.error("Failed to probe files:\n%s" % traceback.format_exc())
+
+    def probe(self, paths):
+        import audio
+
+        keys = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                keys.append((str(path), stat.st_mtime_ns, stat.st_size))
+            except OSError as e:
+                keys.append(None)
+                logging.warning("Failed to stat %s: %s" % (path, e))
+        results = [None if key is not None else {"error": "File not found"} for key in keys]
+        with self.cache_lock, contextlib.closing(connect(self.path)) as conn:
+            for i, key in enumerate(keys):
+                if key is None:
+                    continue
+                row = conn.execute("SELECT info FROM probe WHERE path = ? AND mtime = ? AND size = ?", key).fetchone()
+                if row is not None:
+                    results[i] = json.loads(row[0])
+        new = [i for i, info in enumerate(results) if info is None]
+        fallback = []
+        for i in new:
+            try:
+                results[i] = audio.probe_audio_soundfile(paths[i])
+            except Exception as e:
+                results[i] = {"error": str(e)}
+                if audio.ffmpeg_available:
+                    fallback.append(i)
+        for start in range(0, len(fallback), ffprobe_batch_size):
+            indexes = fallback[start : start + ffprobe_batch_size]
+            for i, info in zip(indexes, audio.probe_audio_ffprobe([paths[i] for i in indexes])):
+                results[i] = info if not isinstance(info, Exception) else {"error": str(info)}
+        if new:
+            with self.cache_lock, contextlib.closing(connect(self.path)) as conn, conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO probe (path, mtime, size, info) VALUES (?, ?, ?, ?)",
+                    [(*keys[i], json.dumps(results[i])) for i in new],
+                )
+        return results
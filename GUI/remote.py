@@ -0,0 +1,247 @@
+# Demucs-GUI
+# Copyright (C) 2022-2025  Demucs-GUI developers
+# See https://github.com/CarlGao4/Demucs-Gui for more information
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Download queued URLs to a local cache ahead of their turn, so that separation doesn't wait for the network.
+
+Only HTTP(S) URLs are downloaded, files of other protocols and files larger than the cache are streamed by FFmpeg
+when they are separated. Files of queued URLs are kept until they are released, released files stay in the cache and
+are removed, least recently used first, when space is needed."""
+
+import concurrent.futures
+import hashlib
+import logging
+import os
+import queue
+import threading
+import traceback
+import urllib.parse
+
+import httpclient
+import shared
+
+default_limit = 2 << 30  # Bytes of files in the cache
+chunk_size = 1 << 20
+
+
+def cacheDir():
+    return shared.configPath / "url_cache"
+
+
+def prefetchable(url):
+    return isinstance(url, shared.URL_with_filename) and url["scheme"].lower() in {"http", "https"}
+
+
+def cachePath(url):
+    """Path of the downloaded file of a URL. It keeps the extension in the URL so that the format can be detected, the
+    file name in headers isn't used to avoid a request"""
+    suffix = os.path.splitext(urllib.parse.unquote_plus(url["name"] or ""))[1]
+    return cacheDir() / (hashlib.sha256(str(url).encode("utf8")).hexdigest()[:32] + suffix[:16])
+
+
+def cachedPath(url):
+    """Path of the downloaded file of a URL, None if not downloaded"""
+    if not prefetchable(url):
+        return None
+    path = cachePath(url)
+    try:
+        if path.is_file():
+            os.utime(path)  # Mark as recently used
+            return path
+    except OSError:
+        logging.warning("Failed to find downloaded file of %s:\n%s" % (url, traceback.format_exc()))
+    return None
+
+
+def contentLength(url):
+    """Size of a URL from a HEAD request, 0 if unknown"""
+    try:
+        with httpclient.request(url, method="HEAD") as u:
+            return int(u.headers.get("Content-Length") or 0)
+    except Exception as e:
+        logging.info("Failed to get size of %s: %s" % (url, e))
+        return 0
+
+
+class Prefetcher:
+    """Download URLs in a thread pool. `callback` is called in the pool with each item submitted with a URL and the
+    downloaded path, or None if the URL isn't downloaded and should be streamed.
+
+    Before downloading, a worker waits while files of other queued URLs fill the cache, until some of them are
+    released. The separation thread never waits for space, it streams the URL instead, as space may only be freed
+    after it separates a file. Workers are daemon threads, so waiting workers don't block exiting."""
+
+    def __init__(self, callback, workers=3, limit=None):
+        self.callback = callback
+        self.limit = limit if limit is not None else shared.GetSetting("url_cache_limit", default_limit)
+        self.tasks = queue.Queue()
+        for i in range(workers):
+            threading.Thread(target=self.work, name="prefetch_%d" % i, daemon=True).start()
+        self.futures = {}  # {url: future}
+        self.items = {}  # {url: [item]}
+        self.pinned = {}  # {cache file name: size} of queued URLs, these files are never removed
+        self.waiting = set()  # Cache file names of URLs waiting in `reserve` for space
+        self.condition = threading.Condition()
+
+    def submit(self, item, url):
+        if self.limit <= 0:
+            return
+        with self.condition:
+            self.items.setdefault(str(url), []).append(item)
+            if str(url) not in self.futures:
+                self.pinned[cachePath(url).name] = 0
+                self.futures[str(url)] = future = concurrent.futures.Future()
+                self.tasks.put((future, url))
+
+    def wait(self, url):
+        """Wait until a URL is downloaded and return the path, or None if it should be streamed. If it isn't being
+        downloaded yet, it is downloaded at once instead of waiting for other URLs. If there is no space for it in the
+        cache, it is streamed instead of waiting for space"""
+        name = cachePath(url).name
+        with self.condition:
+            future = self.futures.get(str(url))
+            if name in self.waiting:
+                # Stop waiting for space, so the download is given up and the URL is streamed
+                self.pinned.pop(name, None)
+                self.condition.notify_all()
+                return None
+        if future is None:
+            return cachedPath(url)
+        if future.cancel():
+            return self.download(url, block=False)
+        return future.result()
+
+    def release(self, item, url):
+        """The item is no longer queued. If no other item uses the URL, its file can be removed when space is needed"""
+        with self.condition:
+            items = self.items.get(str(url), [])
+            if item in items:
+                items.remove(item)
+            if items:
+                return
+            self.items.pop(str(url), None)
+            if (future := self.futures.pop(str(url), None)) is not None:
+                future.cancel()
+            self.pinned.pop(cachePath(url).name, None)
+            self.condition.notify_all()
+
+    def reserve(self, url, size, block=True):
+        """Wait until `size` bytes of the cache can be used by the URL, removing released files if needed. Returns
+        False if the file doesn't fit in the cache, or the URL is released or streamed while waiting. If `block` is
+        False, returns False at once if there isn't enough space"""
+        if size > self.limit:
+            return False
+        name = cachePath(url).name
+        with self.condition:
+            while True:
+                if name not in self.pinned:
+                    return False
+                others = sum(self.pinned.values()) - self.pinned[name]
+                if others == 0 or others + size <= self.limit:
+                    break
+                if not block:
+                    return False
+                self.waiting.add(name)
+                try:
+                    self.condition.wait()
+                finally:
+                    self.waiting.discard(name)
+            self.pinned[name] = size
+            self.evict()
+        return True
+
+    def extend(self, url, size):
+        """Use `size` bytes of the cache for a URL being downloaded without a known size. Returns False if the file
+        doesn't fit in the cache, or the URL is released or streamed"""
+        name = cachePath(url).name
+        with self.condition:
+            if name not in self.pinned:
+                return False
+            if size > self.limit:
+                self.pinned[name] = 0
+                return False
+            self.pinned[name] = size
+            self.evict()
+        return True
+
+    def evict(self):
+        """Remove released files, least recently used first, until all files fit in the cache"""
+        files = []
+        for entry in os.scandir(cacheDir()):
+            if entry.is_file() and entry.name.removesuffix(".part") not in self.pinned:
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        used = sum(self.pinned.values()) + sum(i[1] for i in files)
+        for _, size, path in sorted(files):
+            if used <= self.limit:
+                break
+            try:
+                os.remove(path)
+                used -= size
+                logging.info("Removed %s from URL cache" % path)
+            except OSError as e:
+                logging.warning("Failed to remove %s from URL cache: %s" % (path, e))
+
+    def work(self):
+        while True:
+            future, url = self.tasks.get()
+            if future.set_running_or_notify_cancel():
+                future.set_result(self.download(url))
+
+    def download(self, url, block=True):
+        path = None
+        try:
+            path = self.fetch(url, block)
+        except Exception:
+            logging.error("Failed to download %s, it will be streamed:\n%s" % (url, traceback.format_exc()))
+        with self.condition:
+            items = list(self.items.get(str(url), []))
+        for item in items:
+            self.callback(item, path)
+        return path
+
+    def fetch(self, url, block=True):
+        if (path := cachedPath(url)) is not None:
+            logging.info("Using downloaded file %s of %s" % (path, url))
+            return path
+        cacheDir().mkdir(parents=True, exist_ok=True)
+        if not self.reserve(url, reserved := contentLength(url), block):
+            logging.info("Not downloading %s, it doesn't fit in the URL cache or is no longer queued" % url)
+            return None
+        path = cachePath(url)
+        tmp_file = path.with_name(path.name + ".part")
+        logging.info("Downloading %s to %s" % (url, path))
+        downloaded = 0
+        try:
+            with httpclient.request(url) as u:
+                size = int(u.headers.get("Content-Length") or 0)
+                with open(tmp_file, "wb") as f:
+                    while buffer := u.read(chunk_size):
+                        f.write(buffer)
+                        downloaded += len(buffer)
+                        if downloaded > reserved and not self.extend(url, downloaded):
+                            logging.info("Stopped downloading %s, it is larger than the URL cache or no longer queued" % url)
+                            return None
+            if size and downloaded < size:
+                raise ConnectionError("Connection closed after %d of %d bytes" % (downloaded, size))
+            os.replace(tmp_file, path)
+        finally:
+            tmp_file.unlink(missing_ok=True)
+        with self.condition:
+            if path.name in self.pinned:
+                self.pinned[path.name] = downloaded
+        logging.info("Downloaded %s (%s)" % (url, shared.HSize(downloaded)))
+        return path
@@ -15,6 +15,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import contextlib
+import copy
+import functools
 import hashlib
 import importlib
 import json
@@ -23,21 +26,27 @@ import os
 import pathlib
 import platform
 import psutil
+import queue
 import shutil
 import sys
+import threading
 import time
 import traceback
 import typing as tp
+import urllib.error
 import urllib.parse
-import urllib.request
 import yaml
 
-from fractions import Fraction
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 
+import httpclient
+import metrics
+import performance
 import shared
 
 
 default_device = 0
+precisions = {"fp32": "float32", "fp16": "float16", "bf16": "bfloat16", "int8": "qint8"}
 used_cuda = False
 used_xpu = False
 has_Intel = False
@@ -45,6 +54,8 @@ Intel_JIT_only = False
 
 demuce_downloaded_models = {}
 demucs_remote_urls = {}
+download_workers = 4
+yaml_loader = getattr(yaml, "CLoader", yaml.Loader)  # libyaml based loader is much faster
 
 
 class ModelSourceNameUnsupportedError(Exception):
@@ -212,6 +223,108 @@ def empty_cache():
             torch.xpu.empty_cache()
 
 
+def precisionDtype(precision):
+    """Torch dtype used by autocast for a precision option, None means float32 without autocast"""
+    if precision in ["fp32", "int8"]:
+        return None
+    return getattr(torch, precisions[precision])
+
+
+def autocast(device, precision):
+    """Autocast context for the selected precision, float32 and int8 run without autocast"""
+    if precisionDtype(precision) is None:
+        return contextlib.nullcontext()
+    return torch.autocast(torch.device(device).type, dtype=precisionDtype(precision))
+
+
+def checkPrecision(model: "SeparatorModelBase", device, precision, file, seconds=10):
+    """Separate a clip of `seconds` from the middle of `file` with the loaded model both in float32 and in the given
+    precision. `int8` uses the cached quantized model, the same one used for separation.
+
+    Returns SDR (in dB) of each stem taking the float32 output as reference, time used by both runs and the precision
+    actually used."""
+    updateStatus("Reading %s" % file)
+    result = audio.read_audio(file, model.samplerate, updateStatus)
+    if result is None:
+        raise ValueError("Failed to read %s" % file)
+    start = max(0, (result[0].shape[0] - model.samplerate * seconds) // 2)
+    wav = torch.from_numpy(result[0][start : start + model.samplerate * seconds]).transpose(0, 1).contiguous()
+    model.moveModel(device)
+    model.checkTensor(wav[:, : model.samplerate].clone(), device, "fp32")  # Warm up
+    start = time.perf_counter()
+    ref = model.checkTensor(wav.clone(), device, "fp32")[0]
+    time_fp32 = time.perf_counter() - start
+    start = time.perf_counter()
+    est, precision = model.checkTensor(wav.clone(), device, precision)
+    time_reduced = time.perf_counter() - start
+    sdr = {}
+    for stem in ref:
+        noise = (ref[stem] - est[stem].float()).square().sum()
+        sdr[stem] = float(10 * torch.log10(ref[stem].square().sum() / noise.clamp(min=1e-20)))
+    logging.info(
+        "Precision check of %s on %s with model %s and %s: SDR=%s time=%.3fs/%.3fs speedup=%.2fx"
+        % (precision, device, model.modelName(), file, sdr, time_fp32, time_reduced, time_fp32 / time_reduced)
+    )
+    return sdr, time_fp32, time_reduced, precision
+
+
+def quantize_dynamic(model):
+    """Copy of the model with linear and LSTM layers (including those in transformers) quantized to int8"""
+    return torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(model).to("cpu"), {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8
+    )
+
+
+def quantized_model(model, signature, model_files):
+    """Dynamic int8 quantized model for CPU inference, which is cached in model cache folder. The cache is keyed by
+    the signature and modification time and size of `model_files`, and older caches of the same model are removed"""
+    files = []
+    for file in model_files:
+        stat = os.stat(file)
+        files.append([str(file), stat.st_mtime_ns, stat.st_size])
+    prefix = hashlib.sha256(signature.encode("utf8")).hexdigest()[:16]
+    files_digest = hashlib.sha256(json.dumps(files).encode("utf8")).hexdigest()[:16]
+    cache_file = shared.model_cache / "quantized" / ("%s-%s-torch-%s.pt" % (prefix, files_digest, torch.__version__))
+    if cache_file.exists():
+        try:
+            return torch.load(cache_file, map_location="cpu", weights_only=False)
+        except Exception:
+            logging.error("Failed to load quantized model %s:\n%s" % (cache_file, traceback.format_exc()))
+    start = time.perf_counter()
+    quantized = quantize_dynamic(model)
+    logging.info("Quantized model %s in %.3fs" % (signature, time.perf_counter() - start))
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+        torch.save(quantized, tmp_file)
+        os.replace(tmp_file, cache_file)
+        for stale in cache_file.parent.glob("%s-*.pt" % prefix):
+            if stale != cache_file:
+                logging.info("Removing stale quantized model %s" % stale)
+                stale.unlink()
+    except Exception:
+        logging.error("Failed to save quantized model %s:\n%s" % (cache_file, traceback.format_exc()))
+    return quantized
+
+
+def compiled_cache_dir():
+    """Folder of compiled model artifacts of the running torch version"""
+    path = shared.model_cache / "compiled" / ("torch-" + torch.__version__)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def compiled_failures(cache_dir):
+    try:
+        with open(cache_dir / "failed.json", "rt", encoding="utf8") as f:
+            return list(json.load(f))
+    except FileNotFoundError:
+        return []
+    except Exception:
+        logging.error("Failed to load compile failures:\n%s" % traceback.format_exc())
+        return []
+
+
 def setUpdateStatusFunc(func):
     global updateStatus
     if callable(func):
@@ -220,6 +333,269 @@ def setUpdateStatusFunc(func):
         updateStatus = lambda *_: None
 
 
+def demucs_remote_root():
+    """Folder containing the remote model list and bag definitions shipped with demucs"""
+    return pathlib.Path(demucs.api.__file__).parent / "remote"
+
+
+def repo_stamp(path: pathlib.Path):
+    """Stats of the model files in a repo, the cached model list of the repo is valid while this doesn't change"""
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.endswith((".th", ".yaml", ".txt")) and entry.is_file():
+                stat = entry.stat()
+                entries.append([entry.name, stat.st_size, stat.st_mtime_ns])
+    return [demucs.__version__, sorted(entries)]
+
+
+class ModelCatalog:
+    """Models found in each repo, cached on disk and invalidated per repo when its files change"""
+
+    version = 1
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = cls(shared.configPath / "model_catalog.json")
+        return cls._instance
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.changed = False
+        self.repos = {}
+        if path.exists():
+            try:
+                with open(str(path), mode="rt", encoding="utf8") as f:
+                    data = json.load(f)
+                if data.get("version") == self.version:
+                    self.repos = data["repos"]
+            except Exception:
+                logging.warning("Model catalog is corrupted, rebuilding:\n%s" % traceback.format_exc())
+
+    def get(self, key, stamp, build: tp.Callable[[], tp.Any]):
+        with self.lock:
+            if key in self.repos and self.repos[key]["stamp"] == stamp:
+                return self.repos[key]["data"]
+        logging.info("Model catalog of %s is outdated, scanning" % key)
+        data = build()
+        with self.lock:
+            self.repos[key] = {"stamp": stamp, "data": data}
+            self.changed = True
+        return data
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            try:
+                tmp_path = self.path.with_name(self.path.name + ".tmp")
+                with open(str(tmp_path), mode="wt", encoding="utf8") as f:
+                    json.dump({"version": self.version, "repos": self.repos}, f, separators=(",", ":"))
+                os.replace(str(tmp_path), str(self.path))
+                self.changed = False
+            except Exception:
+                logging.warning("Failed to save model catalog:\n%s" % traceback.format_exc())
+
+
+class DownloadProgress:
+    """Combine progress of files downloaded at the same time into one status line"""
+
+    def __init__(self, model, files):
+        self.model = model
+        self.files = files
+        self.progress = {}
+        self.next_update = 0.0
+        self.lock = threading.Lock()
+
+    def update(self, name, downloaded, total):
+        with self.lock:
+            self.progress[name] = (downloaded, total)
+            if time.time() < self.next_update:
+                return
+            self.next_update = time.time() + 0.5
+            downloaded = sum(i[0] for i in self.progress.values())
+            total = sum(i[1] for i in self.progress.values())
+        status = "Downloading model %s: %s / %s" % (self.model, shared.HSize(downloaded), shared.HSize(total))
+        if total:
+            status += " (%.2f%%)" % (downloaded * 100.0 / total)
+        if self.files > 1:
+            status += ", %d files" % self.files
+        updateStatus(status)
+
+
+def download_file(url, directory: pathlib.Path, progress: tp.Callable[[int, int], None] = lambda *_: None):
+    """Download `url` into `directory` and return the path of the downloaded file.
+
+    The file is downloaded to a `.tmp` file first, which is kept on failure so that the next call resumes it with an
+    HTTP Range request. If the file name ends with `-<sha256 prefix>` (like torch hub checkpoints), the checksum is
+    verified, hashing in another thread while reading from the network."""
+    # Download codes modified from torch.hub
+    file_name = urllib.parse.urlparse(url).path.split("/")[-1]
+    tmp_file = directory / (file_name + ".tmp")
+    if len(chunks := file_name.rsplit(".", 1)[0].rsplit("-", 1)) > 1:
+        checksum = chunks[-1]
+    else:
+        checksum = None
+    offset = tmp_file.stat().st_size if tmp_file.exists() else 0
+    headers = {"User-Agent": "torch.hub"}
+    if offset:
+        headers["Range"] = "bytes=%d-" % offset
+    logging.info("Downloading %s to %s%s" % (url, tmp_file, (" (resume from %d)" % offset) if offset else ""))
+    try:
+        u = httpclient.request(url, headers=headers)
+    except urllib.error.HTTPError as e:
+        if e.code != 416:
+            raise
+        # Range not satisfiable, the temp file is broken or already complete, download again
+        logging.warning("Server refused to resume %s, downloading again" % url)
+        offset = 0
+        headers.pop("Range")
+        u = httpclient.request(url, headers=headers)
+    with u:
+        if offset and u.status != 206:
+            logging.warning("Server doesn't support resuming %s, downloading again" % url)
+            offset = 0
+        file_size = offset + int(u.headers.get("Content-Length", 0))
+        hasher = HashWorker() if checksum is not None else None
+        try:
+            with open(str(tmp_file), "r+b" if offset else "wb") as f:
+                if hasher is not None and offset:
+                    while buffer := f.read(1048576):
+                        hasher.update(buffer)
+                f.seek(offset)
+                f.truncate()
+                file_size_dl = offset
+                progress(file_size_dl, file_size)
+                read_size = 65536
+                while True:
+                    read_start = time.perf_counter()
+                    buffer = u.read(read_size)
+                    if not buffer:
+                        break
+                    # Adapt read size so that each read takes about 0.05s ~ 0.5s
+                    read_time = time.perf_counter() - read_start
+                    if len(buffer) == read_size and read_time < 0.05:
+                        read_size = min(read_size * 2, 4194304)
+                    elif read_time > 0.5:
+                        read_size = max(read_size // 2, 16384)
+                    file_size_dl += len(buffer)
+                    f.write(buffer)
+                    if hasher is not None:
+                        hasher.update(buffer)
+                    progress(file_size_dl, file_size)
+        finally:
+            digest = hasher.hexdigest() if hasher is not None else None
+    if file_size and file_size_dl < file_size:
+        # Keep the temp file so that the download can be resumed next time
+        raise ConnectionError("Connection closed after %d of %d bytes of %s" % (file_size_dl, file_size, file_name))
+    if digest is not None and not digest.startswith(checksum):
+        tmp_file.unlink(missing_ok=True)
+        logging.error("Checksum mismatch for %s: received %s, expected %s" % (file_name, digest, checksum))
+        raise RuntimeError("Checksum mismatch")
+    shutil.move(str(tmp_file), str(directory / file_name))
+    logging.info("Downloaded %s" % (directory / file_name))
+    return directory / file_name
+
+
+class HashWorker:
+    """SHA-256 hasher running in another thread, so hashing overlaps with network reads"""
+
+    def __init__(self):
+        self.hasher = hashlib.sha256()
+        self.queue = queue.Queue(maxsize=64)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while (buffer := self.queue.get()) is not None:
+            self.hasher.update(buffer)
+
+    def update(self, buffer):
+        self.queue.put(buffer)
+
+    def hexdigest(self):
+        self.queue.put(None)
+        self.thread.join()
+        return self.hasher.hexdigest()
+
+
+class SegmentPrefetchPool:
+    """Pool for `demucs.apply.apply_model` computing segments one by one like its `DummyPoolExecutor`, but the next
+    segment is copied to the device on a side stream while the current one is computed. Segments are staged in pinned
+    memory to make the copy asynchronous. Without a CUDA device segments are copied when computed"""
+
+    class Result:
+        def __init__(self, pool, func, model, mix, kwargs):
+            self.pool = pool
+            self.func = func
+            self.model = model
+            self.mix = mix
+            self.kwargs = kwargs
+            self.uploaded = None
+
+        def validLength(self):
+            """Length of the input of the model, the same as computed by `apply_model`"""
+            segment = self.kwargs.get("segment")
+            if isinstance(self.model, demucs.apply.HTDemucs) and segment is not None:
+                return int(segment * self.model.samplerate)
+            if hasattr(self.model, "valid_length"):
+                return self.model.valid_length(self.mix.length)
+            return self.mix.length
+
+        def upload(self):
+            if self.uploaded is not None:
+                return
+            host = self.mix.padded(self.validLength())
+            if self.pool.stream is None:
+                self.uploaded = host.to(self.pool.device)
+                return
+            if not host.is_pinned():
+                host = host.pin_memory()
+            with torch.cuda.stream(self.pool.stream):
+                self.uploaded = host.to(self.pool.device, non_blocking=True)
+
+        def result(self):
+            if not self.pool.run:
+                raise CancelledError()
+            self.pool.pending.remove(self)
+            self.upload()
+            if self.pool.pending:
+                self.pool.pending[0].upload()
+            uploaded, self.uploaded = self.uploaded, None
+            if self.pool.stream is not None:
+                current = torch.cuda.current_stream(self.pool.device)
+                current.wait_stream(self.pool.stream)
+                uploaded.record_stream(current)
+            # The uploaded segment has the same padding as the one `apply_model` would compute, so it is used as is
+            offset = (uploaded.shape[-1] - self.mix.length) // 2
+            mix = demucs.apply.TensorChunk(uploaded, offset, self.mix.length)
+            return self.func(self.model, mix, **self.kwargs)
+
+    def __init__(self, device):
+        self.device = torch.device(device)
+        self.stream = torch.cuda.Stream(self.device) if self.device.type == "cuda" else None
+        self.pending = []
+        self.run = True
+
+    def submit(self, func, model, mix, **kwargs):
+        result = SegmentPrefetchPool.Result(self, func, model, mix, kwargs)
+        self.pending.append(result)
+        return result
+
+    def shutdown(self, *_, **__):
+        self.run = False
+        self.pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        return
+
+
 class SeparatorModelBase:
     model_type = "Base"
     model_description = "Base model, not implemented"
@@ -229,6 +605,7 @@ class SeparatorModelBase:
         self,
     ):
         self.separating = False
+        self.resetModelState()
         for module in self.required_modules:
             if module not in sys.modules:
                 raise ImportError("Module %s is not imported" % module)
@@ -236,6 +613,17 @@ class SeparatorModelBase:
     def loadModel(self, *args, **kwargs):
         raise NotImplementedError
 
+    def resetModelState(self):
+        """Called after a model is loaded, the new model is on CPU and neither compiled nor quantized"""
+        self.model_device = None
+        self.compiled_key = None
+        self.float_model = self.separator.model if hasattr(self, "separator") else None
+        self.quantized_model = None
+
+    def setInferenceModel(self, model):
+        """Replace the model used for inference, used to switch between the original and the quantized model"""
+        raise NotImplementedError
+
     def listModels(self):
         raise NotImplementedError
 
@@ -252,32 +640,163 @@ class SeparatorModelBase:
     def separate(self, *args, **kwargs):
         raise NotImplementedError
 
+    def moveModel(self, device):
+        """The model stays on the device between files, it is only moved back to CPU if the device changes"""
+        if self.model_device is not None and self.model_device != device:
+            logging.info("Device changed from %s to %s, moving model back to CPU" % (self.model_device, device))
+            self.separator.model.to("cpu")  # To avoid moving between different GPUs which may cause error
+        self.model_device = device
+
+    def offloadModel(self):
+        """Move the model back to CPU, called when the queue is finished or before switching models"""
+        if self.model_device is None or not hasattr(self, "separator"):
+            return
+        logging.info("Moving model from %s back to CPU" % self.model_device)
+        self.separator.model.to("cpu")
+        self.model_device = None
+
+    def signature(self):
+        """Identifies the loaded model in the compiled model cache"""
+        raise NotImplementedError
+
+    def modelFiles(self):
+        """Files the loaded model is read from, cached quantized models are invalidated when any of them changes"""
+        raise NotImplementedError
+
+    def checkTensor(self, wav, device, precision):
+        """Separate `wav` of shape (channels, length) without shifts for `checkPrecision`, on the device the model has
+        been moved to. Returns the stems and the precision actually used"""
+        raise NotImplementedError
+
+    def modelName(self):
+        raise NotImplementedError
+
+    def compileTargets(self):
+        """Modules whose forward is compiled in compiled mode"""
+        raise NotImplementedError
+
+    def warmUp(self, device, segment, precision):
+        """Run the model once on a silent segment, which compiles the model for the segment length"""
+        raise NotImplementedError
+
+    def useCompiled(self, device, segment, precision):
+        """Compile the model with static shapes and warm it up. The eager model is used if compiling fails, and the
+        failure is recorded so that it isn't retried with the same torch version. Returns whether compiled"""
+        key = (device, segment, precision)
+        if self.compiled_key == key:
+            return True
+        cache_dir = compiled_cache_dir()
+        failure_key = "%s|%s|%.1f|%s" % (self.signature(), torch.device(device).type, segment, precision)
+        failures = compiled_failures(cache_dir)
+        if failure_key in failures:
+            logging.info("Compiling %s failed before, using eager mode" % failure_key)
+            self.useEager()
+            return False
+        updateStatus("Compiling model, this may take a few minutes")
+        logging.info("Compiling model %s" % failure_key)
+        # Artifacts are stored per torch version and per model
+        os.environ["TORCHINDUCTOR_CACHE_DIR"] = str(
+            cache_dir / hashlib.sha256(self.signature().encode("utf8")).hexdigest()[:16]
+        )
+        start = time.perf_counter()
+        try:
+            for module in self.compileTargets():
+                if "forward" not in module.__dict__:
+                    module.forward = torch.compile(module.forward, dynamic=False)
+            self.warmUp(device, segment, precision)
+        except Exception:
+            logging.error("Failed to compile model, falling back to eager mode:\n%s" % traceback.format_exc())
+            self.useEager()
+            failures.append(failure_key)
+            try:
+                with open(cache_dir / "failed.json", "wt", encoding="utf8") as f:
+                    json.dump(failures, f)
+            except Exception:
+                logging.error("Failed to save compile failures:\n%s" % traceback.format_exc())
+            return False
+        logging.info("Model compiled and warmed up in %.3fs" % (time.perf_counter() - start))
+        self.compiled_key = key
+        return True
+
+    def prepareModel(self, device, segment, precision, compiled, backend="torch"):
+        """Select the quantized, compiled or eager model for a file. Returns the precision actually used.
+
+        `backend` is only used by models supporting backends other than PyTorch"""
+        if precision == "int8" and not device == "cpu":
+            logging.warning("int8 is only supported on CPU, using fp32 on %s" % device)
+            precision = "fp32"
+        if precision == "int8":
+            if self.quantized_model is None:
+                updateStatus("Quantizing model")
+                self.setInferenceModel(self.float_model)
+                self.useEager()  # Compiled forward can't be copied
+                self.quantized_model = quantized_model(self.float_model, self.signature(), self.modelFiles())
+            self.setInferenceModel(self.quantized_model)
+            return precision
+        self.setInferenceModel(self.float_model)
+        if compiled:
+            self.useCompiled(device, segment, precision)
+        else:
+            self.useEager()
+        return precision
+
+    def useEager(self):
+        """Restore the eager forward of compiled modules"""
+        if not hasattr(self, "separator"):
+            return
+        for module in self.compileTargets():
+            module.__dict__.pop("forward", None)
+        self.compiled_key = None
+
+    @staticmethod
+    def reuseOutputs(reuse_callback, file, item, wav, tags):
+        """Let `reuse_callback` reuse the outputs of a file with the same audio instead of separating this one. It is
+        called with the file, the item, a hash of the audio after input gain and tags, and returns whether reused"""
+        if reuse_callback is None:
+            return False
+        try:
+            digest = audio.pcm_digest(wav)
+        except Exception:
+            logging.error("Failed to hash audio:\n%s" % traceback.format_exc())
+            return False
+        return reuse_callback(file, item, digest, tags)
+
+    @staticmethod
+    def prepareInput(wav, device):
+        """Copy audio to a tensor of shape (channels, length). On CUDA the copy is made in pinned memory, so segments are
+        uploaded without staging. Only the input is pinned, outputs are copied back into memory allocated by
+        `apply_model`"""
+        wav_torch = torch.from_numpy(wav).transpose(0, 1)
+        if device.startswith("cuda") and torch.cuda.is_available():
+            return wav_torch.pin_memory()  # Already a copy
+        return wav_torch.clone()
+
     def updateProgress(self, progress_dict):
-        progress = Fraction(0)
-        progress_per_model = Fraction(1, progress_dict["models"])
-        progress_per_shift = Fraction(1, max(1, self.shifts))
-        progress += progress_per_model * progress_dict["model_idx_in_bag"]
-        progress_model = Fraction(0)
-        progress_model += progress_per_shift * progress_dict["shift_idx"]
-        progress_shift = Fraction(progress_dict["segment_offset"], progress_dict["audio_length"])
+        progress_per_model = 1 / progress_dict["models"]
+        progress_per_shift = 1 / max(1, self.shifts)
+        segment_end = progress_dict["segment_offset"]
         if progress_dict["state"] == "end":
-            progress_shift += Fraction(
-                int(self.segment * (1 - self.overlap) * self.samplerate), progress_dict["audio_length"]
-            )
-        progress_shift = min(Fraction(1, 1), progress_shift)
-        progress_model += progress_per_shift * progress_shift
-        progress += progress_model * progress_per_model
-        progress *= Fraction(1, self.in_length)
-        progress += Fraction(self.out_length, self.in_length)
-        current_time = time.time()
-        self.time_hists.append((current_time, progress))
+            segment_end += int(self.segment * (1 - self.overlap) * self.samplerate)
+        progress_shift = min(1.0, segment_end / progress_dict["audio_length"])
+        progress_model = progress_per_shift * (progress_dict["shift_idx"] + progress_shift)
+        progress = progress_per_model * (progress_dict["model_idx_in_bag"] + progress_model)
+        progress = (progress + self.out_length) / self.in_length
+        segment_key = (
+            self.out_length,
+            progress_dict["model_idx_in_bag"],
+            progress_dict["shift_idx"],
+            progress_dict["segment_offset"],
+        )
+        if progress_dict["state"] == "start":
+            self.metrics.segmentStarted(segment_key)
+        else:
+            self.metrics.segmentFinished(segment_key)
+        self.metrics.update(progress)
+        current_time = time.perf_counter()
         if current_time - self.last_update_eta > 0.5:
-            while len(self.time_hists) >= 20 and current_time - self.time_hists[0][0] > 15:
-                self.time_hists.pop(0)
-            if len(self.time_hists) >= 2 and progress != self.time_hists[0][1]:
-                eta = int((1 - progress) / (progress - self.time_hists[0][1]) * (current_time - self.time_hists[0][0]))
-            else:
-                eta = 1000000000
+            self.metrics.sampleMemory()
+            eta = self.metrics.eta()
+            eta = int(eta) if eta is not None else 1000000000
             if eta >= 99 * 86400:
                 eta_str = "--:--:--:--"
             elif eta >= 86400:
@@ -286,13 +805,15 @@ class SeparatorModelBase:
                 eta_str += time.strftime("%H:%M:%S", time.gmtime(eta))
             else:
                 eta_str = time.strftime("%H:%M:%S", time.gmtime(eta))
+            if (realtime_factor := self.metrics.realtimeFactor()) is not None:
+                eta_str += " | %.2fx realtime" % realtime_factor
             updateStatus("Separating audio: %s | ETA %s" % (self.file.name, eta_str))
             self.last_update_eta = current_time
-        pause_start = time.time()
-        self.setModelProgress(min(1.0, float(progress_shift)))
-        self.setAudioProgress(min(1.0, float(progress)), self.item)
-        pause_end = time.time()
-        self.time_hists = [(i[0] + pause_end - pause_start, i[1]) for i in self.time_hists]
+        pause_start = time.perf_counter()
+        self.setModelProgress(min(1.0, progress_shift))
+        self.setAudioProgress(min(1.0, progress), self.item)
+        # Time spent in progress callbacks (including being paused) is excluded from the metrics
+        self.metrics.addPause(time.perf_counter() - pause_start)
 
     def save_callback(self, *args, encoder="sndfile"):
         match encoder:
@@ -313,6 +834,7 @@ class DemucsSeparator(SeparatorModelBase):
         if repo is None:
             self.ensureDownloaded(model)
         self.separator = demucs.api.Separator(model=model, repo=repo, progress=False)
+        self.resetModelState()
         if len(set(self.separator.model.sources)) != len(self.separator.model.sources):
             raise ModelSourceNameUnsupportedError(
                 "Duplicate source names in model %s\nSources: %s" % (model, self.separator.model.sources)
@@ -349,21 +871,32 @@ class DemucsSeparator(SeparatorModelBase):
         repos = [shared.homeDir / "pretrained", shared.pretrained]
         repos += [pathlib.Path(i) for i in custom_repo]
         repos += [None]
+        catalog = ModelCatalog.instance()
         try:
             torch.hub.set_dir(shared.model_cache)
             checkpoint_dir = shared.model_cache / "checkpoints"
-            demuce_downloaded_models = demucs.api.list_models(checkpoint_dir)["single"]
+            demuce_downloaded_models = dict(
+                catalog.get(
+                    "downloaded:" + str(checkpoint_dir),
+                    repo_stamp(checkpoint_dir),
+                    lambda: {k: str(v) for k, v in demucs.api.list_models(checkpoint_dir)["single"].items()},
+                )
+            )
         except Exception:
             logging.error("Failed to list downloaded models:\n%s" % traceback.format_exc())
         for repopath in repos:
             if repopath is not None and not repopath.exists():
                 continue
             try:
-                new_models = demucs.api.list_models(repopath)
+                new_models = catalog.get(
+                    str(repopath) if repopath is not None else "remote",
+                    repo_stamp(repopath if repopath is not None else demucs_remote_root()),
+                    functools.partial(self.scanRepo, repopath),
+                )
             except Exception:
                 logging.error("Failed to list models from %s:\n%s" % (str(repopath), traceback.format_exc()))
                 continue
-            for sig, filepath in new_models["bag"].items():
+            for sig, model_def in new_models["bag"].items():
                 info = "Model signature: " + sig
                 info += "\nType: Bag of models"
                 if repopath is None:
@@ -371,115 +904,128 @@ class DemucsSeparator(SeparatorModelBase):
                 else:
                     info += "\nPosition: Local model"
                     info += "\nRepo: " + str(repopath)
-                info += "\nFile: " + str(filepath)
-                try:
-                    with open(filepath, "rt", encoding="utf8") as f:
-                        model_def = yaml.load(f, yaml.Loader)
-                    info += "\nModels:"
-                    if "weights" in model_def:
-                        weights = model_def["weights"]
-                        for i, (model, weight) in enumerate(zip(model_def["models"], weights)):
-                            info += "\n\u3000%d. %s: %s" % (i + 1, model, weight)
-                            if repopath is None:
-                                info += " (Downloaded)" if model in demuce_downloaded_models else " (Not downloaded)"
-                    else:
-                        for i, model in enumerate(model_def["models"]):
-                            info += "\n\u3000%d. %s" % (i + 1, model)
-                            if repopath is None:
-                                info += " (Downloaded)" if model in demuce_downloaded_models else " (Not downloaded)"
-                    if "segment" in model_def:
-                        info += "\nDefault segment: %.1f" % model_def["segment"]
-                except Exception:
-                    logging.error("Failed to load info of demucs model %s:\n%s" % (sig, traceback.format_exc()))
+                info += "\nFile: " + model_def["file"]
+                info += "\nModels:"
+                if model_def["weights"] is not None:
+                    for i, (model, weight) in enumerate(zip(model_def["models"], model_def["weights"])):
+                        info += "\n\u3000%d. %s: %s" % (i + 1, model, weight)
+                        if repopath is None:
+                            info += " (Downloaded)" if model in demuce_downloaded_models else " (Not downloaded)"
                 else:
-                    demucs_remote_urls[sig] = model_def["models"]
-                    bags.append((sig, info, repopath))
+                    for i, model in enumerate(model_def["models"]):
+                        info += "\n\u3000%d. %s" % (i + 1, model)
+                        if repopath is None:
+                            info += " (Downloaded)" if model in demuce_downloaded_models else " (Not downloaded)"
+                if model_def["segment"] is not None:
+                    info += "\nDefault segment: %.1f" % model_def["segment"]
+                demucs_remote_urls[sig] = model_def["models"]
+                bags.append((sig, info, repopath))
             for sig, filepath in new_models["single"].items():
                 info = "Model signature: " + sig
                 info += "\nType: Single model"
                 if repopath is None:
                     info += "\nPosition: Remote model"
-                    info += "\nURL: " + str(filepath)
+                    info += "\nURL: " + filepath
                     info += "\nState: " + ("Downloaded" if sig in demuce_downloaded_models else "Not downloaded")
                     if sig in demuce_downloaded_models:
                         info += "\nFile: " + str(demuce_downloaded_models[sig])
                     else:
-                        demucs_remote_urls[sig] = str(filepath)
+                        demucs_remote_urls[sig] = filepath
                 else:
                     info += "\nPosition: Local model"
                     info += "\nRepo: " + str(repopath)
-                    info += "\nFile: " + str(filepath)
+                    info += "\nFile: " + filepath
                 singles.append((sig, info, repopath))
+        catalog.save()
         models, infos, each_repos = tuple(zip(*(bags + singles + [("demucs_unittest", "Unit test model", None)])))
         return models, infos, each_repos
 
+    @staticmethod
+    def scanRepo(repopath):
+        """List models of a repo and parse its bag definitions, the result is stored in the model catalog"""
+        new_models = demucs.api.list_models(repopath)
+        bags = {}
+        for sig, filepath in new_models["bag"].items():
+            try:
+                with open(filepath, "rt", encoding="utf8") as f:
+                    model_def = yaml.load(f, yaml_loader)
+                bags[sig] = {
+                    "file": str(filepath),
+                    "models": list(model_def["models"]),
+                    "weights": model_def["weights"] if "weights" in model_def else None,
+                    "segment": model_def["segment"] if "segment" in model_def else None,
+                }
+            except Exception:
+                logging.error("Failed to load info of demucs model %s:\n%s" % (sig, traceback.format_exc()))
+        return {"bag": bags, "single": {sig: str(filepath) for sig, filepath in new_models["single"].items()}}
+
     def ensureDownloaded(self, model):
         if model == "demucs_unittest":
             return
         if model in demuce_downloaded_models:
             return
-        if isinstance(demucs_remote_urls[model], list):
-            for i in demucs_remote_urls[model]:
-                self.ensureDownloaded(i)
-            return
-        # Download codes modified from torch.hub
+        if isinstance(demucs_remote_urls.get(model), list):
+            # Download all models of the bag at the same time
+            models = [i for i in dict.fromkeys(demucs_remote_urls[model]) if i not in demuce_downloaded_models]
+        else:
+            models = [model]
         try:
-            url = demucs_remote_urls[model]
+            urls = {i: demucs_remote_urls[i] for i in models}
         except KeyError:
             err = "Model %s not found\n" % model
             err += "Downloaded models: " + json.dumps(demuce_downloaded_models)
             err += "\nRemote models: " + json.dumps(demucs_remote_urls)
             raise RuntimeError(err)
+        if not urls:
+            return
         updateStatus("Downloading model %s" % model)
-        logging.info("Downloading model %s from %s" % (model, url))
-        next_update = 0.0
-        req = urllib.request.Request(url, headers={"User-Agent": "torch.hub"})
-        u = urllib.request.urlopen(req)
-        meta = u.info()
-        if hasattr(meta, "getheaders"):
-            content_length = meta.getheaders("Content-Length")
-        else:
-            content_length = meta.get_all("Content-Length")
-        if content_length is not None and len(content_length) > 0:
-            file_size = int(content_length[0])
-        file_name = urllib.parse.urlparse(url).path.split("/")[-1]
-        tmp_name = file_name + ".tmp"
-        tmp_file = shared.model_cache / "checkpoints" / tmp_name  # type: pathlib.Path
-        tmp_file.unlink(missing_ok=True)
-        f = open(str(tmp_file), "wb")
-        file_size_dl = 0
-        if len(chunks := file_name.rsplit(".", 1)[0].rsplit("-", 1)) > 1:
-            checksum = chunks[-1]
-            hasher = hashlib.sha256()
-        else:
-            checksum = None
-        while True:
-            buffer = u.read(8192)
-            if not buffer:
-                break
-            file_size_dl += len(buffer)
-            f.write(buffer)
-            if checksum is not None:
-                hasher.update(buffer)
-            if time.time() > next_update:
-                status = "Downloading model %s: %s / %s (%.2f%%)" % (
-                    model,
-                    shared.HSize(file_size_dl),
-                    shared.HSize(file_size),
-                    file_size_dl * 100.0 / file_size,
-                )
-                updateStatus(status)
-                next_update = time.time() + 0.5
-        f.close()
-        if checksum is not None:
-            if not hasher.hexdigest().startswith(checksum):
-                tmp_file.unlink(missing_ok=True)
-                logging.error(
-                    "Checksum mismatch for %s: received %s, expected %s" % (model, hasher.hexdigest(), checksum)
-                )
-                raise RuntimeError("Checksum mismatch")
+        progress = DownloadProgress(model, len(urls))
+        checkpoint_dir = shared.model_cache / "checkpoints"
+        with ThreadPoolExecutor(min(len(urls), download_workers)) as pool:
+            futures = {
+                name: pool.submit(download_file, url, checkpoint_dir, functools.partial(progress.update, name))
+                for name, url in urls.items()
+            }
+            for name, future in futures.items():
+                demuce_downloaded_models[name] = str(future.result())
         updateStatus("Downloaded model %s" % model)
-        shutil.move(str(tmp_file), str(tmp_file.parent / file_name))
+
+    def signature(self):
+        return "Demucs:%s:%s" % (self.repo if self.repo is not None else "remote", self.model)
+
+    def modelFiles(self):
+        if self.model == "demucs_unittest":
+            return []
+        if self.repo is None:
+            # Only bags and single models not downloaded yet are listed with their URLs
+            names = demucs_remote_urls.get(self.model)
+            return [demuce_downloaded_models[i] for i in (names if isinstance(names, list) else [self.model])]
+        models = demucs.api.list_models(self.repo)
+        if self.model in models["single"]:
+            return [models["single"][self.model]]
+        with open(models["bag"][self.model], "rt", encoding="utf8") as f:
+            model_def = yaml.load(f, yaml_loader)
+        return [models["bag"][self.model]] + [models["single"][i] for i in dict.fromkeys(model_def["models"])]
+
+    def checkTensor(self, wav, device, precision):
+        return self.separateTensor(wav, device, self.default_segment, 0.25, 0, precision, False, "torch", None)
+
+    def setInferenceModel(self, model):
+        self.separator._model = model
+
+    def modelName(self):
+        return self.model
+
+    def compileTargets(self):
+        if isinstance(self.separator.model, demucs.apply.BagOfModels):
+            return list(self.separator.model.models)
+        return [self.separator.model]
+
+    def warmUp(self, device, segment, precision):
+        self.separator.update_parameter(device=device, segment=segment, shifts=0, overlap=0.0, callback=None)
+        wav = torch.zeros(self.separator.model.audio_channels, int(segment * self.samplerate))
+        with autocast(device, precision):
+            self.separator.separate_tensor(wav)
 
     def modelInfo(self):
         channels = self.separator.model.audio_channels
@@ -518,6 +1064,62 @@ class DemucsSeparator(SeparatorModelBase):
             ", ".join(self.sources),
         )
 
+    def applyModel(self, wav):
+        """Same as `separate_tensor` of `demucs.api.Separator`, but when audio on CPU is separated on CUDA, segments are
+        uploaded by `SegmentPrefetchPool`. Returns the stems"""
+        device = torch.device(self.separator._device)
+        if device.type != "cuda" or wav.device.type != "cpu":
+            return self.separator.separate_tensor(wav)[1]
+        ref = wav.mean(0)
+        mean = ref.mean()
+        std = ref.std() + 1e-8
+        out = demucs.apply.apply_model(
+            self.separator._model,
+            ((wav - mean) / std)[None],
+            segment=self.separator._segment,
+            shifts=self.separator._shifts,
+            split=self.separator._split,
+            overlap=self.separator._overlap,
+            device=device,
+            pool=SegmentPrefetchPool(device),
+            callback=self.separator._callback,
+            callback_arg=demucs.apply._replace_dict(self.separator._callback_arg, ("audio_length", wav.shape[1])),
+            progress=self.separator._progress,
+        )
+        out = out * std + mean
+        return dict(zip(self.separator._model.sources, out[0]))
+
+    def separateTensor(self, wav_torch, device, segment, overlap, shifts, precision, compiled, backend, callback):
+        """Separate audio of shape (channels, length) with the model on `device`, used both in the GUI process and
+        in worker processes. Returns the stems and the precision actually used"""
+        precision = self.prepareModel(device, segment, precision, compiled, backend)
+        self.separator.update_parameter(
+            device=device, segment=segment, shifts=shifts, overlap=overlap, callback=callback
+        )
+        src_channels = wav_torch.shape[0]
+        if src_channels != self.separator.model.audio_channels:
+            out = {stem: torch.zeros(1, wav_torch.shape[1], dtype=torch.float32) for stem in self.sources}
+            self.in_length = src_channels
+            self.out_length = 0
+            for i in range(src_channels):
+                self.out_length = i
+                with autocast(device, precision):
+                    separated = self.applyModel(wav_torch[i, :].repeat(self.separator.model.audio_channels, 1))
+                for stem, tensor in separated.items():
+                    out[stem][i, :] = tensor.sum(dim=0) / tensor.shape[0]
+        else:
+            self.in_length = 1
+            self.out_length = 0
+            with autocast(device, precision):
+                out = self.applyModel(wav_torch)
+        return out, precision
+
+    def workerProgress(self, in_length, out_length, progress_dict):
+        """Progress reported by a worker process, which runs `separateTensor` of its own copy of the model"""
+        self.in_length = in_length
+        self.out_length = out_length
+        self.updateProgress(progress_dict)
+
     @shared.thread_wrapper(daemon=True)
     def separate(
         self,
@@ -533,24 +1135,50 @@ class DemucsSeparator(SeparatorModelBase):
         setAudioProgress: tp.Callable[[float, tp.Any], None],
         setStatus: tp.Callable[[tp.Any, int], None],
         finishCallback: tp.Callable[[int, tp.Any], None],
+        precision: str = "fp32",
+        compiled: bool = False,
+        backend: str = "torch",
+        reuse_callback: tp.Optional[tp.Callable[[tp.Any, tp.Any, str, dict], bool]] = None,
+        worker=None,
     ):
         logging.info("Start separating audio: %s" % file.name)
         logging.info("Parameters: segment=%.2f overlap=%.2f shifts=%d" % (segment, overlap, shifts))
-        logging.info("Device: %s" % device)
+        logging.info("Device: %s, precision: %s" % (device, precision))
         global used_cuda, used_xpu
         if device.startswith("cuda"):
             used_cuda = True
         if device.startswith("xpu"):
             used_xpu = True
+        self.metrics = metrics.SeparationMetrics(
+            file,
+            device,
+            {
+                "model_type": self.model_type,
+                "model": self.modelName(),
+                "repo": self.repo,
+                "segment": segment,
+                "overlap": overlap,
+                "shifts": shifts,
+                "precision": precision,
+                "compiled": compiled,
+                "backend": backend,
+            },
+            track_device=worker is None,
+        )
+        read_start = time.perf_counter()
         try:
             setStatus(shared.FileStatus.Reading, item)
             wav, tags = audio.read_audio(file, self.samplerate, updateStatus)
             assert wav is not None
             assert (np.isnan(wav).sum() == 0) and (np.isinf(wav).sum() == 0), "Audio contains NaN or Inf"
         except Exception:
+            self.metrics.finish("Failed")
+            performance.record(self.metrics, "Failed")
             finishCallback(shared.FileStatus.Failed, item)
             self.separating = False
             return
+        self.metrics.read_time = time.perf_counter() - read_start
+        self.metrics.audio_seconds = wav.shape[0] / self.samplerate
 
         self.item = item
         self.shifts = shifts
@@ -559,50 +1187,62 @@ class DemucsSeparator(SeparatorModelBase):
         self.setAudioProgress = setAudioProgress
         self.setModelProgress = setModelProgress
         self.file = file
-        self.time_hists = []
         self.last_update_eta = 0
 
-        self.separator.model.to("cpu")  # To avoid moving between different GPUs which may cause error
-
         wav = audio.gain(wav, gain)
 
+        if self.reuseOutputs(reuse_callback, file, item, wav, tags):
+            self.separating = False
+            finishCallback(shared.FileStatus.Finished, item)
+            return
+
         try:
             updateStatus("Separating audio: %s" % file.name)
-            self.separator.update_parameter(
-                device=device, segment=segment, shifts=shifts, overlap=overlap, callback=self.updateProgress
-            )
-            wav_torch = torch.from_numpy(wav).clone().transpose(0, 1)
-            assert (not wav_torch.isnan().any()) and (not wav_torch.isinf().any()), "Audio contains NaN or Inf"
-            src_channels = wav_torch.shape[0]
-            logging.info("Running separation...")
-            self.time_hists.append((time.time(), 0))
-            if src_channels != self.separator.model.audio_channels:
-                out = {stem: torch.zeros(1, wav_torch.shape[1], dtype=torch.float32) for stem in self.sources}
-                self.in_length = src_channels
-                self.out_length = 0
-                for i in range(src_channels):
-                    self.out_length += 1
-                    for stem, tensor in self.separator.separate_tensor(
-                        wav_torch[i, :].repeat(self.separator.model.audio_channels, 1)
-                    )[1].items():
-                        out[stem][i, :] = tensor.sum(dim=0) / tensor.shape[0]
+            if worker is not None:
+                logging.info("Running separation in worker process...")
+                out, precision, self.metrics.peak_device_memory, self.metrics.peak_rss = worker.separate(
+                    self.model,
+                    self.repo,
+                    wav,
+                    self.sources,
+                    self.metrics.start,
+                    self.workerProgress,
+                    updateStatus,
+                    device=device,
+                    segment=segment,
+                    overlap=overlap,
+                    shifts=shifts,
+                    precision=precision,
+                    compiled=compiled,
+                    backend=backend,
+                )
+                wav_torch = torch.from_numpy(wav).transpose(0, 1)
             else:
-                self.in_length = 1
-                self.out_length = 0
-                out = self.separator.separate_tensor(wav_torch)[1]
+                self.moveModel(device)
+                wav_torch = self.prepareInput(wav, device)
+                assert (not wav_torch.isnan().any()) and (not wav_torch.isinf().any()), "Audio contains NaN or Inf"
+                logging.info("Running separation...")
+                self.metrics.start()
+                out, precision = self.separateTensor(
+                    wav_torch, device, segment, overlap, shifts, precision, compiled, backend, self.updateProgress
+                )
+            self.metrics.params["precision"] = precision
         except KeyboardInterrupt:
+            self.metrics.finish("Cancelled")
+            performance.record(self.metrics, "Cancelled")
             finishCallback(shared.FileStatus.Cancelled, item)
             self.separating = False
             return
         except Exception:
             logging.error(traceback.format_exc())
+            self.metrics.finish("Failed")
+            performance.record(self.metrics, "Failed")
             finishCallback(shared.FileStatus.Failed, item)
             self.separating = False
             return
-        finally:
-            self.separator.model.to("cpu")
+        self.metrics.finish("Separated")
         logging.info("Saving separated audio...")
-        save_callback(file, wav_torch, out, tags, self.save_callback, item, finishCallback)
+        save_callback(file, wav_torch, out, tags, self.save_callback, item, finishCallback, metrics=self.metrics)
         self.separating = False
         return
 
@@ -617,6 +1257,7 @@ class ApolloEnhancer(SeparatorModelBase):
 
     def loadModel(self, model: str = "apollo", repo: tp.Optional[pathlib.Path] = None):
         self.separator = ApolloCall.Enhancer(model=model, repo=repo)
+        self.resetModelState()
         self.samplerate = self.separator.samplerate
         self.default_segment = 10
         self.max_segment = 3600
@@ -649,6 +1290,75 @@ class ApolloEnhancer(SeparatorModelBase):
                 each_repos.append(repo)
         return models, infos, each_repos
 
+    def signature(self):
+        return "Apollo:%s:%s" % (self.repo, self.name)
+
+    def modelFiles(self):
+        return [self.separator.model_file]
+
+    def checkTensor(self, wav, device, precision):
+        precision = self.prepareModel(device, self.default_segment, precision, False)
+        self.separator.update_parameter(
+            device=device,
+            segment=self.default_segment,
+            shifts=0,
+            overlap=0.25,
+            callback=None,
+            precision=precisionDtype(precision),
+        )
+        return {"enhanced": self.separator.enhance_tensor(wav)[1]}, precision
+
+    def setInferenceModel(self, model):
+        self.separator._model = model
+
+    def modelName(self):
+        return self.name
+
+    def resetModelState(self):
+        super().resetModelState()
+        self.onnx_model = None
+
+    def prepareModel(self, device, segment, precision, compiled, backend="torch"):
+        precision = self.selectBackend(device, segment, precision, compiled, backend)
+        # Only compiled and ONNX models need the last segment padded to the length of others
+        self.separator.update_parameter(
+            static_shapes=self.compiled_key is not None or self.separator.model is self.onnx_model
+        )
+        return precision
+
+    def selectBackend(self, device, segment, precision, compiled, backend):
+        if backend != "onnx":
+            return super().prepareModel(device, segment, precision, compiled)
+        if device != "cpu":
+            logging.warning("ONNX Runtime backend only supports CPU, using PyTorch on %s" % device)
+            return super().prepareModel(device, segment, precision, compiled)
+        try:
+            if self.onnx_model is None:
+                self.onnx_model = ApolloCall.OnnxModel(
+                    self.float_model, self.separator.model_file, shared.model_cache / "onnx"
+                )
+            updateStatus("Preparing ONNX Runtime session")
+            self.onnx_model.session((1, 2, int(segment * self.samplerate)))
+        except Exception:
+            logging.error("Failed to use ONNX Runtime, using PyTorch instead:\n%s" % traceback.format_exc())
+            return super().prepareModel(device, segment, precision, compiled)
+        self.setInferenceModel(self.onnx_model)
+        return "fp32"
+
+    def compileTargets(self):
+        return [self.separator.model]
+
+    def warmUp(self, device, segment, precision):
+        self.separator.update_parameter(
+            device=device,
+            segment=segment,
+            shifts=0,
+            overlap=0.0,
+            callback=None,
+            precision=precisionDtype(precision),
+        )
+        self.separator.enhance_tensor(torch.zeros(2, int(segment * self.samplerate)))
+
     def modelInfo(self):
         return "Model: %s\nRepo: %s\nType: %s\n\nSample rate: %d" % (
             self.name,
@@ -672,24 +1382,51 @@ class ApolloEnhancer(SeparatorModelBase):
         setAudioProgress: tp.Callable[[float, tp.Any], None],
         setStatus: tp.Callable[[tp.Any, int], None],
         finishCallback: tp.Callable[[int, tp.Any], None],
+        precision: str = "fp32",
+        compiled: bool = False,
+        backend: str = "torch",
+        reuse_callback: tp.Optional[tp.Callable[[tp.Any, tp.Any, str, dict], bool]] = None,
+        worker=None,
     ):
         logging.info("Start separating audio: %s" % file.name)
+        if worker is not None:
+            logging.info("Apollo models are not supported by worker processes, separating in the GUI process")
         logging.info("Parameters: segment=%.2f overlap=%.2f shifts=%d" % (segment, overlap, shifts))
-        logging.info("Device: %s" % device)
+        logging.info("Device: %s, precision: %s" % (device, precision))
         global used_cuda, used_xpu
         if device.startswith("cuda"):
             used_cuda = True
         if device.startswith("xpu"):
             used_xpu = True
+        self.metrics = metrics.SeparationMetrics(
+            file,
+            device,
+            {
+                "model_type": self.model_type,
+                "model": self.modelName(),
+                "repo": self.repo,
+                "segment": segment,
+                "overlap": overlap,
+                "shifts": shifts,
+                "precision": precision,
+                "compiled": compiled,
+                "backend": backend,
+            },
+        )
+        read_start = time.perf_counter()
         try:
             setStatus(shared.FileStatus.Reading, item)
             wav, tags = audio.read_audio(file, self.samplerate, updateStatus)
             assert wav is not None
             assert (np.isnan(wav).sum() == 0) and (np.isinf(wav).sum() == 0), "Audio contains NaN or Inf"
         except Exception:
+            self.metrics.finish("Failed")
+            performance.record(self.metrics, "Failed")
             finishCallback(shared.FileStatus.Failed, item)
             self.separating = False
             return
+        self.metrics.read_time = time.perf_counter() - read_start
+        self.metrics.audio_seconds = wav.shape[0] / self.samplerate
 
         self.item = item
         self.shifts = shifts
@@ -698,38 +1435,61 @@ class ApolloEnhancer(SeparatorModelBase):
         self.setAudioProgress = setAudioProgress
         self.setModelProgress = setModelProgress
         self.file = file
-        self.time_hists = []
         self.last_update_eta = 0
 
         wav = audio.gain(wav, gain)
 
-        self.separator.model.to("cpu")  # To avoid moving between different GPUs which may cause error
+        if self.reuseOutputs(reuse_callback, file, item, wav, tags):
+            self.separating = False
+            finishCallback(shared.FileStatus.Finished, item)
+            return
+
+        self.moveModel(device)
 
         try:
+            precision = self.prepareModel(device, segment, precision, compiled, backend)
+            self.metrics.params["precision"] = precision
             updateStatus("Enhancing audio: %s" % file.name)
             self.separator.update_parameter(
-                device=device, segment=segment, shifts=shifts, overlap=overlap, callback=self.updateProgress
+                device=device,
+                segment=segment,
+                shifts=shifts,
+                overlap=overlap,
+                callback=self.updateProgress,
+                precision=precisionDtype(precision),
             )
-            wav_torch = torch.from_numpy(wav).clone().transpose(0, 1)
+            wav_torch = self.prepareInput(wav, device)
             assert (not wav_torch.isnan().any()) and (not wav_torch.isinf().any()), "Audio contains NaN or Inf"
             logging.info("Running Enhancement...")
-            self.time_hists.append((time.time(), 0))
+            self.metrics.start()
             self.in_length = 1
             self.out_length = 0
             out = self.separator.enhance_tensor(wav_torch)[1]
         except KeyboardInterrupt:
+            self.metrics.finish("Cancelled")
+            performance.record(self.metrics, "Cancelled")
             finishCallback(shared.FileStatus.Cancelled, item)
             self.separating = False
             return
         except Exception:
             logging.error(traceback.format_exc())
+            self.metrics.finish("Failed")
+            performance.record(self.metrics, "Failed")
             finishCallback(shared.FileStatus.Failed, item)
             self.separating = False
             return
-        finally:
-            self.separator.model.to("cpu")
+        self.metrics.finish("Separated")
         logging.info("Saving enhanced audio...")
-        save_callback(file, wav_torch, {"enhanced": out.squeeze()}, tags, self.save_callback, item, finishCallback)
+        save_callback(
+            file,
+            wav_torch,
+            {"enhanced": out.squeeze()},
+            tags,
+            self.save_callback,
+            item,
+            finishCallback,
+            metrics=self.metrics,
+        )
         self.separating = False
         return
 
@@ -22,7 +22,10 @@ import os
 os.environ["SSL_CERT_FILE"] = certifi.where()
 
 import __main__
+import atexit
+import contextlib
 import functools
+import httpclient
 import json
 import logging
 import lzma
@@ -32,15 +35,20 @@ import pathlib
 import pickle
 import re
 import shlex
+import sqlite3
+import string
 import subprocess
 import sys
 import threading
+import time
 import traceback
+import urllib.error
 import urllib.parse
 import urllib.request
 
 
-homeDir = pathlib.Path(__main__.__file__).resolve().parent
+# The main module of a worker process has no file while the main module of the GUI process is imported again
+homeDir = pathlib.Path(getattr(__main__, "__file__", None) or sys.argv[0]).resolve().parent
 debug = False  # Do not write log file, output to console instead if True
 use_PyQt6 = False  # set to True to use PyQt6 instead of PySide6
 
@@ -108,6 +116,8 @@ update_url = "https://api.github.com/repos/CarlGao4/Demucs-GUI/releases"
 
 settingsLock = threading.Lock()
 historyLock = threading.Lock()
+_history_dirty = set()  # Top-level keys of history changed since last save
+_history_cleared = False
 
 urlreg_str = (
     r"^(?P<scheme>[a-zA-Z]+)://"
@@ -158,6 +168,14 @@ def HSize(size):
     return ("%.3f" % s).rstrip("0").rstrip(".") + u[t]
 
 
+def HTime(seconds):
+    """Format seconds like "1:02:03", or "2d 1:02:03" if longer than a day"""
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    text = "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+    return "%dd %s" % (days, text) if days else text
+
+
 def is_sublist(a, b):
     if not isinstance(a, list):
         a = list(a)
@@ -179,8 +197,180 @@ def try_parse_cmd(cmd):
         return []
 
 
+class Template:
+    """A `str.format` template parsed once. `fields` are names of the variables it uses, positional fields are
+    counted in `positional`. Raises ValueError if the template is malformed"""
+
+    def __init__(self, template):
+        self.template = template
+        self.fields = set()
+        self.positional = 0
+        automatic = manual = False
+        for _, field, _, _ in string.Formatter().parse(template):
+            if field is None:
+                continue
+            name = re.split(r"[.\[]", field, maxsplit=1)[0]
+            if name == "":
+                automatic = True
+                self.positional += 1
+            elif name.isdigit():
+                manual = True
+                self.positional = max(self.positional, int(name) + 1)
+            else:
+                self.fields.add(name)
+        if automatic and manual:
+            raise ValueError("Cannot mix {} with numbered fields like {0}")
+
+    def render(self, *args, **kwargs):
+        return self.template.format(*args, **kwargs)
+
+
+class SaveTemplates:
+    """Save location, file extension and ffmpeg command templates, parsed once and reused for all files and stems.
+    `extension` is a template rendered with input file variables and tags, `command` is None if not saving with
+    ffmpeg. Raises ValueError if any template is malformed"""
+
+    location_variables = {"track", "trackext", "stem", "ext", "model", "host"}
+    input_variables = {"input", "inputext", "inputpath", "output"}
+    max_parents = 16
+
+    def __init__(self, location, absolute, extension, command=None):
+        self.location = Template(location)
+        if self.location.positional > self.max_parents:
+            raise ValueError("Only {0} to {%d} can be used in save location" % (self.max_parents - 1))
+        self.absolute = absolute
+        self.extension = Template(extension)
+        self.command = None
+        if command is not None:
+            self.command = [Template(i) for i in try_parse_cmd(command)]
+        self.path_tag_fields = (self.location.fields - self.location_variables) | (
+            self.extension.fields - self.input_variables
+        )
+        self.tag_fields = self.path_tag_fields.copy()
+        for i in self.command or []:
+            self.tag_fields |= i.fields - self.input_variables
+
+    def usesTags(self):
+        """Whether any template refers to tags of the input file"""
+        return bool(self.tag_fields)
+
+    def pathUsesTags(self):
+        """Whether the save location or file extension refers to tags of the input file, so tags are needed to know
+        where outputs are saved"""
+        return bool(self.path_tag_fields)
+
+    def context(self, file, tags, model):
+        return OutputContext(self, file, tags, model)
+
+
+class OutputContext:
+    """Variables of one input file for `SaveTemplates`, computed once for all stems of the file"""
+
+    def __init__(self, templates: SaveTemplates, file, tags, model):
+        self.templates = templates
+        self.file = file
+        self.input_variables = {"input": file.stem, "inputext": file.suffix[1:], "inputpath": str(file.parent)}
+        self.ext = templates.extension.render(
+            **self.input_variables, **{k: v for k, v in tags.items() if k not in self.input_variables}
+        )
+        self.parents = []
+        if templates.location.positional:
+            self.parents = [file.name]
+            parent = file
+            while parent.parent != parent and len(self.parents) < templates.max_parents:
+                parent = parent.parent
+                self.parents.append(parent.name)
+            self.parents += [""] * (templates.max_parents - len(self.parents))
+        self.location_variables = {(f"{k}_" if k in templates.location_variables else k): v for k, v in tags.items()}
+        self.location_variables.update(
+            track=file.stem,
+            trackext=file.name,
+            ext=self.ext,
+            model=model,
+            host=file["host"] if isinstance(file, URL_with_filename) else "localfile",
+        )
+        self.command_variables = {
+            **{k: v for k, v in tags.items() if k not in templates.input_variables},
+            **self.input_variables,
+        }
+
+    def path(self, stem) -> pathlib.Path:
+        """Path to save a stem to"""
+        path = self.templates.location.render(*self.parents, stem=stem, **self.location_variables)
+        return pathlib.Path(path) if self.templates.absolute else self.file.parent / path
+
+    def command(self, output):
+        """Arguments of the ffmpeg command saving to `output`"""
+        return [i.render(**self.command_variables, output=str(output)) for i in self.templates.command]
+
+
+class BackgroundWriter:
+    """Call `write` on a background thread after `schedule` is called. Calls made within `delay` seconds after the
+    first one are merged into a single write. `flush` writes pending changes immediately, and is called at exit.
+    Failed writes are retried, waiting twice as long after each failure up to `max_retry_delay` seconds."""
+
+    max_retry_delay = 60.0
+
+    def __init__(self, name, write, delay=0.0):
+        self.name = name
+        self.write = write
+        self.delay = delay
+        self.retry_delay = 0.0
+        self.pending = False
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.thread = None
+        atexit.register(self.flush)
+
+    def schedule(self):
+        with self.condition:
+            self.pending = True
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+            if delay := max(self.delay, self.retry_delay):
+                time.sleep(delay)
+            self.flush()
+
+    def flush(self):
+        with self.write_lock:
+            with self.condition:
+                if not self.pending:
+                    return
+                self.pending = False
+            try:
+                self.write()
+            except Exception:
+                self.retry_delay = min(max(self.retry_delay * 2, 1.0), self.max_retry_delay)
+                logging.warning(
+                    "Failed to %s, retrying in %.0fs:\n%s" % (self.name, self.retry_delay, traceback.format_exc())
+                )
+                with self.condition:
+                    self.pending = True
+            else:
+                self.retry_delay = 0.0
+
+
+def _CallerName(*skip):
+    """Prefix with the name of the function changing settings or history for logging. Inspecting the stack is slow,
+    so it is only done in debug mode."""
+    if not debug:
+        return ""
+    frame = sys._getframe(2)
+    while frame.f_back is not None and frame.f_code.co_name in skip:
+        frame = frame.f_back
+    return "(%s) " % frame.f_code.co_name
+
+
 def InitializeFolder():
-    global logfile, pretrained, settingsFile, historyFile, configPath, settings, history, model_cache
+    global logfile, pretrained, settingsFile, historyFile, historyStore, configPath, settings, history, model_cache
     if sys.platform == "win32":
         configPath = pathlib.Path(os.environ["APPDATA"])
     elif sys.platform == "darwin" or sys.platform == "linux":
@@ -192,7 +382,8 @@ def InitializeFolder():
     pretrained = configPath / "pretrained"
     pretrained.mkdir(parents=True, exist_ok=True)
     settingsFile = configPath / "settings.json"
-    historyFile = configPath / "history.db"
+    historyFile = configPath / "history.db"  # Used before 2.0a1, migrated to historyStore
+    historyStore = configPath / "history.sqlite"
     logfile = configPath / "log"
     logfile.mkdir(parents=True, exist_ok=True)
     if settingsFile.exists():
@@ -209,46 +400,64 @@ def InitializeFolder():
             settings = {}
     else:
         settings = {}
-    if historyFile.exists():
+    history = {}
+    try:
+        with contextlib.closing(_OpenHistoryStore()) as conn:
+            for key, value in conn.execute("SELECT key, value FROM history"):
+                try:
+                    history[key] = pickle.loads(value)
+                except Exception:
+                    print("History %s is corrupted, reset to default" % key, file=sys.stderr)
+                    print("Error message:\n%s" % traceback.format_exc(), file=sys.stderr)
+    except Exception:
+        print("History file is corrupted, reset to default", file=sys.stderr)
+        print("Error message:\n%s" % traceback.format_exc(), file=sys.stderr)
+        history = {}
         try:
-            with open(str(historyFile), mode="rb") as f:
-                history = pickle.loads(lzma.decompress(f.read()))
-            if type(history) is not dict:
-                raise TypeError
+            historyStore.replace(historyStore.with_name(historyStore.name + ".corrupted"))
         except Exception:
-            print("History file is corrupted, reset to default", file=sys.stderr)
-            print("Error message:\n%s" % traceback.format_exc(), file=sys.stderr)
-            history = {}
-    else:
-        history = {}
+            pass
+    if historyFile.exists() and not history:
+        _MigrateHistory()
 
     model_cache = pathlib.Path(GetSetting("model_cache", str(pretrained)))
     (model_cache / "checkpoints").mkdir(parents=True, exist_ok=True)
 
 
+def _SaveSettings():
+    """Write settings to a temporary file and replace the settings file with it, so the file is never left partially
+    written"""
+    with settingsLock:
+        settings_write_data = json.dumps(settings, separators=(",", ":"))
+    temp_file = settingsFile.with_name(settingsFile.name + ".tmp")
+    with open(str(temp_file), mode="wt", encoding="utf8") as f:
+        f.write(settings_write_data)
+    os.replace(str(temp_file), str(settingsFile))
+
+
+_settings_writer = BackgroundWriter("save settings", _SaveSettings, delay=1.0)
+
+
 def SetSetting(attr, value):
     global settings, settingsFile, settingsLock
     with settingsLock:
-        func_name = traceback.extract_stack()
-        if func_name[-2].name == "GetSetting":
-            func_name = func_name[-3].name
-        else:
-            func_name = func_name[-2].name
+        caller = _CallerName("GetSetting")
         if value is None:
-            logging.debug('(%s) Remove setting "%s"' % (func_name, attr))
-            del settings[attr]
+            logging.debug('%sRemove setting "%s"' % (caller, attr))
+            if settings.pop(attr, None) is None:
+                return
         else:
-            logging.debug('(%s) Set setting "%s" to %s' % (func_name, attr, str(value)))
+            logging.debug('%sSet setting "%s" to %s' % (caller, attr, str(value)))
             if attr in settings and settings[attr] == value:
                 logging.debug("Setting not changed, ignored")
                 return
             settings[attr] = value
-        try:
-            settings_write_data = json.dumps(settings, separators=(",", ":"))
-            with open(str(settingsFile), mode="wt", encoding="utf8") as f:
-                f.write(settings_write_data)
-        except Exception:
-            logging.warning("Failed to save settings:\n%s" % traceback.format_exc())
+        _settings_writer.schedule()
+
+
+def FlushSettings():
+    """Write pending settings changes immediately"""
+    _settings_writer.flush()
 
 
 def GetSetting(attr, default=None, autoset=True):
@@ -288,31 +497,88 @@ def _set_to_dict(dataDict, mapList, value):
         dataDict[mapList[-1]] = value
 
 
+def _OpenHistoryStore():
+    conn = sqlite3.connect(str(historyStore), timeout=10)
+    conn.execute("CREATE TABLE IF NOT EXISTS history (key TEXT PRIMARY KEY, value BLOB)")
+    return conn
+
+
+def _MigrateHistory():
+    """Import the lzma compressed pickle history file used before 2.0a1, then rename it so it is only imported once"""
+    global history
+    try:
+        with open(str(historyFile), mode="rb") as f:
+            old_history = pickle.loads(lzma.decompress(f.read()))
+        if type(old_history) is not dict:
+            raise TypeError
+        with contextlib.closing(_OpenHistoryStore()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO history (key, value) VALUES (?, ?)",
+                [(key, pickle.dumps(value)) for key, value in old_history.items()],
+            )
+        history = old_history
+        print("Migrated history from %s" % historyFile, file=sys.stderr)
+    except Exception:
+        print("Failed to migrate old history file, reset to default", file=sys.stderr)
+        print("Error message:\n%s" % traceback.format_exc(), file=sys.stderr)
+    try:
+        historyFile.replace(historyFile.with_name(historyFile.name + ".old"))
+    except Exception:
+        print("Failed to rename old history file:\n%s" % traceback.format_exc(), file=sys.stderr)
+
+
 def _SaveHistory():
-    global history, historyFile, historyLock
+    """Write top-level history keys changed since last save. Only changed keys are serialized and written."""
+    global _history_dirty, _history_cleared
     with historyLock:
-        try:
-            history_write_data = lzma.compress(pickle.dumps(history), preset=7)
-            with open(str(historyFile), mode="wb") as f:
-                f.write(history_write_data)
-        except Exception:
-            logging.warning("Failed to save history:\n%s" % traceback.format_exc())
+        cleared, _history_cleared = _history_cleared, False
+        dirty, _history_dirty = _history_dirty, set()
+        rows = [(key, pickle.dumps(history[key]) if key in history else None) for key in dirty]
+    try:
+        with contextlib.closing(_OpenHistoryStore()) as conn, conn:
+            if cleared:
+                conn.execute("DELETE FROM history")
+            conn.executemany(
+                "INSERT OR REPLACE INTO history (key, value) VALUES (?, ?)", [i for i in rows if i[1] is not None]
+            )
+            conn.executemany("DELETE FROM history WHERE key = ?", [(i[0],) for i in rows if i[1] is None])
+    except Exception:
+        with historyLock:
+            _history_cleared |= cleared
+            _history_dirty |= dirty
+        raise
+
+
+_history_writer = BackgroundWriter("save history", _SaveHistory, delay=0.5)
+
+
+def _HistoryChanged(key=None):
+    """Mark a top-level key (or the whole history if key is None) as changed and schedule a save. Should be called
+    with historyLock held."""
+    global _history_cleared
+    if key is None:
+        _history_cleared = True
+        _history_dirty.clear()
+    else:
+        _history_dirty.add(key)
+    _history_writer.schedule()
+
+
+def FlushHistory():
+    """Write pending history changes immediately"""
+    _history_writer.flush()
 
 
 def SetHistory(*attr, value):
     global history, historyFile, historyLock
     with historyLock:
-        func_name = traceback.extract_stack()
-        if func_name[-2].name in ["GetHistory", "AddHistory", "ResetHistory"]:
-            func_name = func_name[-3].name
-        else:
-            func_name = func_name[-2].name
-        logging.debug("(%s) Set history %s to %s" % (func_name, attr, str(value)))
+        caller = _CallerName("GetHistory", "AddHistory", "ResetHistory")
+        logging.debug("%sSet history %s to %s" % (caller, attr, str(value)))
         if _get_from_dict(history, attr) == value:
             logging.debug("History not changed, ignored")
             return
         _set_to_dict(history, attr, value)
-    _SaveHistory()
+        _HistoryChanged(attr[0])
 
 
 def GetHistory(*attr, default=None, autoset=True, use_ordered_set=False):
@@ -346,12 +612,12 @@ def ResetHistory(*attr):
         logging.info("Resetting history")
         with historyLock:
             history = {}
-        _SaveHistory()
+            _HistoryChanged()
     else:
         logging.info("Resetting history %s" % str(attr))
         with historyLock:
             _set_to_dict(history, attr, None)
-        _SaveHistory()
+            _HistoryChanged(attr[0])
 
 
 class FileStatus:
@@ -438,14 +704,11 @@ class URL_with_filename(object):
         if hasattr(self, "_hasname"):
             return self._name
         m = urlreg.match(self._url)
-        url_name = urllib.parse.unquote_plus(m["name"])
+        url_name = urllib.parse.unquote_plus(m["name"] or "")
         if m["scheme"].lower() in {"http", "https", "ftp"}:
             try:
                 logging.info("Getting file name from URL: %s" % self)
-                req = urllib.request.Request(self, method="GET")
-                u = urllib.request.urlopen(req)
-                u.close()
-                self._name = u.headers.get_filename()
+                self._name = self._header_filename()
                 if self._name:
                     logging.info("Found file name in header: %s" % self._name)
                     self._hasname = True
@@ -463,6 +726,21 @@ class URL_with_filename(object):
         self._hasname = False
         return None
 
+    def _header_filename(self):
+        """File name in Content-Disposition header, requested with HEAD, or with a GET of the first byte if HEAD isn't
+        allowed, so that the file isn't downloaded"""
+        if self["scheme"].lower() == "ftp":
+            with urllib.request.urlopen(self._url, timeout=30) as u:
+                return u.headers.get_filename()
+        try:
+            with httpclient.request(self._url, method="HEAD") as u:
+                return u.headers.get_filename()
+        except urllib.error.HTTPError as e:
+            logging.info("HEAD request of %s failed with %d, requesting the first byte" % (self, e.code))
+        with httpclient.request(self._url, headers={"Range": "bytes=0-0"}) as u:
+            u.read()
+            return u.headers.get_filename()
+
     @property
     def stem(self):
         if self.name:
@@ -558,7 +836,7 @@ def thread_wrapper(*args_thread, **kw_thread):
 def checkUpdate(callback):
     try:
         logging.info("Checking for updates...")
-        with urllib.request.urlopen(update_url) as f:
+        with httpclient.request(update_url) as f:
             data = json.loads(f.read())[:3]  # Get the latest 3 releases so we can also check for pre-releases
         data = sorted(data, key=lambda x: packaging.version.parse(x["tag_name"]), reverse=True)
         logging.info("Latest version: %s" % data[0]["tag_name"])
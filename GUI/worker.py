@@ -0,0 +1,348 @@
+# Demucs-GUI
+# Copyright (C) 2022-2025  Demucs-GUI developers
+# See https://github.com/CarlGao4/Demucs-Gui for more information
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Separate audio with Demucs models in worker processes instead of threads of the GUI process.
+
+A crash or running out of memory in a worker only fails the file being separated, and the worker is started again for
+the next file. Audio is passed to the worker and stems are passed back in one shared memory block created by the GUI
+process, so tensors are never pickled. There is one worker for each device, each with its own copy of the model, so
+workers of different devices can separate files at the same time."""
+
+import logging
+import multiprocessing
+import multiprocessing.shared_memory
+import os
+import sys
+import threading
+import traceback
+
+import shared
+
+stop_timeout = 10  # Seconds to wait for a worker to exit before killing it
+
+
+def logFile():
+    """Path of the log file of the GUI process, which workers append to, or None if logging to the console"""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            name = getattr(handler.stream, "name", None)
+            if isinstance(name, str) and os.path.isfile(name):
+                return name
+    return None
+
+
+def closeBlock(block):
+    """Close a shared memory block, views of it which are still referenced (like in a traceback) keep it mapped until
+    they are collected"""
+    try:
+        block.close()
+    except BufferError:
+        logging.debug("Shared memory %s is still referenced" % block.name)
+
+
+class SeparationWorker:
+    """A process separating audio with its own copy of a Demucs model on one device. The process is started when the
+    first file is separated, and started again after it exits or fails."""
+
+    def __init__(self, device):
+        self.device = device
+        self.process = None
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")  # CUDA can't be used in forked processes
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=serve, args=(child_conn, logFile()), name="separator-%s" % self.device, daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        logging.info("Started worker process %d for %s" % (self.process.pid, self.device))
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self):
+        """Ask the process to exit, and kill it if it doesn't exit in time"""
+        if self.process is None:
+            return
+        try:
+            self.conn.send(("stop",))
+        except (OSError, ValueError):
+            pass
+        self.process.join(stop_timeout)
+        if self.process.is_alive():
+            logging.warning("Worker process %d for %s doesn't exit, killing it" % (self.process.pid, self.device))
+            self.process.kill()
+            self.process.join()
+        logging.info("Worker process for %s exited with code %s" % (self.device, self.process.exitcode))
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def offload(self):
+        """Move the model of an idle process back to CPU and free cached device memory"""
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if self.alive():
+                self.conn.send(("offload",))
+        finally:
+            self.lock.release()
+
+    def separate(self, model, repo, wav, sources, started, progress, status, **params):
+        """Separate `wav` of shape (length, channels) with a model in the process.
+
+        `started` is called when the model is ready and separation starts, `progress` is called with `in_length`,
+        `out_length` and the progress dict of Demucs and may raise KeyboardInterrupt to cancel, `status` is called with
+        status texts of the process. `params` are passed to `DemucsSeparator.separateTensor`. Returns stems, the
+        precision actually used, peak device memory and peak resident memory of the process"""
+        import numpy as np
+        import torch
+
+        length, channels = wav.shape
+        with self.lock:
+            if not self.alive():
+                if self.process is not None:
+                    self.stop()
+                self.start()
+            block = multiprocessing.shared_memory.SharedMemory(
+                create=True, size=(len(sources) + 1) * channels * length * 4
+            )
+            try:
+                np.ndarray((length, channels), np.float32, buffer=block.buf)[:] = wav
+                self.conn.send(("separate", block.name, length, channels, list(sources), model, repo, params))
+                precision, peak_device_memory, peak_rss = self.receive(started, progress, status)
+                stems = np.ndarray(
+                    (len(sources), channels, length), np.float32, buffer=block.buf, offset=length * channels * 4
+                )
+                out = {stem: torch.from_numpy(stems[i].copy()) for i, stem in enumerate(sources)}
+                del stems
+            finally:
+                closeBlock(block)
+                block.unlink()
+        return out, precision, peak_device_memory, peak_rss
+
+    def exited(self):
+        """Clean up after the process exited while separating, returns the error to raise"""
+        self.process.join(stop_timeout)
+        exitcode = self.process.exitcode
+        self.stop()
+        return RuntimeError("Worker process for %s exited unexpectedly with code %s" % (self.device, exitcode))
+
+    def receive(self, started, progress, status):
+        """Handle messages of the process until the file is separated. If a callback raises, the process may still be
+        separating or waiting for a reply, so it is killed to keep its messages away from the next file"""
+        try:
+            return self.handleMessages(started, progress, status)
+        except KeyboardInterrupt:
+            raise
+        except BaseException:
+            if self.alive():
+                logging.warning("Killing worker process %d for %s after an error" % (self.process.pid, self.device))
+                self.process.kill()
+            self.stop()
+            raise
+
+    def handleMessages(self, started, progress, status):
+        cancelled = False
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                raise self.exited()
+            match message[0]:
+                case "status":
+                    status(message[1])
+                case "started":
+                    started()
+                case "progress":
+                    if not cancelled:
+                        try:
+                            progress(*message[1:])
+                        except KeyboardInterrupt:
+                            cancelled = True
+                    try:
+                        self.conn.send(not cancelled)
+                    except OSError:
+                        raise self.exited()
+                case "cancelled":
+                    raise KeyboardInterrupt
+                case "failed":
+                    # Errors like running out of device memory may leave the device unusable, so start a new process
+                    self.stop()
+                    raise RuntimeError("Separation failed in worker process:\n%s" % message[1])
+                case "done":
+                    return message[1:]
+
+
+class WorkerPool:
+    """One worker for each device"""
+
+    def __init__(self):
+        self.workers = {}
+        self.lock = threading.Lock()
+
+    def get(self, device):
+        with self.lock:
+            if device not in self.workers:
+                self.workers[device] = SeparationWorker(device)
+            return self.workers[device]
+
+    def offload(self):
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            worker.offload()
+
+    @shared.thread_wrapper(daemon=True)
+    def stop(self):
+        """Stop all processes when they are not separating, to free their memory"""
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            with worker.lock:
+                worker.stop()
+
+
+def setupLogging(log_file):
+    if log_file is not None:
+        log = open(log_file, mode="at", encoding="utf-8")
+        sys.stderr = log
+        sys.stdout = log
+    else:
+        log = sys.stderr
+    logging.basicConfig(
+        handlers=[logging.StreamHandler(log)],
+        format="%(asctime)s (%(filename)s) (Line %(lineno)d) [%(levelname)s] : [Worker %(process)d] %(message)s",
+        level=logging.DEBUG,
+    )
+
+
+def initialize():
+    """Import modules used by `separator` in a worker process, like `separator.starter` does in the GUI process"""
+    global separator, metrics, np, torch
+    import metrics
+    import numpy as np
+    import separator
+    import torch
+
+    try:
+        import intel_extension_for_pytorch  # type: ignore # noqa: F401
+    except ImportError:
+        pass
+    except Exception:
+        logging.error("Failed to load Intel Extension for PyTorch:\n%s" % traceback.format_exc())
+    separator.try_import("demucs.api")
+    separator.try_import("demucs.apply")
+    import audio
+
+    separator.torch = torch
+    separator.np = np
+    separator.audio = audio
+    separator.gain = audio.gain
+    # Remote models are downloaded to and loaded from the model cache, like in the GUI process
+    torch.hub.set_dir(shared.model_cache)
+
+
+def listRemoteModels():
+    """List models like the GUI process does, so remote models it has downloaded since this process started can be
+    found by `DemucsSeparator.loadModel`"""
+    separator.DemucsSeparator().listModels()
+
+
+def serve(conn, log_file):
+    """Main function of a worker process, separates files sent by `SeparationWorker` until asked to stop"""
+    setupLogging(log_file)
+    try:
+        shared.InitializeFolder()
+        initialize()
+    except Exception:
+        logging.error("Failed to start worker process:\n%s" % traceback.format_exc())
+        return
+    logging.info("Worker process started")
+    separator.setUpdateStatusFunc(lambda text: conn.send(("status", text)))
+    model = None
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break  # The GUI process exited
+        match message[0]:
+            case "stop":
+                break
+            case "offload":
+                if model is not None:
+                    model.offloadModel()
+                separator.empty_cache()
+            case "separate":
+                model = separateBlock(conn, model, *message[1:])
+    logging.info("Worker process exits")
+
+
+def separateBlock(conn, model, name, length, channels, sources, model_name, repo, params):
+    """Separate the audio in shared memory block `name` and write stems after it. Returns the model, which is kept for
+    the next file"""
+
+    def callback(progress_dict):
+        nonlocal peak_rss
+        peak_rss = max(peak_rss, metrics.processMemory())
+        conn.send(("progress", model.in_length, model.out_length, progress_dict))
+        if not conn.recv():
+            raise KeyboardInterrupt
+
+    device = params["device"]
+    peak_rss = 0
+    try:
+        if model is None or (model.model, model.repo) != (model_name, repo):
+            model = None
+            separator.empty_cache()
+            separator.updateStatus("Loading model %s in worker process" % model_name)
+            if repo is None:
+                listRemoteModels()
+            model = separator.DemucsSeparator()
+            model.loadModel(model_name, repo)
+            assert list(model.sources) == sources, "Sources of model %s don't match" % model_name
+        if device.startswith("cuda"):
+            separator.used_cuda = True
+        if device.startswith("xpu"):
+            separator.used_xpu = True
+        block = multiprocessing.shared_memory.SharedMemory(name)
+        try:
+            wav_torch = model.prepareInput(np.ndarray((length, channels), np.float32, buffer=block.buf), device)
+            model.moveModel(device)
+            metrics.resetDeviceMemoryPeak(device)
+            conn.send(("started",))
+            out, precision = model.separateTensor(wav_torch, callback=callback, **params)
+            stems = np.ndarray(
+                (len(sources), channels, length), np.float32, buffer=block.buf, offset=length * channels * 4
+            )
+            for i, stem in enumerate(sources):
+                stems[i] = out[stem].to("cpu", torch.float32).numpy()
+            del stems
+        finally:
+            closeBlock(block)
+        peak_rss = max(peak_rss, metrics.processMemory())
+        conn.send(("done", precision, metrics.deviceMemoryPeak(device), peak_rss))
+    except KeyboardInterrupt:
+        logging.info("Separation cancelled")
+        conn.send(("cancelled",))
+    except Exception:
+        logging.error("Separation failed:\n%s" % traceback.format_exc())
+        conn.send(("failed", traceback.format_exc()))
+    return model
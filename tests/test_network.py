@@ -0,0 +1,308 @@
+# Demucs-GUI
+# Copyright (C) 2022-2025  Demucs-GUI developers
+# See https://github.com/CarlGao4/Demucs-Gui for more information
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests of resumable model downloads, URL prefetching and the pooled HTTP client against a local HTTP server.
+
+Run from the repository root with `python -m unittest discover tests`."""
+
+import __main__
+import concurrent.futures
+import hashlib
+import http.server
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+
+GUI = pathlib.Path(__file__).resolve().parent.parent / "GUI"
+sys.path.insert(0, str(GUI))
+
+# shared locates the program folder from the main module
+main_file = getattr(__main__, "__file__", None)
+__main__.__file__ = str(GUI / "GuiMain.py")
+import httpclient  # noqa: E402
+import remote  # noqa: E402
+import separator  # noqa: E402
+import shared  # noqa: E402
+
+if main_file is None:
+    del __main__.__file__
+else:
+    __main__.__file__ = main_file
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Serves `server.files` with Range support, and records requests in `server.requests`. Files in
+    `server.no_length` are sent without Content-Length, closing the connection after them"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path, self.headers.get("Range")))
+            server.ports.add(self.client_address[1])
+        if server.delay:
+            time.sleep(server.delay)
+        if head and self.path in server.no_head:
+            self.reply(405, b"")
+            return
+        if self.path not in server.files:
+            self.reply(404, b"not found", head)
+            return
+        body = server.files[self.path]
+        if (byte_range := self.headers.get("Range")) and self.path not in server.no_range:
+            start, end = byte_range.removeprefix("bytes=").split("-")
+            start, end = int(start), int(end) if end else len(body) - 1
+            if start >= len(body):
+                self.reply(416, b"", head, {"Content-Range": "bytes */%d" % len(body)})
+                return
+            self.reply(206, body[start : end + 1], head, {"Content-Range": "bytes %d-%d/%d" % (start, end, len(body))})
+            return
+        self.reply(200, body, head)
+
+    def reply(self, status, body, head=False, headers=None):
+        self.send_response(status)
+        if self.path in self.server.no_length:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        else:
+            self.send_header("Content-Length", str(len(body)))
+        name = self.path.rsplit("/", 1)[-1]
+        self.send_header("Content-Disposition", 'attachment; filename="served_%s"' % name)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+
+class NetworkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.files = {}
+        self.server.no_head = set()
+        self.server.no_range = set()
+        self.server.no_length = set()
+        self.server.delay = 0
+        self.server.requests = []
+        self.server.ports = set()
+        self.server.lock = threading.Lock()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = "http://127.0.0.1:%d" % self.server.server_port
+        self.temp = tempfile.TemporaryDirectory()
+        self.directory = pathlib.Path(self.temp.name)
+        self.config_path = getattr(shared, "configPath", None)
+        shared.configPath = self.directory
+
+    def tearDown(self):
+        httpclient._client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shared.configPath = self.config_path
+        self.temp.cleanup()
+
+    def serve(self, path, size):
+        self.server.files[path] = data = bytes(i % 251 for i in range(size))
+        return data
+
+    def gets(self, path):
+        return [i for i in self.server.requests if i[0] == "GET" and i[1] == path]
+
+
+class TestClient(NetworkTestCase):
+    def test_sequential_requests_reuse_connection(self):
+        self.serve("/a", 1000)
+        for _ in range(20):
+            with httpclient.request(self.base + "/a") as u:
+                self.assertEqual(len(u.read()), 1000)
+        self.assertEqual(len(self.server.ports), 1)
+
+    def test_unread_head_returns_connection(self):
+        self.serve("/a", 1000)
+        for _ in range(10):
+            with httpclient.request(self.base + "/a", method="HEAD") as u:
+                self.assertEqual(u.headers["Content-Length"], "1000")
+        self.assertEqual(len(self.server.ports), 1)
+
+    def test_concurrent_requests_limited(self):
+        self.server.delay = 0.02
+        urls = [shared.URL_with_filename(self.base + "/n%d/a.mp3" % i) for i in range(100)]
+        for url in urls:
+            self.serve(str(url)[len(self.base) :], 10)
+        with concurrent.futures.ThreadPoolExecutor(16) as pool:
+            names = list(pool.map(lambda url: url.name, urls))
+        self.assertEqual(names[0], "served_a.mp3")
+        self.assertLessEqual(len(self.server.ports), httpclient.max_connections)
+
+    def test_name_without_head(self):
+        self.serve("/a.wav", 1000)
+        self.server.no_head.add("/a.wav")
+        self.assertEqual(shared.URL_with_filename(self.base + "/a.wav").name, "served_a.wav")
+        self.assertEqual(self.gets("/a.wav"), [("GET", "/a.wav", "bytes=0-0")])
+
+    def test_error_status(self):
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            httpclient.request(self.base + "/missing")
+        self.assertEqual(cm.exception.code, 404)
+        self.serve("/a", 10)
+        with httpclient.request(self.base + "/a") as u:
+            u.read()
+        self.assertEqual(len(self.server.ports), 1)
+
+
+class TestDownload(NetworkTestCase):
+    def test_resume(self):
+        data = self.serve("/model.th", 300000)
+        (self.directory / "model.th.tmp").write_bytes(data[:100000])
+        path = separator.download_file(self.base + "/model.th", self.directory)
+        self.assertEqual(path.read_bytes(), data)
+        self.assertEqual(self.gets("/model.th"), [("GET", "/model.th", "bytes=100000-")])
+        self.assertFalse((self.directory / "model.th.tmp").exists())
+
+    def test_resume_verifies_checksum(self):
+        data = self.serve("/model-x.th", 300000)
+        name = "model-%s.th" % hashlib.sha256(data).hexdigest()[:8]
+        self.server.files["/" + name] = self.server.files.pop("/model-x.th")
+        (self.directory / (name + ".tmp")).write_bytes(data[:100000])
+        self.assertEqual(separator.download_file(self.base + "/" + name, self.directory).read_bytes(), data)
+        (self.directory / (name + ".tmp")).write_bytes(b"\0" * 100000)
+        with self.assertRaises(RuntimeError):
+            separator.download_file(self.base + "/" + name, self.directory)
+        self.assertFalse((self.directory / (name + ".tmp")).exists())
+
+    def test_range_not_satisfiable(self):
+        data = self.serve("/model.th", 1000)
+        (self.directory / "model.th.tmp").write_bytes(b"\0" * 2000)
+        self.assertEqual(separator.download_file(self.base + "/model.th", self.directory).read_bytes(), data)
+        self.assertEqual(self.gets("/model.th"), [("GET", "/model.th", "bytes=2000-"), ("GET", "/model.th", None)])
+
+    def test_server_without_range(self):
+        data = self.serve("/model.th", 1000)
+        self.server.no_range.add("/model.th")
+        (self.directory / "model.th.tmp").write_bytes(b"\0" * 500)
+        self.assertEqual(separator.download_file(self.base + "/model.th", self.directory).read_bytes(), data)
+
+
+class TestPrefetcher(NetworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.downloaded = {}
+        self.ready = threading.Condition()
+
+    def callback(self, item, path):
+        with self.ready:
+            self.downloaded[item] = path
+            self.ready.notify_all()
+
+    def waitDownloaded(self, *items):
+        with self.ready:
+            self.assertTrue(self.ready.wait_for(lambda: all(i in self.downloaded for i in items), timeout=10))
+
+    def url(self, i):
+        return shared.URL_with_filename(self.base + "/f%d.wav" % i, name="f%d.wav" % i)
+
+    def test_reserve_and_evict(self):
+        for i in range(3):
+            self.serve("/f%d.wav" % i, 1000)
+        prefetcher = remote.Prefetcher(self.callback, workers=3, limit=2500)
+        for i in range(3):
+            prefetcher.submit(i, self.url(i))
+        time.sleep(0.5)
+        # Only two files fit in the cache while all of them are queued
+        self.assertEqual(len(self.downloaded), 2)
+        waiting = ({0, 1, 2} - set(self.downloaded)).pop()
+        first = min(self.downloaded)
+        prefetcher.release(first, self.url(first))
+        self.waitDownloaded(waiting)
+        self.assertEqual(self.downloaded[waiting].read_bytes(), self.server.files["/f%d.wav" % waiting])
+        # The released file is removed to make space, the queued ones are kept
+        self.assertFalse(remote.cachePath(self.url(first)).exists())
+        for i in {0, 1, 2} - {first}:
+            self.assertTrue(remote.cachePath(self.url(i)).exists())
+
+    def test_too_large_is_streamed(self):
+        self.serve("/f0.wav", 1000)
+        prefetcher = remote.Prefetcher(self.callback, workers=1, limit=500)
+        prefetcher.submit("a", self.url(0))
+        self.waitDownloaded("a")
+        self.assertIsNone(self.downloaded["a"])
+        self.assertEqual(self.gets("/f0.wav"), [])
+
+    def test_wait_streams_instead_of_waiting_for_space(self):
+        for i in range(2):
+            self.serve("/f%d.wav" % i, 1000)
+        prefetcher = remote.Prefetcher(self.callback, workers=2, limit=1500)
+        prefetcher.submit(0, self.url(0))
+        self.waitDownloaded(0)
+        prefetcher.submit(1, self.url(1))
+        time.sleep(0.3)  # Waiting for the first file to be released
+        self.assertEqual(prefetcher.waiting, {remote.cachePath(self.url(1)).name})
+        self.assertIsNone(prefetcher.wait(self.url(1)))
+        self.waitDownloaded(1)
+        self.assertIsNone(self.downloaded[1])
+        self.assertEqual(self.gets("/f1.wav"), [])
+
+    def test_wait_never_waits_for_space(self):
+        for i in range(2):
+            self.serve("/f%d.wav" % i, 1000)
+        prefetcher = remote.Prefetcher(self.callback, workers=0, limit=1500)
+        prefetcher.submit(0, self.url(0))
+        self.assertIsNotNone(prefetcher.wait(self.url(0)))
+        prefetcher.submit(1, self.url(1))
+        self.assertIsNone(prefetcher.wait(self.url(1)))
+        self.assertEqual(self.gets("/f1.wav"), [])
+
+    def test_unknown_length_is_limited(self):
+        self.serve("/f0.wav", 2000)
+        self.serve("/f1.wav", 20000)
+        self.server.no_length.update({"/f0.wav", "/f1.wav"})
+        prefetcher = remote.Prefetcher(self.callback, workers=1, limit=5000)
+        prefetcher.submit(0, self.url(0))
+        prefetcher.submit(1, self.url(1))
+        self.waitDownloaded(0, 1)
+        self.assertEqual(self.downloaded[0].read_bytes(), self.server.files["/f0.wav"])
+        self.assertEqual(prefetcher.pinned[remote.cachePath(self.url(0)).name], 2000)
+        self.assertIsNone(self.downloaded[1])
+        self.assertEqual(sorted(i.name for i in remote.cacheDir().iterdir()), [remote.cachePath(self.url(0)).name])
+
+    def test_wait_downloads_at_once(self):
+        for i in range(3):
+            self.serve("/f%d.wav" % i, 1000)
+        self.server.delay = 0.3
+        prefetcher = remote.Prefetcher(self.callback, workers=1, limit=10000)
+        for i in range(3):
+            prefetcher.submit(i, self.url(i))
+        # The last file isn't waiting behind the others
+        path = prefetcher.wait(self.url(2))
+        self.assertNotIn(1, self.downloaded)
+        self.assertEqual(path.read_bytes(), self.server.files["/f2.wav"])
+        self.assertEqual(remote.cachedPath(self.url(2)), path)
+        self.waitDownloaded(0, 1, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
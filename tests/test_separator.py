@@ -0,0 +1,148 @@
+# Demucs-GUI
+# Copyright (C) 2022-2025  Demucs-GUI developers
+# See https://github.com/CarlGao4/Demucs-Gui for more information
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests of applying models segment by segment. Tiny randomly initialized models are used, so no model is downloaded.
+
+Run from the repository root with `python -m unittest discover tests`."""
+
+import __main__
+import importlib.util
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import unittest
+
+GUI = pathlib.Path(__file__).resolve().parent.parent / "GUI"
+sys.path.insert(0, str(GUI))
+
+# shared locates the program folder from the main module
+main_file = getattr(__main__, "__file__", None)
+__main__.__file__ = str(GUI / "GuiMain.py")
+import shared  # noqa: E402
+
+if main_file is None:
+    del __main__.__file__
+else:
+    __main__.__file__ = main_file
+
+has_demucs = importlib.util.find_spec("torch") and importlib.util.find_spec("demucs")
+has_apollo = has_demucs and importlib.util.find_spec("look2hear")
+
+
+@unittest.skipUnless(has_demucs, "torch and demucs are required")
+class TestSegmentPrefetchPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import worker
+
+        cls.temp = tempfile.TemporaryDirectory()
+        cls.environ = {i: os.environ.get(i) for i in ("HOME", "APPDATA")}
+        os.environ["HOME"] = os.environ["APPDATA"] = cls.temp.name
+        shared.InitializeFolder()
+        worker.initialize()
+
+    @classmethod
+    def tearDownClass(cls):
+        for key, value in cls.environ.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        cls.temp.cleanup()
+
+    def check(self, model, **kwargs):
+        import separator
+        import torch
+        from demucs.apply import apply_model
+
+        mix = torch.randn(1, 2, 8000 * 5 + 123, generator=torch.Generator().manual_seed(0))
+        random.seed(0)
+        expected = apply_model(model, mix, device="cpu", **kwargs)
+        random.seed(0)
+        out = apply_model(model, mix, device="cpu", pool=separator.SegmentPrefetchPool("cpu"), **kwargs)
+        self.assertTrue(torch.equal(out, expected))
+
+    def test_demucs(self):
+        import torch
+        from demucs.demucs import Demucs
+
+        torch.manual_seed(0)
+        model = Demucs(sources=["drums", "bass", "other", "vocals"], channels=4, depth=2, samplerate=8000, segment=2)
+        self.check(model, segment=1.5, overlap=0.25, shifts=0)
+        self.check(model, segment=1.5, overlap=0.25, shifts=2)
+
+    def test_htdemucs(self):
+        import torch
+        from demucs.htdemucs import HTDemucs
+
+        torch.manual_seed(0)
+        model = HTDemucs(
+            sources=["drums", "bass"], channels=8, depth=2, samplerate=8000, segment=2, nfft=256, t_layers=1
+        )
+        self.check(model, segment=2, overlap=0.25, shifts=0)
+        self.check(model, segment=1, overlap=0.5, shifts=1)
+
+
+@unittest.skipUnless(has_apollo, "torch, demucs and look2hear are required")
+class TestApolloSegments(unittest.TestCase):
+    class Model:
+        """Subtracts the mean of each segment, so the output depends on whether segments are padded. Records the length
+        of each segment"""
+
+        samplerate = _sample_rate = 8000
+        sources = ["enhanced"]
+
+        def __init__(self):
+            self.lengths = []
+
+        def to(self, device):
+            return self
+
+        def eval(self):
+            return self
+
+        def __call__(self, mix):
+            self.lengths.append(mix.shape[-1])
+            return (mix - mix.mean(-1, keepdim=True))[:, None]
+
+    def setUp(self):
+        import torch
+
+        self.mix = torch.randn(1, 2, 8000 * 5 + 123, generator=torch.Generator().manual_seed(0))
+
+    def test_last_segment_not_padded(self):
+        import ApolloCall
+        from demucs.apply import apply_model
+
+        model = self.Model()
+        out = ApolloCall.apply_model(model, self.mix, shifts=0, segment=2, overlap=0.25, device="cpu")
+        self.assertEqual(model.lengths[-1], self.mix.shape[-1] % 12000)
+        # ApolloCall.apply_model is derived from the one of demucs, which doesn't pad the last segment
+        self.assertTrue(abs(out - apply_model(model, self.mix, shifts=0, segment=2, overlap=0.25)).max() < 1e-6)
+
+    def test_static_shapes(self):
+        import ApolloCall
+
+        model = self.Model()
+        ApolloCall.apply_model(model, self.mix, shifts=0, segment=2, overlap=0.25, device="cpu", static_shapes=True)
+        self.assertEqual(set(model.lengths), {16000})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+# Demucs-GUI
+# Copyright (C) 2022-2025  Demucs-GUI developers
+# See https://github.com/CarlGao4/Demucs-Gui for more information
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Tests of separating with remote Demucs models in worker processes. A tiny model is stored in the model cache under
+the file name of a remote model, so it is loaded without downloading.
+
+Run from the repository root with `python -m unittest discover tests`."""
+
+import __main__
+import importlib.util
+import os
+import pathlib
+import sys
+import tempfile
+import unittest
+
+GUI = pathlib.Path(__file__).resolve().parent.parent / "GUI"
+sys.path.insert(0, str(GUI))
+
+# shared locates the program folder from the main module
+main_file = getattr(__main__, "__file__", None)
+__main__.__file__ = str(GUI / "GuiMain.py")
+import shared  # noqa: E402
+import worker  # noqa: E402
+
+if main_file is None:
+    del __main__.__file__
+else:
+    __main__.__file__ = main_file
+
+remote_model = "0d19c1c6"
+remote_file = "0d19c1c6-0f06f20e.th"  # Listed in files.txt of demucs remote models
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("torch") and importlib.util.find_spec("demucs"), "torch and demucs are required"
+)
+class TestRemoteModel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Worker processes inherit the environment, so they use the same temporary config folder
+        cls.temp = tempfile.TemporaryDirectory()
+        cls.environ = {i: os.environ.get(i) for i in ("HOME", "APPDATA")}
+        os.environ["HOME"] = os.environ["APPDATA"] = cls.temp.name
+        shared.InitializeFolder()
+        worker.initialize()
+        import torch
+        from demucs.demucs import Demucs
+
+        torch.manual_seed(0)
+        model = Demucs(sources=["drums", "bass", "other", "vocals"], channels=4, depth=2, samplerate=8000, segment=2)
+        args, kwargs = model._init_args_kwargs
+        (shared.model_cache / "checkpoints").mkdir(parents=True, exist_ok=True)
+        torch.save(
+            {"klass": Demucs, "args": args, "kwargs": kwargs, "state": model.state_dict()},
+            shared.model_cache / "checkpoints" / remote_file,
+        )
+        cls.pool = worker.WorkerPool()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.stop()
+        for key, value in cls.environ.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        cls.temp.cleanup()
+
+    def test_separate_in_worker(self):
+        import numpy as np
+        import separator
+
+        separator.setUpdateStatusFunc(lambda text: None)
+        model = separator.DemucsSeparator()
+        model.listModels()
+        model.loadModel(remote_model)
+        wav = (np.random.RandomState(0).randn(8000 * 3, 2) * 0.1).astype(np.float32)
+        params = dict(device="cpu", segment=2.0, overlap=0.25, shifts=0, precision="fp32", compiled=False)
+        expected = model.separateTensor(model.prepareInput(wav, "cpu"), backend="torch", callback=None, **params)[0]
+        statuses = []
+        out, precision, _, peak_rss = self.pool.get("cpu").separate(
+            remote_model,
+            None,
+            wav,
+            model.sources,
+            lambda: None,
+            lambda *args: None,
+            statuses.append,
+            backend="torch",
+            **params,
+        )
+        self.assertEqual(precision, "fp32")
+        self.assertGreater(peak_rss, 0)  # Of the worker process
+        self.assertIn("Loading model %s in worker process" % remote_model, statuses)
+        for stem in model.sources:
+            self.assertLess((out[stem] - expected[stem]).abs().max().item(), 1e-4)
+
+
+if __name__ == "__main__":
+    unittest.main()